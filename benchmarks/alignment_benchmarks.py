@@ -0,0 +1,78 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks of the word alignment of ``text`` and ``pred_text``, used by the ASR comparison processors.
+
+Both implementations of :func:`sdp.utils.get_diff.get_diff` are run on the
+same entries without the cache of the alignments, so that every entry is
+aligned from scratch:
+
+- ``diff_match_patch``: each word is encoded as a line for the
+  ``diff_match_patch`` library (see
+  :func:`sdp.utils.get_diff.get_diff_with_diff_match_patch`).
+- ``word_alignment``: words are interned to ids and diffed directly (see
+  :func:`sdp.utils.word_alignment.get_word_diff`).
+"""
+
+import time
+from typing import Callable, Dict, List, Tuple
+
+from sdp.utils.edit_spaces import remove_extra_spaces
+from sdp.utils.get_diff import get_diff_with_diff_match_patch
+from sdp.utils.manifest_io import iter_manifest
+from sdp.utils.word_alignment import get_word_diff
+
+ALIGNERS = {
+    "diff_match_patch": get_diff_with_diff_match_patch,
+    "word_alignment": get_word_diff,
+}
+
+
+def time_aligner(aligner: Callable, pairs: List[Tuple[str, str]]) -> float:
+    """Returns the time of aligning all pairs of texts in seconds."""
+    start_time = time.perf_counter()
+    for orig_words, pred_words in pairs:
+        aligner(orig_words, pred_words)
+    return time.perf_counter() - start_time
+
+
+def benchmark_alignment(
+    input_manifest_file: str, text_key: str = "text", pred_text_key: str = "pred_text", repeats: int = 1
+) -> Dict[str, Dict]:
+    """Measures the throughput of the word alignment implementations.
+
+    Args:
+        input_manifest_file (str): manifest with the synthetic entries (see
+            :mod:`benchmarks.synthetic_manifest`).
+        text_key (str), pred_text_key (str): keys of the aligned texts.
+        repeats (int): number of runs of each implementation. Only the
+            fastest run is reported.
+
+    Returns:
+        dict: ``seconds``, ``entries_in`` and ``entries_per_second`` for each
+        key of :data:`ALIGNERS`.
+    """
+    pairs = [
+        (remove_extra_spaces(entry[text_key]), remove_extra_spaces(entry[pred_text_key]))
+        for entry in iter_manifest(input_manifest_file, fields=[text_key, pred_text_key])
+    ]
+    results = {}
+    for name, aligner in ALIGNERS.items():
+        seconds = min(time_aligner(aligner, pairs) for _ in range(repeats))
+        results[name] = {
+            "seconds": seconds,
+            "entries_in": len(pairs),
+            "entries_per_second": len(pairs) / seconds,
+        }
+    return results
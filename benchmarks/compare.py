@@ -0,0 +1,97 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares two results of :mod:`benchmarks.run_benchmarks`, e.g. from two different commits.
+
+Example::
+
+    python -m benchmarks.compare baseline.json results.json --threshold 0.1
+
+Prints the change in throughput of every benchmark that is present in both
+results and exits with code 1 if any of them became slower by more than
+``threshold`` (as a fraction of the baseline throughput). Both results
+should be collected on the same machine with the same parameters.
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, List, Tuple
+
+
+def iter_throughputs(results: Dict) -> Iterator[Tuple[str, float]]:
+    """Yields ``(benchmark name, entries per second)`` of all successful benchmarks."""
+    for processor, processor_results in results.get("processors", {}).items():
+        for mode, mode_results in processor_results.items():
+            if isinstance(mode_results, dict):
+                yield f"{processor} ({mode})", mode_results["entries_per_second"]
+    for config, config_results in results.get("configs", {}).items():
+        if "entries_per_second" in config_results:
+            yield config, config_results["entries_per_second"]
+    for aligner, aligner_results in results.get("alignment", {}).items():
+        yield f"alignment ({aligner})", aligner_results["entries_per_second"]
+
+
+def compare_results(baseline: Dict, results: Dict, threshold: float = 0.1) -> List[Dict]:
+    """Returns the change in throughput of each benchmark present in both results.
+
+    Each item has the benchmark ``name``, ``baseline`` and ``current``
+    entries per second, relative ``change`` of the throughput and
+    ``regression`` flag which is True if the throughput dropped by more
+    than ``threshold``.
+
+    Examples::
+
+        >>> baseline = {"processors": {"SubRegex": {"serial": {"entries_per_second": 100.0}}}}
+        >>> results = {"processors": {"SubRegex": {"serial": {"entries_per_second": 80.0}}}}
+        >>> compare_results(baseline, results)
+        [{'name': 'SubRegex (serial)', 'baseline': 100.0, 'current': 80.0, 'change': -0.2, 'regression': True}]
+    """
+    baseline_throughputs = dict(iter_throughputs(baseline))
+    comparison = []
+    for name, current in iter_throughputs(results):
+        if name not in baseline_throughputs:
+            continue
+        change = current / baseline_throughputs[name] - 1
+        comparison.append(
+            {
+                "name": name,
+                "baseline": baseline_throughputs[name],
+                "current": current,
+                "change": round(change, 4),
+                "regression": change < -threshold,
+            }
+        )
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the results of two benchmark runs.")
+    parser.add_argument("baseline_file", help="Path to the baseline results")
+    parser.add_argument("results_file", help="Path to the new results")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Maximal allowed relative drop of the throughput")
+    args = parser.parse_args()
+    with open(args.baseline_file, "rt", encoding="utf8") as fin:
+        baseline = json.load(fin)
+    with open(args.results_file, "rt", encoding="utf8") as fin:
+        results = json.load(fin)
+
+    comparison = compare_results(baseline, results, args.threshold)
+    name_width = max((len(item["name"]) for item in comparison), default=0)
+    for item in comparison:
+        print(
+            f"{item['name']:<{name_width}}  {item['baseline']:12.1f}  {item['current']:12.1f}  "
+            f"{item['change']:+8.1%}{'  REGRESSION' if item['regression'] else ''}"
+        )
+    sys.exit(1 if any(item["regression"] for item in comparison) else 0)
@@ -0,0 +1,191 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""End-to-end replay of the text-only parts of the checked-in configs on a synthetic manifest.
+
+All processors of the config that have parameters in
+:data:`benchmarks.processor_benchmarks.PROCESSOR_KWARGS` are run in their
+original order with :func:`sdp.run_processors.run_processors` (so with
+processor fusion and a shared worker pool), reading the synthetic manifest
+instead of the output of the skipped processors (see :func:`get_replay_config`).
+"""
+
+import glob
+import itertools
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from omegaconf import DictConfig, OmegaConf, open_dict
+
+from benchmarks.processor_benchmarks import PROCESSOR_KWARGS, SKIPPED_PROCESSORS
+from sdp.run_processors import run_processors
+from sdp.utils.manifest_io import count_manifest_entries
+
+DATASET_CONFIGS_ROOT = Path(__file__).parents[1] / "dataset_configs"
+# value of the mandatory config parameters that are not specified
+SYNTHETIC_VALUE = "synthetic"
+
+
+def get_config_names() -> List[str]:
+    """Returns paths of all checked-in configs relative to ``dataset_configs``."""
+    return sorted(
+        os.path.relpath(config_path, DATASET_CONFIGS_ROOT)
+        for config_path in glob.glob(f"{DATASET_CONFIGS_ROOT}/**/*.yaml", recursive=True)
+    )
+
+
+def get_replay_config(
+    config_name: str, input_manifest_file: str, work_dir: str, max_workers: int = -1
+) -> Tuple[Optional[DictConfig], List[str]]:
+    """Returns the config with only the text processors and the names of the skipped processors.
+
+    Skipped processors are replaced with the identity, i.e. the processors
+    that read their outputs read their inputs instead, and the first
+    processors read ``input_manifest_file``. All explicitly specified
+    manifests are moved to ``work_dir``, so that the config keeps the same
+    data flow (including in-place stages and multiple outputs of the same
+    manifest), and the output of the last processor is always saved.
+
+    Processors that are disabled with ``should_run`` for the train split are
+    removed as well. Mandatory top-level values that are not specified in the
+    config (e.g. ``language_id``) are set to ``SYNTHETIC_VALUE``. Returned
+    config is None if none of the processors can be replayed.
+    """
+    cfg = OmegaConf.load(DATASET_CONFIGS_ROOT / config_name)
+    with open_dict(cfg):
+        for key in cfg:
+            if OmegaConf.is_missing(cfg, key):
+                cfg[key] = SYNTHETIC_VALUE
+        cfg.data_split = "train"
+        cfg.workspace_dir = work_dir
+    processors_cfgs = []
+    skipped = []
+    # replay paths of the manifests by their (not resolved) paths in the config
+    replay_paths = {}
+    # manifest that is read by the next processor if its input is not specified
+    current_manifest = input_manifest_file
+
+    manifest_ids = itertools.count()
+
+    def get_new_path():
+        return os.path.join(work_dir, f"manifest{next(manifest_ids)}.json")
+
+    def get_last_output():
+        last_cfg = processors_cfgs[-1]
+        if "output_manifest_file" not in last_cfg:
+            last_cfg["output_manifest_file"] = get_new_path()
+        return last_cfg["output_manifest_file"]
+
+    for processor_cfg in cfg.processors:
+        if not processor_cfg.get("should_run", True):
+            continue
+        name = processor_cfg["_target_"].split(".")[-1]
+        # not resolving the interpolations, since the paths might refer to the values that are not specified
+        processor_cfg = OmegaConf.to_container(processor_cfg, resolve=False)
+        processor_cfg.pop("test_cases", None)
+        processor_cfg.pop("should_run", None)
+        input_file = processor_cfg.pop("input_manifest_file", None)
+        output_file = processor_cfg.pop("output_manifest_file", None)
+        # None if it's the output of the last replayed processor
+        input_path = current_manifest if input_file is None else replay_paths.get(input_file, input_manifest_file)
+
+        if name not in PROCESSOR_KWARGS:
+            skipped.append(name)
+            if output_file is not None:
+                replay_paths[output_file] = input_path if input_path is not None else get_last_output()
+            current_manifest = input_path
+            continue
+
+        if input_path is not None:
+            processor_cfg["input_manifest_file"] = input_path
+        if output_file is not None:
+            output_path = replay_paths.get(output_file)
+            # the input manifest is never overwritten
+            if output_path is None or output_path == input_manifest_file:
+                output_path = get_new_path()
+            processor_cfg["output_manifest_file"] = output_path
+            replay_paths[output_file] = output_path
+        processors_cfgs.append(processor_cfg)
+        current_manifest = None
+    if not processors_cfgs:
+        return None, skipped
+
+    if "output_manifest_file" not in processors_cfgs[-1]:
+        processors_cfgs[-1]["output_manifest_file"] = get_new_path()
+    with open_dict(cfg):
+        cfg.processors = processors_cfgs
+        cfg.processors_to_run = "all"
+        cfg.max_workers = max_workers
+        cfg.telemetry_file = os.path.join(work_dir, "telemetry.json")
+    return cfg, skipped
+
+
+def benchmark_configs(
+    input_manifest_file: str,
+    work_dir: str,
+    config_names: Optional[List[str]] = None,
+    max_workers: int = -1,
+) -> Dict[str, Dict]:
+    """Replays the text processors of the configs on the synthetic manifest.
+
+    Args:
+        input_manifest_file (str): manifest with the synthetic entries (see
+            :mod:`benchmarks.synthetic_manifest`).
+        work_dir (str): folder for the temporary files.
+        config_names (list[str]): paths of the configs relative to
+            ``dataset_configs``. Defaults to all checked-in configs.
+        max_workers (int): number of worker processes. -1 means the number of CPUs.
+
+    Returns:
+        dict: results for each config with the names of the ``processors``
+        that were run and ``skipped_processors``, total ``seconds``,
+        ``entries_in``, ``entries_out``, ``entries_per_second`` and the
+        ``seconds`` of each (possibly fused) processor in
+        ``processors_seconds``. If nothing can be replayed or the replay
+        fails, there is a ``skipped`` or ``error`` key instead.
+    """
+    if config_names is None:
+        config_names = get_config_names()
+    entries_in = count_manifest_entries(input_manifest_file)
+    results = {}
+    for config_name in config_names:
+        config_dir = os.path.join(work_dir, config_name.replace(os.sep, "_"))
+        os.makedirs(config_dir, exist_ok=True)
+        cfg, skipped = get_replay_config(config_name, input_manifest_file, config_dir, max_workers)
+        if cfg is None:
+            results[config_name] = {"skipped": "no text processors", "skipped_processors": skipped}
+            continue
+        processors = [processor_cfg["_target_"].split(".")[-1] for processor_cfg in cfg.processors]
+        start_time = time.perf_counter()
+        try:
+            run_processors(cfg)
+        except Exception as error:
+            results[config_name] = {"error": repr(error), "processors": processors, "skipped_processors": skipped}
+            continue
+        seconds = time.perf_counter() - start_time
+        with open(cfg.telemetry_file, "rt", encoding="utf8") as fin:
+            telemetry = json.load(fin)
+        results[config_name] = {
+            "processors": processors,
+            "skipped_processors": skipped,
+            "seconds": seconds,
+            "entries_in": entries_in,
+            "entries_out": count_manifest_entries(cfg.processors[-1]["output_manifest_file"]),
+            "entries_per_second": entries_in / seconds,
+            "processors_seconds": [[report["processor"], report["wall_time"]] for report in telemetry["processors"]],
+        }
+    return results
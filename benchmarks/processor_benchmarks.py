@@ -0,0 +1,195 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Throughput of every processor registered in :mod:`sdp.processors` on a synthetic manifest.
+
+Each processor is run with the parameters from :data:`PROCESSOR_KWARGS` in
+the modes from :data:`MODES`: ``serial`` processes all entries in the main
+process and ``parallel`` uses a pool of worker processes that is shared by
+all processors (same as in :func:`sdp.run_processors.run_processors`).
+Processors that need raw datasets, network access or NeMo models are listed
+in :data:`SKIPPED_PROCESSORS` together with the reason.
+"""
+
+import inspect
+import os
+import time
+from typing import Dict, List, Optional
+
+import sdp.processors
+from sdp.processors.base_processor import BaseParallelProcessor, BaseProcessor
+from sdp.utils.manifest_io import count_manifest_entries
+from sdp.utils.parallel import WorkerPool
+
+SKIPPED_PROCESSORS = {
+    "CreateInitialManifestCORAAL": "requires the raw dataset",
+    "CreateInitialManifestMCV": "requires the raw dataset",
+    "CreateInitialManifestMLS": "requires the raw dataset",
+    "CreateInitialManifestSLR83": "requires the raw dataset",
+    "CreateInitialManifestVoxpopuli": "requires the raw dataset",
+    "CustomDataSplitSLR83": "checks the statistics of the real dataset",
+    "RestorePCForMLS": "downloads the LibriVox texts",
+    "ASRInference": "requires NeMo and a pretrained model",
+    "PCInference": "requires NeMo and a pretrained model",
+}
+
+# parameters of each processor, similar to the checked-in configs
+PROCESSOR_KWARGS = {
+    "TrainDevTestSplitCORAAL": {"data_split": "train"},
+    "NormalizeFromNonPCTextVoxpopuli": {},
+    "ChangePCFields": {},
+    "AddConstantFields": {"fields": {"text_pc_origin": "original"}},
+    "ChangeToRelativePath": {"base_dir": "/data"},
+    "DuplicateFields": {"duplicate_fields": {"text": "text_no_pc"}},
+    "RenameFields": {"rename_fields": {"text": "original_dataset_text"}},
+    "SplitOnFixedDuration": {"segment_duration": 5.0},
+    "WriteManifest": {"fields_to_save": ["audio_filepath", "text", "duration"]},
+    "InsIfASRInsertion": {"insert_words": [" the ", " a "]},
+    "SubIfASRSubstitution": {"sub_words": {"uno ": "dos "}},
+    "SubMakeLowercase": {"text_key": "text_pc"},
+    "SubRegex": {
+        "regex_params_list": [
+            {"pattern": "\\bthe\\b", "repl": "a"},
+            {"pattern": "[\\?\\.,!]", "repl": ""},
+            {"pattern": "([a-z])\\1\\1+", "repl": "\\1\\1"},
+            {"pattern": "\\s+", "repl": " "},
+        ]
+    },
+    "DropASRError": {"consecutive_words_threshold": 5},
+    "DropASRErrorBeginningEnd": {"beginning_error_char_threshold": 10, "end_error_char_threshold": 10},
+    "DropHighCER": {"cer_threshold": 20},
+    "DropHighLowCharrate": {"high_charrate_threshold": 20, "low_charrate_threshold": 5},
+    "DropHighLowDuration": {"high_duration_threshold": 16, "low_duration_threshold": 2},
+    "DropHighLowWordrate": {"high_wordrate_threshold": 3, "low_wordrate_threshold": 1},
+    "DropHighWER": {"wer_threshold": 30},
+    "DropIfNoneOfRegexMatch": {"regex_patterns": ["^the ", " the$", "gracias"]},
+    "DropIfRegexMatch": {"regex_patterns": ["\\d", "^a ", "\\buno dos\\b"]},
+    "DropIfSubstringInInsertion": {"substrings_in_insertion": ["the ", "uno "]},
+    "DropLowWordMatchRate": {"wmr_threshold": 80},
+    "DropNonAlphabet": {"alphabet": " abcdefghijklmnopqrstuvwxyz"},
+    "DropOnAttribute": {"key": "is_interviewee", "drop_if_false": True},
+    "MakeLettersUppercaseAfterPeriod": {"text_key": "text_pc_pred"},
+}
+
+# parameters of the parallel processors in each mode. Parallel mode also
+# gets ``max_workers`` and the shared worker pool in :func:`benchmark_processors`
+MODES = {
+    "serial": {"max_workers": 1, "execution_mode": "inline"},
+    "parallel": {"execution_mode": "pool"},
+}
+
+
+def get_registered_processors() -> Dict[str, type]:
+    """Returns all processor classes imported in :mod:`sdp.processors` by their names."""
+    return {
+        name: obj
+        for name, obj in vars(sdp.processors).items()
+        if inspect.isclass(obj) and issubclass(obj, BaseProcessor)
+    }
+
+
+def run_processor(
+    processor_class: type,
+    kwargs: Dict,
+    input_manifest_file: str,
+    output_manifest_file: str,
+    worker_pool: Optional[WorkerPool] = None,
+) -> float:
+    """Runs a single processor and returns the time of its ``process`` call in seconds."""
+    processor = processor_class(
+        input_manifest_file=input_manifest_file, output_manifest_file=output_manifest_file, **kwargs
+    )
+    if worker_pool is not None:
+        processor.worker_pool = worker_pool
+    start_time = time.perf_counter()
+    processor.process()
+    return time.perf_counter() - start_time
+
+
+def benchmark_processors(
+    input_manifest_file: str,
+    work_dir: str,
+    names: Optional[List[str]] = None,
+    modes: List[str] = ("serial", "parallel"),
+    max_workers: int = -1,
+    repeats: int = 1,
+) -> Dict[str, Dict]:
+    """Measures the throughput of the registered processors.
+
+    Args:
+        input_manifest_file (str): manifest with the synthetic entries (see
+            :mod:`benchmarks.synthetic_manifest`).
+        work_dir (str): folder for the output manifests.
+        names (list[str]): names of the processors to run. Defaults to all
+            registered processors.
+        modes (list[str]): keys of :data:`MODES` to run each processor in.
+            Processors that are not parallel only run in the serial mode.
+        max_workers (int): number of workers in the parallel mode. -1 means
+            the number of CPUs.
+        repeats (int): number of runs of each processor in each mode. Only
+            the fastest run is reported.
+
+    Returns:
+        dict: results for each processor name. Skipped processors have a
+        ``skipped`` key with the reason, the rest have a dict for each mode
+        with the ``seconds``, ``entries_in``, ``entries_out``,
+        ``entries_per_second`` and ``mb_per_second`` of the input manifest.
+    """
+    processors = get_registered_processors()
+    if names is None:
+        names = list(processors)
+    unknown_names = [name for name in names if name not in processors]
+    if unknown_names:
+        raise ValueError(f"Unknown processors: {unknown_names}")
+    if max_workers == -1:
+        max_workers = os.cpu_count()
+    entries_in = count_manifest_entries(input_manifest_file)
+    input_size = os.path.getsize(input_manifest_file)
+
+    results = {}
+    with WorkerPool(max_workers=max_workers) as worker_pool:
+        for name in names:
+            if name not in PROCESSOR_KWARGS:
+                results[name] = {"skipped": SKIPPED_PROCESSORS.get(name, "no benchmark parameters")}
+                continue
+            processor_class = processors[name]
+            results[name] = {}
+            for mode in modes:
+                is_parallel = issubclass(processor_class, BaseParallelProcessor)
+                if mode != "serial" and not is_parallel:
+                    continue
+                kwargs = dict(PROCESSOR_KWARGS[name])
+                if is_parallel:
+                    kwargs.update(MODES[mode])
+                    kwargs.setdefault("max_workers", max_workers)
+                output_manifest_file = os.path.join(work_dir, f"{name}_{mode}.json")
+                seconds = min(
+                    run_processor(
+                        processor_class,
+                        kwargs,
+                        input_manifest_file,
+                        output_manifest_file,
+                        worker_pool if mode == "parallel" else None,
+                    )
+                    for _ in range(repeats)
+                )
+                results[name][mode] = {
+                    "seconds": seconds,
+                    "entries_in": entries_in,
+                    "entries_out": count_manifest_entries(output_manifest_file),
+                    "entries_per_second": entries_in / seconds,
+                    "mb_per_second": input_size / seconds / 2**20,
+                }
+                os.remove(output_manifest_file)
+    return results
@@ -0,0 +1,164 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs all benchmarks on a synthetic manifest and saves the results in a json file.
+
+Example::
+
+    python -m benchmarks.run_benchmarks --output_file results.json --num_entries 20000
+
+The results contain the ``metadata`` of the run (commit, python version,
+number of CPUs, json codec, etc.), the throughput of each registered
+processor in ``processors`` (see :mod:`benchmarks.processor_benchmarks`),
+the replays of the checked-in configs in ``configs`` (see
+:mod:`benchmarks.config_benchmarks`) and the throughput of the word
+alignment implementations in ``alignment`` (see
+:mod:`benchmarks.alignment_benchmarks`). Results of two runs can be compared
+with :mod:`benchmarks.compare`.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.alignment_benchmarks import benchmark_alignment
+from benchmarks.config_benchmarks import benchmark_configs
+from benchmarks.processor_benchmarks import MODES, benchmark_processors
+from benchmarks.synthetic_manifest import write_synthetic_manifest
+from sdp.logging import logger
+from sdp.utils.manifest_io import get_codec
+
+
+def get_commit() -> Optional[str]:
+    """Returns the current commit of the repository or None if it's not known."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    num_entries: int = 10000,
+    seed: int = 0,
+    processors: Optional[List[str]] = None,
+    configs: Optional[List[str]] = None,
+    modes: List[str] = tuple(MODES),
+    max_workers: int = -1,
+    repeats: int = 1,
+    skip_processors: bool = False,
+    skip_configs: bool = False,
+    skip_alignment: bool = False,
+    manifest_kwargs: Optional[Dict] = None,
+) -> Dict:
+    """Runs the benchmarks and returns the results (see the module docstring).
+
+    Args:
+        num_entries (int): number of entries in the synthetic manifest.
+        seed (int): random seed of the synthetic manifest.
+        processors (list[str]): names of the processors to benchmark. Defaults to all.
+        configs (list[str]): paths of the configs to replay relative to
+            ``dataset_configs``. Defaults to all.
+        modes (list[str]): modes of the processor benchmarks.
+        max_workers (int): number of worker processes. -1 means the number of CPUs.
+        repeats (int): number of runs of each processor benchmark.
+        skip_processors (bool): whether to skip the processor benchmarks.
+        skip_configs (bool): whether to skip the config replays.
+        skip_alignment (bool): whether to skip the word alignment benchmarks.
+        manifest_kwargs (dict): other arguments of
+            :func:`benchmarks.synthetic_manifest.generate_entries`.
+    """
+    manifest_kwargs = manifest_kwargs or {}
+    results = {
+        "metadata": {
+            "commit": get_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "max_workers": os.cpu_count() if max_workers == -1 else max_workers,
+            "json_codec": get_codec().name,
+            "num_entries": num_entries,
+            "seed": seed,
+            "manifest_kwargs": manifest_kwargs,
+            "repeats": repeats,
+        }
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_manifest_file = os.path.join(tmp_dir, "synthetic_manifest.json")
+        write_synthetic_manifest(input_manifest_file, num_entries, seed=seed, **manifest_kwargs)
+        results["metadata"]["manifest_bytes"] = os.path.getsize(input_manifest_file)
+        if not skip_processors:
+            processors_dir = os.path.join(tmp_dir, "processors")
+            os.makedirs(processors_dir)
+            results["processors"] = benchmark_processors(
+                input_manifest_file, processors_dir, processors, modes, max_workers, repeats
+            )
+        if not skip_configs:
+            results["configs"] = benchmark_configs(
+                input_manifest_file, os.path.join(tmp_dir, "configs"), configs, max_workers
+            )
+        if not skip_alignment:
+            results["alignment"] = benchmark_alignment(input_manifest_file, repeats=repeats)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the throughput of the processors on a synthetic manifest.")
+    parser.add_argument("--output_file", required=True, help="Path to the json file with the results")
+    parser.add_argument("--num_entries", type=int, default=10000, help="Number of entries in the manifest")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the manifest")
+    parser.add_argument("--pred_error_rate", type=float, default=0.1, help="Probability of an error in pred_text")
+    parser.add_argument("--words_per_second", type=float, default=2.5, help="Average number of words per second")
+    parser.add_argument("--processors", nargs="+", default=None, help="Processors to benchmark (default: all)")
+    parser.add_argument("--configs", nargs="+", default=None, help="Configs to replay (default: all)")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES), help="Processor modes")
+    parser.add_argument("--max_workers", type=int, default=-1, help="Number of worker processes")
+    parser.add_argument("--repeats", type=int, default=1, help="Number of runs of each processor")
+    parser.add_argument("--skip_processors", action="store_true", help="Don't run the processor benchmarks")
+    parser.add_argument("--skip_configs", action="store_true", help="Don't replay the configs")
+    parser.add_argument("--skip_alignment", action="store_true", help="Don't run the word alignment benchmarks")
+    args = parser.parse_args()
+
+    # processors log their statistics, which would hide the progress of the benchmarks
+    logger.setLevel(logging.WARNING)
+    results = run_benchmarks(
+        num_entries=args.num_entries,
+        seed=args.seed,
+        processors=args.processors,
+        configs=args.configs,
+        modes=args.modes,
+        max_workers=args.max_workers,
+        repeats=args.repeats,
+        skip_processors=args.skip_processors,
+        skip_configs=args.skip_configs,
+        skip_alignment=args.skip_alignment,
+        manifest_kwargs={"pred_error_rate": args.pred_error_rate, "words_per_second": args.words_per_second},
+    )
+    if os.path.dirname(args.output_file):
+        os.makedirs(os.path.dirname(args.output_file), exist_ok=True)
+    with open(args.output_file, "wt", encoding="utf8") as fout:
+        json.dump(results, fout, indent=4)
@@ -0,0 +1,165 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Generator of synthetic NeMo manifests for the benchmarks.
+
+Each entry has the fields that are read by the text processors of the
+checked-in configs:
+
+* ``audio_filepath`` and ``duration`` (no audio files are created);
+* ``text``: lowercase words without punctuation, with the number of words
+  proportional to the duration;
+* ``pred_text``: ``text`` with word substitutions, insertions and deletions
+  (each word is changed with probability ``pred_error_rate``);
+* ``text_pc`` and ``text_pc_pred``: ``text`` with punctuation and
+  capitalization (``text_pc`` is sometimes ``"n/a"``, as after
+  :class:`sdp.processors.RestorePCForMLS`);
+* ``raw_text`` and ``provided_norm_text``: unnormalized and normalized
+  texts as in the VoxPopuli manifests;
+* ``is_interviewee`` and ``original_file`` as in the CORAAL manifests.
+
+The first words of the vocabulary are always :data:`COMMON_WORDS`, so that
+benchmarks can refer to them. The rest are random strings of the ``alphabet``
+letters. Words are sampled with Zipf-like frequencies.
+
+To save a manifest, run::
+
+    python -m benchmarks.synthetic_manifest <output manifest> --num_entries 10000
+"""
+
+import argparse
+import itertools
+import random
+from typing import Dict, Iterator, List
+
+from sdp.utils.manifest_io import write_manifest
+
+COMMON_WORDS = ["the", "a", "and", "of", "to", "in", "is", "that", "it", "was", "uno", "dos", "tres", "gracias"]
+# a few speakers from the CORAAL train, dev and test splits
+CORAAL_SPEAKERS = ["ATL_se0_ag1_m", "DCA_se1_ag1_f", "ATL_se0_ag1_f", "DCB_se1_ag1_f", "ATL_se0_ag2_f"]
+
+
+def get_vocabulary(vocabulary_size: int, alphabet: str, rng: random.Random) -> List[str]:
+    """Returns :data:`COMMON_WORDS` followed by random words of 2-10 letters."""
+    vocabulary = list(COMMON_WORDS)
+    known_words = set(vocabulary)
+    while len(vocabulary) < vocabulary_size:
+        word = "".join(rng.choices(alphabet, k=rng.randint(2, 10)))
+        if word not in known_words:
+            known_words.add(word)
+            vocabulary.append(word)
+    return vocabulary
+
+
+def add_errors(words: List[str], error_rate: float, vocabulary: List[str], rng: random.Random) -> List[str]:
+    """Substitutes, inserts or deletes each word with probability ``error_rate``."""
+    pred_words = []
+    for word in words:
+        if rng.random() >= error_rate:
+            pred_words.append(word)
+            continue
+        error_type = rng.randrange(3)
+        if error_type == 0:
+            pred_words.append(rng.choice(vocabulary))
+        elif error_type == 1:
+            pred_words.extend([word, rng.choice(vocabulary)])
+    return pred_words
+
+
+def add_punctuation(words: List[str], rng: random.Random) -> str:
+    """Capitalizes the first word and adds commas and the final period."""
+    if not words:
+        return ""
+    words = list(words)
+    words[0] = words[0].capitalize()
+    for idx in range(len(words) - 1):
+        if rng.random() < 0.1:
+            words[idx] += ","
+    return " ".join(words) + "."
+
+
+def generate_entries(
+    num_entries: int,
+    seed: int = 0,
+    min_duration: float = 1.0,
+    max_duration: float = 20.0,
+    words_per_second: float = 2.5,
+    pred_error_rate: float = 0.1,
+    vocabulary_size: int = 5000,
+    alphabet: str = "abcdefghijklmnopqrstuvwxyz",
+    audio_dir: str = "/data/audio",
+) -> Iterator[Dict]:
+    """Lazily generates synthetic manifest entries. The same arguments always give the same entries.
+
+    Args:
+        num_entries (int): number of entries.
+        seed (int): random seed.
+        min_duration (float): minimal duration of the entries in seconds.
+        max_duration (float): maximal duration of the entries in seconds.
+        words_per_second (float): average number of words per second of
+            audio. Text lengths vary by +-30% around that rate.
+        pred_error_rate (float): probability of an error in each word of
+            the ``pred_text``.
+        vocabulary_size (int): number of different words.
+        alphabet (str): letters of the random words.
+        audio_dir (str): folder of the (non-existent) audio files.
+    """
+    rng = random.Random(seed)
+    vocabulary = get_vocabulary(vocabulary_size, alphabet, rng)
+    # Zipf-like distribution of the word frequencies
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    for idx in range(num_entries):
+        duration = round(rng.uniform(min_duration, max_duration), 3)
+        num_words = max(1, round(duration * words_per_second * rng.uniform(0.7, 1.3)))
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=num_words)
+        text_pc = add_punctuation(words, rng)
+        speaker = rng.choice(CORAAL_SPEAKERS)
+        yield {
+            "audio_filepath": f"{audio_dir}/{speaker}/{idx:08d}.wav",
+            "duration": duration,
+            "text": " ".join(words),
+            "pred_text": " ".join(add_errors(words, pred_error_rate, vocabulary, rng)),
+            "text_pc": text_pc if rng.random() < 0.8 else "n/a",
+            "text_pc_pred": add_punctuation(words, rng),
+            "raw_text": text_pc,
+            "provided_norm_text": " ".join(words),
+            "is_interviewee": rng.random() < 0.7,
+            "original_file": f"{speaker}_{idx % 3 + 1:02d}_1",
+        }
+
+
+def write_synthetic_manifest(manifest_file: str, num_entries: int, seed: int = 0, **kwargs):
+    """Saves ``num_entries`` synthetic entries (see :func:`generate_entries` for the arguments)."""
+    write_manifest(manifest_file, generate_entries(num_entries, seed=seed, **kwargs))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates a synthetic NeMo manifest.")
+    parser.add_argument("output_file", help="Path to the output manifest")
+    parser.add_argument("--num_entries", type=int, default=10000, help="Number of entries")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--min_duration", type=float, default=1.0, help="Minimal duration in seconds")
+    parser.add_argument("--max_duration", type=float, default=20.0, help="Maximal duration in seconds")
+    parser.add_argument("--words_per_second", type=float, default=2.5, help="Average number of words per second")
+    parser.add_argument("--pred_error_rate", type=float, default=0.1, help="Probability of an error in pred_text")
+    args = parser.parse_args()
+    write_synthetic_manifest(
+        args.output_file,
+        args.num_entries,
+        seed=args.seed,
+        min_duration=args.min_duration,
+        max_duration=args.max_duration,
+        words_per_second=args.words_per_second,
+        pred_error_rate=args.pred_error_rate,
+    )
@@ -12,18 +12,48 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections.abc
+import contextlib
 import itertools
-import json
 import multiprocessing
 import os
+import pickle
+import sys
+import time
 from abc import ABC, abstractmethod
+from array import array
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 from tqdm import tqdm
-from tqdm.contrib.concurrent import process_map
 
 from sdp.logging import logger
+from sdp.utils import columnar
+from sdp.utils.checkpoint import OutputJournal
+from sdp.utils.compression import is_compressed
+from sdp.utils.manifest_index import build_index, load_index, save_index
+from sdp.utils.manifest_io import (
+    ManifestWriter,
+    count_manifest_entries,
+    extract_fields,
+    iter_lines_in_range,
+    iter_manifest,
+    iter_manifest_lines,
+    load_manifest,
+    loads,
+    merge_fields,
+)
+from sdp.utils.parallel import AdaptiveChunker, WorkerPool, iter_chunks
+from sdp.utils.reducers import ListReducer
+from sdp.utils.sharding import concatenate_files, get_shard_range
+from sdp.utils.telemetry import ProcessorTelemetry
+
+
+# number of byte ranges per worker for worker_io=True, more ranges help to balance the load
+WORKER_IO_RANGES_PER_WORKER = 4
+# "pool" runs the chunks in the worker processes, "inline" in the main process,
+# "auto" decides after processing the first chunk in the main process
+EXECUTION_MODES = ("pool", "inline", "auto")
 
 
 @dataclass
@@ -32,6 +62,27 @@ class DataEntry:
 
     data: Optional[Dict]  # can be None to drop the entry
     metrics: Any = None
+    # can be set to True if data is the input entry without any changes, so its original line can be written as is
+    unmodified: bool = False
+
+
+class _UnmodifiedEntry(NamedTuple):
+    """Sent from the workers instead of the entries that have to be written as in the input manifest."""
+
+    duration: float
+
+
+class _CountedEntry(NamedTuple):
+    """Sent from the workers instead of the entries that are not written, only counted."""
+
+    duration: float
+
+
+class _SerializedEntry(NamedTuple):
+    """Sent from the workers instead of the entries that were serialized there."""
+
+    line: str
+    duration: float
 
 
 class BaseProcessor(ABC):
@@ -53,8 +104,16 @@ class BaseProcessor(ABC):
             an input manifest because they need to create an initial manifest
             from scratch (ie from some transcript file that is in a format
             different to the NeMo manifest format).
+
+    Attributes:
+        is_barrier (bool): class attribute that should be set to True for
+            processors that need to see the full dataset at once (e.g. sorting
+            or splitting the data). Such processors are never run on a shard
+            of the data (see :ref:`sharded execution <sdp-sharding>`).
     """
 
+    is_barrier = False
+
     def __init__(self, output_manifest_file: str, input_manifest_file: Optional[str] = None):
         self.output_manifest_file = output_manifest_file
         self.input_manifest_file = input_manifest_file
@@ -78,9 +137,11 @@ class BaseProcessor(ABC):
 class BaseParallelProcessor(BaseProcessor):
     """Processor class which allows operations on each utterance to be parallelized.
 
-    Parallelization is done using ``tqdm.contrib.concurrent.process_map`` inside
+    Parallelization is done using a :class:`sdp.utils.parallel.WorkerPool` inside
     the :meth:`process` method. Actual processing should be defined on a
     per-examples bases inside the :meth:`process_dataset_entry` method.
+    The processor object is sent to each worker only once, so it can hold
+    a large state (e.g. lookup tables) without slowing down the processing.
 
     See the documentation of all the methods for more details.
 
@@ -88,17 +149,159 @@ class BaseParallelProcessor(BaseProcessor):
         max_workers (int): maximum number of workers that will be spawned
             during the parallel processing.
         chunksize (int): the size of the chunks that will be sent to worker processes.
+        streaming (bool): if True, the input manifest is read lazily and the
+            results are written to the output manifest as soon as they are
+            ready, while the workers are still processing the next chunks.
+            The memory usage then does not depend on the size of the manifest.
+            Since the output is written to a temporary file that replaces the
+            output manifest only at the end, streaming also works when the
+            input and output manifests are the same file. Defaults to False.
+        max_chunks_in_flight (int): only used when ``streaming=True``. Maximum
+            number of chunks that are read from the input and not yet written
+            to the output at any given time. Defaults to ``2 * max_workers``.
+        ordered (bool): if False, the results are written in the order in
+            which the chunks are finished, so that a single slow entry does not
+            block the output of the chunks after it. Defaults to True.
+        reorder_buffer_size (int): if specified, chunks are processed as they
+            complete even if ``ordered=True``, and the output order is restored
+            with a buffer of up to ``reorder_buffer_size`` finished chunks that
+            wait for the slow ones. Defaults to None (the next chunk is only
+            sent to the workers when the results of the earlier chunks are
+            written, unless ``max_chunks_in_flight`` allows more).
+        checkpoint_every (int): if specified, the progress of writing the
+            temporary ``<output_manifest_file>.partial`` file is committed to
+            a journal every ``checkpoint_every`` input entries. If the
+            processor is interrupted, the next run will continue from the
+            last commit. This assumes that :meth:`read_manifest` returns
+            entries in the same order and that the parameters are not changed
+            in between. Defaults to None (no checkpointing).
+        write_index (bool): if True, the line index of the output manifest
+            is saved next to it (see :mod:`sdp.utils.manifest_index`), so that
+            the next processors can read any part of it without scanning the
+            whole file (e.g. for sharding or resuming from a checkpoint).
+            Ignored for the columnar output manifests. Defaults to False.
+        worker_io (bool): if True, each worker reads and parses its own byte
+            range of the input manifest and writes the results to its own
+            part of the output, which are concatenated at the end. The main
+            process then only merges the metrics, which removes the overhead
+            of sending all entries to the workers and back. That's only
+            possible if :meth:`read_manifest` is not overridden and both
+            manifests are uncompressed json lines; otherwise, or with ``checkpoint_every``,
+            this argument is ignored. Since each worker processes the whole
+            range at once, the progress bar is updated less often.
+            Defaults to False.
+        execution_mode (str): where the chunks are processed. "pool" uses the
+            worker processes, "inline" processes all chunks in the main process,
+            which is faster for the processors that do very little work per
+            entry, since the entries don't have to be sent to the workers and
+            back. "auto" processes the first chunk in the main process and
+            measures how long that takes compared to pickling the chunk and
+            its results, which is what sending it to a worker costs. The rest
+            of the chunks are processed in the main process if the processing
+            is cheaper, and in the workers otherwise. Defaults to the
+            ``execution_mode`` class attribute, which is "pool".
+        target_chunk_time (float): if specified, the chunk size is adapted
+            while processing, so that each chunk takes about this many seconds
+            to process (see :class:`sdp.utils.parallel.AdaptiveChunker`).
+            ``chunksize`` is then only the size of the first chunks. Cheap
+            entries are sent in larger chunks, reducing the overhead of
+            sending them, and chunks get smaller towards the end, so that all
+            workers finish at the same time. Sizes of the chunks are reported
+            in the telemetry. Defaults to None (all chunks have ``chunksize``
+            entries).
+
+    Attributes:
+        worker_pool (WorkerPool): pool of workers shared by all processors,
+            set inside :func:`sdp.run_processors.run_processors`. If None or
+            if it has more than ``max_workers`` workers, a new pool is
+            created for the duration of :meth:`process`.
+        shard_id (int), num_shards (int): if ``num_shards > 1``, only the
+            ``shard_id``-th contiguous part of the entries returned from
+            :meth:`read_manifest` is processed. Set inside
+            :func:`sdp.run_processors.run_processors` for sharded runs.
+        defer_finalize (bool): if True, :meth:`finalize` is not called at the
+            end of :meth:`process` and the metrics are saved in the
+            ``deferred_metrics`` attribute instead, so that they can be
+            merged with metrics of the other shards.
+        telemetry (ProcessorTelemetry): timings and other statistics of the
+            :meth:`process` call, see :mod:`sdp.utils.telemetry`.
+        metrics_reducer (MetricsReducer): class attribute that defines how the
+            ``metrics`` of the data entries are aggregated before being passed
+            to :meth:`finalize`. Metrics are reduced inside the workers for
+            each chunk, so that only one value per chunk is sent to the main
+            process. Defaults to :class:`sdp.utils.reducers.ListReducer`,
+            which collects all metrics in a list.
+        required_fields (list[str]): fields of the input entries that are used
+            by :meth:`process_dataset_entry`. If specified, only these fields
+            (and ``duration``) are parsed and passed to
+            :meth:`process_dataset_entry`, while the rest of the fields are
+            copied to all output entries as is. For the columnar input manifests
+            (see :mod:`sdp.utils.columnar`) the rest of the fields are not even
+            read. For the json lines manifests that's only done when the
+            original input lines can be written to the output (see
+            ``unmodified`` in :meth:`process_dataset_entry`) and the entries
+            that are not unmodified are parsed fully in the main process.
+            Defaults to None (all fields are read).
     """
 
-    def __init__(self, max_workers: int = -1, chunksize: int = 100, **kwargs):
+    metrics_reducer = ListReducer()
+    required_fields = None
+    execution_mode = "pool"
+
+    def __init__(
+        self,
+        max_workers: int = -1,
+        chunksize: int = 100,
+        streaming: bool = False,
+        max_chunks_in_flight: Optional[int] = None,
+        ordered: bool = True,
+        reorder_buffer_size: Optional[int] = None,
+        checkpoint_every: Optional[int] = None,
+        write_index: bool = False,
+        worker_io: bool = False,
+        execution_mode: Optional[str] = None,
+        target_chunk_time: Optional[float] = None,
+        **kwargs,
+    ):
         super().__init__(**kwargs)
         if max_workers == -1:
             max_workers = multiprocessing.cpu_count()
         self.max_workers = max_workers
         self.chunksize = chunksize
+        self.streaming = streaming
+        if max_chunks_in_flight is None:
+            max_chunks_in_flight = 2 * max_workers
+        self.max_chunks_in_flight = max_chunks_in_flight
+        self.ordered = ordered
+        self.reorder_buffer_size = reorder_buffer_size
+        if checkpoint_every is not None and not ordered:
+            raise ValueError("Checkpointing requires ordered=True to know which input entries were processed")
+        self.checkpoint_every = checkpoint_every
+        self.write_index = write_index
+        self.worker_io = worker_io
+        if execution_mode is not None:
+            self.execution_mode = execution_mode
+        if self.execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution_mode {self.execution_mode}. Supported modes: {list(EXECUTION_MODES)}")
+        if target_chunk_time is not None and target_chunk_time <= 0:
+            raise ValueError(f"target_chunk_time has to be positive, got {target_chunk_time}")
+        self.target_chunk_time = target_chunk_time
+        self.worker_pool = None
+        self.shard_id = 0
+        self.num_shards = 1
+        self.defer_finalize = False
+        self.deferred_metrics = None
+        self.telemetry = ProcessorTelemetry()
+        self._pass_through = False
         self.number_of_entries = 0
         self.total_duration = 0
 
+    def __getstate__(self):
+        # the pool is only used in the main process and can't be pickled
+        state = self.__dict__.copy()
+        state["worker_pool"] = None
+        return state
+
     def process(self):
         """Parallelized implementation of the data processing.
 
@@ -120,13 +323,14 @@ class BaseParallelProcessor(BaseProcessor):
            simply defines a ``data`` and ``metrics`` keys.
         4. We loop through all returned data entries and do the following
 
-           a) All ``metrics`` keys are collected in a separate list and passed
-              over to the :meth:`finalize` method for any desired metric
-              aggregation and reporting.
+           a) All ``metrics`` keys are aggregated with ``metrics_reducer``
+              (by default collected in a separate list) and passed over to
+              the :meth:`finalize` method for any desired metric reporting.
+              The aggregation is done in the workers for each chunk.
            b) If ``data`` is set to None, the objects are ignored (metrics are
               still collected).
            c) All non-ignored objects are dumped to the output manifest file
-              with a call to ``json.dump``, one object per-line.
+              with :class:`sdp.utils.manifest_io.ManifestWriter`, one object per-line.
 
         Here is a diagram outlining the execution flow of this method:
 
@@ -137,32 +341,512 @@ class BaseParallelProcessor(BaseProcessor):
              <div align="center">
                <img src="https://mermaid.ink/img/pako:eNplUl1r6zAM_SvCFy4pbL3vvaVwu-59sL0tl6LESmqIP7DkjWzsv89O0rVjzosiHR8dHetdtV6T2qg-YjjB0-Fv7SAfTs2cqdWjUGAwDrYiuz0yPWDEYaDhIfqWmH1chzmqVts_GQOW5OR1rWaqcv4916pcZxq6jKaAkRb0tok7IBtkXO5BM4KmDtMgUIotOmgIEpMG8VOK1v0atH91g0cNEV9BoyBgEm9RTJvljbX6D7e3O9hfVOyvVURCfbToTEcs11pKocwbksC5PnWFyhB00VvIE7wYnxiWwY3rgbNNqwlnOpATRQLD4B2dhdxdhNx9t2PiOJYRmORITuJYlb85XEydFGDDErGVL4tn6gNcuA-Zm_GFwCf5McJvwL6P1KNQoYim5SlfTY7-At9BEmHQ0YdAenVucH_hv7_W3hmHg3mj40JWXYudX8lwGHD86rb4d7YtN6hd-Qo1Oa1ulKVo0ei8k-8lXatsps0ubnK47EVZrY8MLQ_-OLpWbSQmulEpZNvoYDDvrlWbDgemj0-10vX9" height=100% />
              </div>
+
+        If ``streaming=True``, steps 2-4 are interleaved: :meth:`read_manifest`
+        can return a generator, which is consumed in chunks while previous
+        chunks are being processed and the results are written out. At most
+        ``max_chunks_in_flight`` chunks are kept in memory at any time.
+
+        If ``checkpoint_every`` is set, the progress is periodically committed
+        (see :class:`sdp.utils.checkpoint.OutputJournal`) and the processing
+        is resumed from the last commit if the previous run was interrupted.
+
+        Input and output manifests can be in the json lines or the columnar
+        format (see :mod:`sdp.utils.columnar`), depending on their names.
         """
-        self.prepare()
-        dataset_entries = self.read_manifest()
+        with self.telemetry.measure("prepare"):
+            self.prepare()
+        if self._uses_worker_io():
+            self._process_with_worker_io()
+            return
+        metrics = self._process_stages()[0]
+        self._finalize_or_defer(metrics)
+
+    def _get_stages(self) -> List[Tuple["BaseParallelProcessor", Optional[str]]]:
+        """Returns the processors run by :meth:`_process_chunk_by_stage` and the files to write their outputs to.
+
+        The file is None for the processors whose outputs are only counted.
+        """
+        return [(self, self.output_manifest_file)]
 
-        # this will unroll all inner lists
-        data = itertools.chain(
-            *process_map(
-                self.process_dataset_entry,
-                dataset_entries,
-                max_workers=self.max_workers,
-                chunksize=self.chunksize,
+    def _process_chunk_by_stage(self, dataset_entries: List) -> Tuple[List[List[List]], List]:
+        """Same as :meth:`_process_chunk`, but returns the outputs and metrics of each of :meth:`_get_stages`."""
+        chunk_data, chunk_metrics = self._process_chunk(dataset_entries)
+        return [chunk_data], [chunk_metrics]
+
+    def _process_stages(self) -> List:
+        """Processes the input entries in parallel and writes the outputs of all stages (see :meth:`_get_stages`).
+
+        Updates ``number_of_entries`` and ``total_duration`` of each stage
+        processor and returns the metrics of each of them.
+        """
+        telemetry = self.telemetry
+        self._pass_through = self._can_pass_through_lines()
+        with telemetry.measure("read_manifest"):
+            dataset_entries, num_entries = self._read_input()
+
+        stages = self._get_stages()
+        output_files = [output_file for _, output_file in stages if output_file is not None]
+        columnar_output = any(columnar.is_columnar(output_file) for output_file in output_files)
+        if columnar_output and self.checkpoint_every is not None:
+            raise ValueError("Checkpointing is not supported for the columnar output manifests")
+        reducers = [processor.metrics_reducer for processor, _ in stages]
+        metrics = [reducer.initial() for reducer in reducers]
+        # columnar output is written by its own writer, so journal only counts the processed inputs
+        with OutputJournal(
+            [] if columnar_output else output_files,
+            self.checkpoint_every,
+            self._get_journal_signature(),
+        ) as journal, contextlib.ExitStack() as writers_stack:
+            files = iter(journal.files)
+            writers = [
+                None
+                if output_file is None
+                else writers_stack.enter_context(self._open_writer(processor, output_file, journal, files))
+                for processor, output_file in stages
+            ]
+            # fields that were not read are copied from the input as is
+            skipped_fields = self._iter_skipped_fields(journal.num_committed_inputs)
+            if skipped_fields is not None:
+                input_columns = columnar.read_schema(self.input_manifest_file)["columns"]
+            # original lines of the input entries, read in parallel with the entries themselves
+            input_lines = self._iter_input_lines(journal.num_committed_inputs) if self._pass_through else None
+            # json lines entries with only some of the fields read are merged with their lines
+            fields_to_read = self._get_fields_to_read() if skipped_fields is None else None
+            # metrics are saved incrementally, counters as running totals
+            for committed_state in journal.committed_states:
+                for idx, (committed_metrics, number_of_entries, total_duration) in enumerate(committed_state):
+                    metrics[idx] = reducers[idx].merge(metrics[idx], committed_metrics)
+                    stages[idx][0].number_of_entries, stages[idx][0].total_duration = number_of_entries, total_duration
+            uncommitted_metrics = [reducer.initial() for reducer in reducers]
+            num_committed_inputs = journal.num_committed_inputs
+            dataset_entries, num_entries = self._skip_inputs(dataset_entries, num_entries, num_committed_inputs)
+            dataset_entries = telemetry.track_inputs(dataset_entries)
+
+            with tqdm(total=num_entries) as progress_bar, telemetry.measure("parallel_map"):
+                chunks_results = self._parallel_map(
+                    self._process_chunk_by_stage, dataset_entries, num_entries=num_entries
+                )
+                for chunk_data, chunk_metrics in chunks_results:
+                    telemetry.start("write")
+                    num_inputs = len(chunk_data[0])
+                    chunk_raw_fields = None
+                    if skipped_fields is not None:
+                        chunk_raw_fields = list(itertools.islice(skipped_fields, num_inputs))
+                    chunk_lines = list(itertools.islice(input_lines, num_inputs)) if input_lines is not None else None
+                    for (processor, _), writer, stage_data in zip(stages, writers, chunk_data):
+                        for input_idx, data_entries in enumerate(stage_data):
+                            for data in data_entries:
+                                if data is None:
+                                    continue
+                                processor.number_of_entries += 1
+                                if isinstance(data, (_UnmodifiedEntry, _CountedEntry, _SerializedEntry)):
+                                    processor.total_duration += data.duration
+                                    if isinstance(data, _SerializedEntry):
+                                        writer.write_line(data.line)
+                                    elif writer is not None:
+                                        writer.write_line(chunk_lines[input_idx])
+                                    continue
+                                processor.total_duration += data.get("duration", 0)
+                                if chunk_raw_fields is not None:
+                                    raw_fields = columnar.merge_raw_fields(
+                                        data, chunk_raw_fields[input_idx], input_columns
+                                    )
+                                    writer.write_raw_fields(raw_fields)
+                                elif fields_to_read is not None:
+                                    writer.write(merge_fields(data, chunk_lines[input_idx], fields_to_read))
+                                else:
+                                    writer.write(data)
+                    uncommitted_metrics = [
+                        reducer.merge(stage_metrics, other_metrics)
+                        for reducer, stage_metrics, other_metrics in zip(reducers, uncommitted_metrics, chunk_metrics)
+                    ]
+                    progress_bar.update(num_inputs)
+                    if journal.step(num_inputs):
+                        for writer in writers:
+                            if writer is not None:
+                                writer.flush()
+                        journal.commit(
+                            [
+                                (stage_metrics, processor.number_of_entries, processor.total_duration)
+                                for (processor, _), stage_metrics in zip(stages, uncommitted_metrics)
+                            ]
+                        )
+                        metrics = [
+                            reducer.merge(stage_metrics, other_metrics)
+                            for reducer, stage_metrics, other_metrics in zip(reducers, metrics, uncommitted_metrics)
+                        ]
+                        uncommitted_metrics = [reducer.initial() for reducer in reducers]
+                    telemetry.stop()
+            for writer in writers:
+                if writer is not None:
+                    writer.flush()
+            metrics = [
+                reducer.merge(stage_metrics, other_metrics)
+                for reducer, stage_metrics, other_metrics in zip(reducers, metrics, uncommitted_metrics)
+            ]
+
+        for (processor, output_file), writer in zip(stages, writers):
+            if output_file is not None and processor.write_index and not columnar.is_columnar(output_file):
+                self._save_index(output_file, writer.offsets)
+        return metrics
+
+    def _open_writer(self, processor: "BaseParallelProcessor", output_file: str, journal: OutputJournal, files):
+        """Returns a context manager that writes the output entries in the format of the output manifest.
+
+        ``files`` is an iterator over the opened files of the journal, json
+        lines outputs take the next of them.
+        """
+        if not columnar.is_columnar(output_file):
+            # offsets of the entries written in the previous runs are not known
+            track_offsets = processor.write_index and journal.num_committed_inputs == 0
+            track_offsets = track_offsets and not is_compressed(output_file)
+            return ManifestWriter(next(files), track_offsets=track_offsets)
+        if os.path.dirname(output_file):
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        return columnar.ColumnarWriter(output_file)
+
+    def _get_fields_to_read(self) -> Optional[List[str]]:
+        """Returns the fields that have to be read from the input manifest, or None to read all fields."""
+        if (
+            self.required_fields is None
+            or not self._reads_input_manifest()
+            # skipped fields are matched with the outputs by the input order
+            or not self.ordered
+            # the rest of the fields are copied either from the other columns or from the original lines
+            or not (columnar.is_columnar(self.input_manifest_file) or self._pass_through)
+        ):
+            return None
+        # duration is always needed to compute the statistics
+        return list(dict.fromkeys(["duration", *self.required_fields]))
+
+    def _save_index(self, manifest_file: str, offsets: Optional[array]):
+        """Saves the line index of the written manifest, building it from scratch if the offsets are not known."""
+        if is_compressed(manifest_file):
+            logger.warning("Line index is not supported for the compressed manifest %s", manifest_file)
+            return
+        if offsets is None:
+            offsets = build_index(manifest_file)
+        save_index(manifest_file, offsets)
+
+    def _iter_skipped_fields(self, num_skipped: int = 0):
+        """Returns an iterator over the raw values of the columns that were not read for each input entry."""
+        fields_to_read = self._get_fields_to_read()
+        if fields_to_read is None or not columnar.is_columnar(self.input_manifest_file):
+            return None
+        input_columns = columnar.read_schema(self.input_manifest_file)["columns"]
+        skipped_columns = [column for column in input_columns if column not in fields_to_read]
+        start, end = self._get_input_range(num_skipped)
+        return itertools.islice(columnar.iter_raw_fields(self.input_manifest_file, skipped_columns), start, end)
+
+    def _can_pass_through_lines(self) -> bool:
+        """Checks if the original lines of the unmodified entries can be written to the output."""
+        return (
+            self._reads_input_manifest()
+            # input lines are matched with the outputs by the input order
+            and self.ordered
+            and not columnar.is_columnar(self.input_manifest_file)
+            and not columnar.is_columnar(self.output_manifest_file)
+        )
+
+    def _iter_input_lines(self, num_skipped: int = 0) -> Iterator[bytes]:
+        """Returns an iterator over the lines of the input entries that have to be processed."""
+        start, end = self._get_input_range(num_skipped)
+        return iter_manifest_lines(self.input_manifest_file, start, end)
+
+    def _uses_worker_io(self) -> bool:
+        return (
+            self.worker_io
+            and self.checkpoint_every is None
+            and self._reads_input_manifest()
+            and not columnar.is_columnar(self.input_manifest_file)
+            and not columnar.is_columnar(self.output_manifest_file)
+            # compressed files can't be split into byte ranges
+            and not is_compressed(self.input_manifest_file)
+            and not is_compressed(self.output_manifest_file)
+        )
+
+    def _get_input_byte_range(self) -> Tuple[int, int]:
+        """Returns the start and end offsets of the entries of the current shard in the input manifest."""
+        if self.num_shards == 1:
+            return 0, os.path.getsize(self.input_manifest_file)
+        offsets = load_index(self.input_manifest_file)
+        if offsets is None:
+            offsets = build_index(self.input_manifest_file)
+        start, end = self._get_shard_range(len(offsets) - 1)
+        return offsets[start], offsets[end]
+
+    def _process_with_worker_io(self):
+        """Implementation of :meth:`process` for ``worker_io=True``.
+
+        Input is split into ``WORKER_IO_RANGES_PER_WORKER * max_workers`` byte
+        ranges of the same size. Each range is processed by
+        :meth:`_process_byte_ranges` inside a worker and the output parts are
+        concatenated in the order of the ranges.
+        """
+        telemetry = self.telemetry
+        with telemetry.measure("read_manifest"):
+            start_offset, end_offset = self._get_input_byte_range()
+        num_ranges = max(1, self.max_workers * WORKER_IO_RANGES_PER_WORKER)
+        range_size = end_offset - start_offset
+        range_offsets = [start_offset + range_size * idx // num_ranges for idx in range(num_ranges + 1)]
+        part_files = [f"{self.output_manifest_file}.part{idx}" for idx in range(num_ranges)]
+        tasks = list(zip(range_offsets[:-1], range_offsets[1:], part_files))
+        if os.path.dirname(self.output_manifest_file):
+            os.makedirs(os.path.dirname(self.output_manifest_file), exist_ok=True)
+
+        reducer = self.metrics_reducer
+        metrics = reducer.initial()
+        # workers have the input lines, so can always write them as is
+        self._pass_through = True
+        try:
+            with tqdm(total=range_size, unit="B", unit_scale=True) as progress_bar, telemetry.measure("parallel_map"):
+                for range_results in self._parallel_map(self._process_byte_ranges, tasks, chunksize=1):
+                    for range_metrics, num_bytes, inputs_stats, outputs_stats in range_results:
+                        metrics = reducer.merge(metrics, range_metrics)
+                        telemetry.entries_in += inputs_stats[0]
+                        telemetry.duration_in += inputs_stats[1]
+                        self.number_of_entries += outputs_stats[0]
+                        self.total_duration += outputs_stats[1]
+                        progress_bar.update(num_bytes)
+            with telemetry.measure("write"):
+                concatenate_files(part_files, self.output_manifest_file)
+        finally:
+            for part_file in part_files:
+                if os.path.exists(part_file):
+                    os.remove(part_file)
+
+        if self.write_index:
+            self._save_index(self.output_manifest_file, None)
+        self._finalize_or_defer(metrics)
+
+    def _process_byte_ranges(self, tasks: List[Tuple[int, int, str]]) -> List[Tuple]:
+        """Processes entries in the byte ranges of the input manifest inside a worker.
+
+        Each entry belongs to the range where its line starts.
+
+        Args:
+            tasks (list): a list of ``(start offset, end offset, output file)``.
+
+        Returns:
+            list: a tuple for each range with the aggregated metrics, the size of
+            the range, and the number and total duration of input and output entries.
+        """
+        reducer = self.metrics_reducer
+        fields_to_read = self._get_fields_to_read()
+        results = []
+        for start_offset, end_offset, output_file in tasks:
+            metrics = reducer.initial()
+            inputs_stats = [0, 0]
+            outputs_stats = [0, 0]
+            with open(self.input_manifest_file, "rb") as fin, open(output_file, "wt", encoding="utf8") as fout:
+                with ManifestWriter(fout) as writer:
+                    for lines in iter_chunks(iter_lines_in_range(fin, start_offset, end_offset), self.chunksize):
+                        if fields_to_read is None:
+                            dataset_entries = [loads(line) for line in lines]
+                        else:
+                            dataset_entries = [extract_fields(line, fields_to_read) for line in lines]
+                        inputs_stats[0] += len(dataset_entries)
+                        inputs_stats[1] += sum(dataset_entry.get("duration", 0) for dataset_entry in dataset_entries)
+                        chunk_data, chunk_metrics = self._process_chunk(dataset_entries)
+                        metrics = reducer.merge(metrics, chunk_metrics)
+                        for line, data_entries in zip(lines, chunk_data):
+                            for data in data_entries:
+                                if data is None:
+                                    continue
+                                outputs_stats[0] += 1
+                                if isinstance(data, _UnmodifiedEntry):
+                                    writer.write_line(line)
+                                    outputs_stats[1] += data.duration
+                                else:
+                                    if fields_to_read is not None:
+                                        data = merge_fields(data, line, fields_to_read)
+                                    writer.write(data)
+                                    outputs_stats[1] += data.get("duration", 0)
+            results.append((metrics, end_offset - start_offset, tuple(inputs_stats), tuple(outputs_stats)))
+        return results
+
+    def _process_chunk(self, dataset_entries: List) -> Tuple[List[List[Optional[Dict]]], Any]:
+        """Processes a chunk of entries inside a worker, reducing all metrics to a single value.
+
+        Returns:
+            tuple: a list of output ``data`` for each input entry and the
+            metrics of the whole chunk aggregated with ``metrics_reducer``.
+            If the original input lines are available in the main process,
+            unmodified entries are replaced with ``_UnmodifiedEntry`` to avoid
+            sending them back and serializing them again.
+        """
+        reducer = self.metrics_reducer
+        chunk_metrics = reducer.initial()
+        chunk_data = []
+        for dataset_entry in dataset_entries:
+            data_entries = self.process_dataset_entry(dataset_entry)
+            for data_entry in data_entries:
+                chunk_metrics = reducer.combine(chunk_metrics, data_entry.metrics)
+            chunk_data.append([self._get_output_data(data_entry) for data_entry in data_entries])
+        return chunk_data, chunk_metrics
+
+    def _get_output_data(self, data_entry: DataEntry):
+        if self._pass_through and data_entry.unmodified and data_entry.data is not None:
+            return _UnmodifiedEntry(data_entry.data.get("duration", 0))
+        return data_entry.data
+
+    def _finalize_or_defer(self, metrics: Any):
+        if self.defer_finalize:
+            self.deferred_metrics = metrics
+        else:
+            with self.telemetry.measure("finalize"):
+                self.finalize(metrics)
+
+    def _reads_input_manifest(self) -> bool:
+        """Checks if the entries are read from the input manifest with the default :meth:`read_manifest`."""
+        return self.input_manifest_file is not None and type(self).read_manifest is BaseParallelProcessor.read_manifest
+
+    def _get_shard_range(self, num_entries: Optional[int]) -> Tuple[int, Optional[int]]:
+        """Returns the range of the entries of the current shard. Number of entries can be None if not sharded."""
+        if self.num_shards == 1:
+            return 0, num_entries
+        start, end = get_shard_range(num_entries, self.shard_id, self.num_shards)
+        logger.info("Processing shard %d/%d: entries %d-%d", self.shard_id, self.num_shards, start, end)
+        return start, end
+
+    def _get_input_range(self, num_skipped: int = 0) -> Tuple[int, Optional[int]]:
+        """Returns the range of the input manifest entries that have to be processed.
+
+        The end of the range is None if it's the end of the manifest and counting
+        the entries would require scanning the whole file.
+        """
+        num_entries = count_manifest_entries(self.input_manifest_file, scan=self.num_shards > 1)
+        start, end = self._get_shard_range(num_entries)
+        return start + num_skipped, end
+
+    def _read_input(self, num_skipped: int = 0) -> Tuple[Iterable, Optional[int]]:
+        """Returns the entries of the current shard, skipping the first ``num_skipped`` of them.
+
+        If :meth:`read_manifest` is not overridden, only the required part of the
+        input manifest is read, without parsing the rest of the entries.
+
+        Returns:
+            tuple: the entries and their number (None if it's not known in advance).
+        """
+        if self._reads_input_manifest():
+            start, end = self._get_input_range(num_skipped)
+            if not self.streaming:
+                dataset_entries = load_manifest(self.input_manifest_file, self._get_fields_to_read(), start, end)
+                return dataset_entries, len(dataset_entries)
+            num_entries = None if end is None else max(end - start, 0)
+            return iter_manifest(self.input_manifest_file, self._get_fields_to_read(), start, end), num_entries
+
+        dataset_entries = self.read_manifest()
+        if not isinstance(dataset_entries, collections.abc.Sized):
+            if self.num_shards == 1:
+                return itertools.islice(dataset_entries, num_skipped, None), None
+            dataset_entries = list(dataset_entries)
+        start, end = self._get_shard_range(len(dataset_entries))
+        return itertools.islice(dataset_entries, start + num_skipped, end), max(end - start - num_skipped, 0)
+
+    def _skip_inputs(
+        self, dataset_entries: Iterable, num_entries: Optional[int], num_skipped: int
+    ) -> Tuple[Iterable, Optional[int]]:
+        """Skips the input entries that were processed in the previous runs."""
+        if num_skipped == 0:
+            return dataset_entries, num_entries
+        if self.streaming and self._reads_input_manifest():
+            # nothing was read yet, so can start right from the first unprocessed entry
+            return self._read_input(num_skipped)
+        num_entries = None if num_entries is None else max(num_entries - num_skipped, 0)
+        return itertools.islice(dataset_entries, num_skipped, None), num_entries
+
+    def _parallel_map(
+        self, method, dataset_entries, chunksize: Optional[int] = None, num_entries: Optional[int] = None
+    ):
+        """Calls ``method`` of this class on chunks of entries in parallel, yielding the result for each chunk.
+
+        Results are yielded in the input order, unless ``ordered=False``.
+        Chunks have ``chunksize`` entries. If it's not specified, that's
+        ``self.chunksize`` or, if ``target_chunk_time`` is set, the size is
+        adapted for each chunk (``num_entries`` is the total number of entries,
+        if known). Chunks are processed in the main process or in the workers
+        depending on ``execution_mode``.
+        """
+        chunker = None
+        if chunksize is None and self.target_chunk_time is not None:
+            chunker = AdaptiveChunker(self.target_chunk_time, self.chunksize, self.max_workers, num_entries)
+            chunks = chunker.iter_chunks(dataset_entries)
+        else:
+            chunks = iter_chunks(dataset_entries, chunksize or self.chunksize)
+        if chunksize is None:
+            chunks = self.telemetry.track_chunks(chunks)
+        on_chunk_done = chunker.record if chunker is not None else None
+
+        if self.execution_mode == "inline":
+            yield from self._map_inline(method, chunks, on_chunk_done)
+            return
+        if self.execution_mode == "auto":
+            first_chunk = next(chunks, None)
+            if first_chunk is None:
+                return
+            first_result, processing_time = self._timed_call(method, first_chunk)
+            if on_chunk_done is not None:
+                on_chunk_done(len(first_chunk), processing_time)
+            # that's done in the main process for every chunk sent to the workers
+            _, transfer_time = self._timed_call(lambda: pickle.loads(pickle.dumps((first_chunk, first_result))))
+            inline = processing_time < transfer_time
+            logger.info(
+                "Processing the first chunk took %.2g seconds, sending it to a worker would take %.2g seconds, "
+                "processing the rest of the chunks %s",
+                processing_time,
+                transfer_time,
+                "in the main process" if inline else "in the workers",
             )
+            yield first_result
+            if inline:
+                yield from self._map_inline(method, chunks, on_chunk_done)
+                return
+
+        if self.worker_pool is not None and self.worker_pool.max_workers <= self.max_workers:
+            yield from self._map_in_pool(self.worker_pool, method, chunks, on_chunk_done)
+            return
+
+        with WorkerPool(max_workers=self.max_workers) as worker_pool:
+            yield from self._map_in_pool(worker_pool, method, chunks, on_chunk_done)
+
+    @staticmethod
+    def _timed_call(fn, *args) -> Tuple[Any, float]:
+        start_time = time.perf_counter()
+        result = fn(*args)
+        return result, time.perf_counter() - start_time
+
+    def _map_inline(self, method, chunks: Iterable[List], on_chunk_done: Optional[Callable] = None):
+        for chunk in chunks:
+            result, seconds = self._timed_call(method, chunk)
+            if on_chunk_done is not None:
+                on_chunk_done(len(chunk), seconds)
+            yield result
+
+    def _map_in_pool(self, worker_pool, method, chunks: Iterable[List], on_chunk_done: Optional[Callable] = None):
+        # without streaming all data is in memory anyway, so sending everything to the workers at once,
+        # unless the size of the next chunks depends on the processing time of the previous ones
+        adaptive = on_chunk_done is not None
+        max_chunks_in_flight = self.max_chunks_in_flight if self.streaming or adaptive else sys.maxsize
+        yield from worker_pool.imap_chunks(
+            method,
+            chunks,
+            max_chunks_in_flight=max_chunks_in_flight,
+            ordered=self.ordered,
+            reorder_buffer_size=self.reorder_buffer_size,
+            per_chunk=True,
+            on_chunk_done=on_chunk_done,
         )
-        metrics = []
-        os.makedirs(os.path.dirname(self.output_manifest_file), exist_ok=True)
-        with open(self.output_manifest_file, "wt", encoding="utf8") as fout:
-            for data_entry in tqdm(data):
-                metrics.append(data_entry.metrics)
-                if data_entry.data is None:
-                    continue
-                json.dump(data_entry.data, fout)
-                self.number_of_entries += 1
-                self.total_duration += data_entry.data.get("duration", 0)
-                fout.write("\n")
-
-        self.finalize(metrics)
+        self.telemetry.add_workers_peak_rss(worker_pool.peak_rss)
+
+    def _get_journal_signature(self):
+        """Identifies the run for resuming from the checkpoints."""
+        input_stat = None
+        if self.input_manifest_file is not None and os.path.exists(self.input_manifest_file):
+            stat = os.stat(self.input_manifest_file)
+            input_stat = (stat.st_size, stat.st_mtime_ns)
+        return (type(self).__name__, self.input_manifest_file, input_stat)
 
     def prepare(self):
         """Can be used in derived classes to prepare the processing in any way.
@@ -174,6 +858,9 @@ class BaseParallelProcessor(BaseProcessor):
     def read_manifest(self):
         """Reading the input manifest file.
 
+        Returns a list of all entries, or a generator over them if
+        ``streaming=True``. Derived classes can return any iterable.
+
         .. note::
             This function should be overridden in the "initial" class creating
             manifest to read from the original source of data.
@@ -181,11 +868,10 @@ class BaseParallelProcessor(BaseProcessor):
         if self.input_manifest_file is None:
             raise NotImplementedError("Override this method if the processor creates initial manifest")
 
-        # TODO: should we not assume that manifest can fully fit in memory?
-        with open(self.input_manifest_file, "rt", encoding="utf8") as fin:
-            dataset_entries = [json.loads(line) for line in fin.readlines()]
+        if self.streaming:
+            return iter_manifest(self.input_manifest_file, self._get_fields_to_read())
 
-        return dataset_entries
+        return load_manifest(self.input_manifest_file, self._get_fields_to_read())
 
     @abstractmethod
     def process_dataset_entry(self, data_entry) -> List[DataEntry]:
@@ -206,6 +892,8 @@ class BaseParallelProcessor(BaseProcessor):
                 # anything - you'd need to aggregate all
                 # values in the finalize method manually
                 metrics: Any = None
+                # True if data is the unchanged input entry
+                unmodified: bool = False
 
         .. note::
             This method should always return a list of objects to allow a
@@ -217,6 +905,12 @@ class BaseParallelProcessor(BaseProcessor):
             this method (but can still be done if you don't inherit from
             this class and process the data sequentially).
 
+        .. note::
+            If the entry is kept without any changes (e.g. in the filtering
+            processors), set ``unmodified=True``. The original line of the input
+            manifest is then written to the output instead of serializing
+            the entry again.
+
         Args:
             data_entry: most often, ``data_entry`` will be a dictionary
                 containing items which represent the JSON manifest entry.
@@ -229,15 +923,15 @@ class BaseParallelProcessor(BaseProcessor):
         #     seems that it's not supported with multiprocessing. Is there a
         #     way to make it work?
 
-    def finalize(self, metrics: List):
+    def finalize(self, metrics: Any):
         """Can be used to output statistics about the processed data.
 
         By default outputs new number of entries/hours.
 
         Args:
-            metrics (list): a list containing all ``metrics`` keys from the
-                data entries returned from the :meth:`process_dataset_entry`
-                method.
+            metrics: all ``metrics`` keys from the data entries returned from
+                the :meth:`process_dataset_entry` method, aggregated with
+                ``metrics_reducer``. By default that's a list of all values.
         """
         logger.info("Total number of entries after processing: %d", self.number_of_entries)
         if self.total_duration != 0:
@@ -13,7 +13,6 @@
 # limitations under the License.
 
 import collections
-import json
 import os
 import re
 import string
@@ -28,6 +27,8 @@ from tqdm import tqdm
 from sdp.logging import logger
 from sdp.processors.base_processor import BaseProcessor
 from sdp.utils.common import download_file, extract_archive
+from sdp.utils.compression import open_file
+from sdp.utils.manifest_io import ManifestWriter, iter_manifest, loads, open_output_file
 
 sys.setrecursionlimit(1000000)
 
@@ -195,10 +196,8 @@ def recover_lines(manifest, processed_text, output_dir, restored_text_field):
         return
 
     lines = []
-    with open(manifest, "r") as f:
-        for line in f:
-            line = json.loads(line)
-            lines.append(line["text"])
+    for line in iter_manifest(manifest):
+        lines.append(line["text"])
 
     logger.debug(f"processing {manifest}")
     logger.debug(f"processing - {len(lines)} lines")
@@ -267,14 +266,13 @@ def recover_lines(manifest, processed_text, output_dir, restored_text_field):
         f"recovered {len(recovered_lines)} lines out of {len(lines)} -- {round(len(recovered_lines)/len(lines)*100, 2)}% -- {os.path.basename(manifest)}"
     )
 
-    with open(manifest_recovered, "w") as f_out, open(manifest, "r") as f_in:
-        for idx, line in enumerate(f_in):
-            line = json.loads(line)
+    with open_output_file(manifest_recovered) as f_out, ManifestWriter(f_out, ensure_ascii=False) as writer:
+        for idx, line in enumerate(iter_manifest(manifest)):
             if idx in recovered_lines:
                 line[restored_text_field] = recovered_lines[idx]
             else:
                 line[restored_text_field] = NA
-            f_out.write(json.dumps(line, ensure_ascii=False) + "\n")
+            writer.write(line)
 
 
 def split_text_into_sentences(text: str):
@@ -388,6 +386,32 @@ def process_book(book_manifest, texts_dir, submanifests_dir, output_dir, restore
         return
 
 
+def create_submanifests(manifest_file, submanifests_dir):
+    """Splits the manifest into submanifests for each combo of book and speaker, sorted by the sample id.
+
+    Returns the names of the submanifests (``<book id>_<speaker id>``).
+    """
+    os.makedirs(submanifests_dir, exist_ok=True)
+
+    data = {}
+    with open_file(manifest_file, "rt") as f:
+        for line in tqdm(f):
+            item = loads(line)
+            name = item["audio_filepath"].split("/")[-1].replace(".wav", "")
+            reader_id, lv_book_id, sample_id = name.split("_")
+            key = f"{lv_book_id}_{reader_id}"
+            if key not in data:
+                data[key] = {}
+            data[key][sample_id] = line
+
+    for key, v in data.items():
+        with open(f"{submanifests_dir}/{key}.json", "w") as f_out:
+            for sample_id in sorted(v.keys()):
+                line = v[sample_id]
+                f_out.write(line)
+    return list(data)
+
+
 class RestorePCForMLS(BaseProcessor):
     """Recovers original text from MLS Librivox texts.
 
@@ -407,6 +431,8 @@ class RestorePCForMLS(BaseProcessor):
         show_conversion_breakdown: bool for whether to show how much of each submanifest was restored.
     """
 
+    is_barrier = True
+
     def __init__(
         self,
         language_long: str,
@@ -447,24 +473,7 @@ class RestorePCForMLS(BaseProcessor):
         )
 
         # Create submanifests
-        os.makedirs(self.submanifests_dir, exist_ok=True)
-
-        data = {}
-        with open(self.input_manifest_file, "r") as f:
-            for line in tqdm(f):
-                item = json.loads(line)
-                name = item["audio_filepath"].split("/")[-1].replace(".wav", "")
-                reader_id, lv_book_id, sample_id = name.split("_")
-                key = f"{lv_book_id}_{reader_id}"
-                if key not in data:
-                    data[key] = {}
-                data[key][sample_id] = line
-
-        for key, v in data.items():
-            with open(f"{self.submanifests_dir}/{key}.json", "w") as f_out:
-                for sample_id in sorted(v.keys()):
-                    line = v[sample_id]
-                    f_out.write(line)
+        submanifest_names = create_submanifests(self.input_manifest_file, str(self.submanifests_dir))
 
         # Restore P&C to submanifests.
         os.makedirs(str(self.restored_submanifests_dir), exist_ok=True)
@@ -481,7 +490,7 @@ class RestorePCForMLS(BaseProcessor):
             normalizer = None
 
         # TODO: rename to maybe books_ids_in_datasplit
-        books_ids_in_submanifests = set([x.split("_")[0] for x in data.keys()])
+        books_ids_in_submanifests = set([x.split("_")[0] for x in submanifest_names])
 
         Parallel(n_jobs=self.n_jobs)(
             delayed(process_book)(
@@ -498,12 +507,10 @@ class RestorePCForMLS(BaseProcessor):
         # get stats --- keep track of book/spk ids in  our datasplit
         book_id_spk_ids_in_datasplit = set()  # set of tuples (book_id, spk_id), ...
         original_manifest_duration = 0
-        with open(self.input_manifest_file, "r") as f:
-            for line in f:
-                line = json.loads(line)
-                book_id, spk_id = os.path.basename(line["audio_filepath"]).strip('.wav').split("_")[:2]
-                book_id_spk_ids_in_datasplit.add((book_id, spk_id))
-                original_manifest_duration += line["duration"]
+        for line in iter_manifest(self.input_manifest_file):
+            book_id, spk_id = os.path.basename(line["audio_filepath"]).strip('.wav').split("_")[:2]
+            book_id_spk_ids_in_datasplit.add((book_id, spk_id))
+            original_manifest_duration += line["duration"]
         logger.info(
             f"duration ORIGINAL total (for current datasplit): {round(original_manifest_duration / 60 / 60, 2)} hrs"
         )
@@ -515,20 +522,16 @@ class RestorePCForMLS(BaseProcessor):
         # duration in submanifests
         for book_id, spk_id in book_id_spk_ids_in_datasplit:
             manifest = os.path.join(self.submanifests_dir, f"{spk_id}_{book_id}.json")
-            with open(manifest, "r") as f:
-                for line in f:
-                    line = json.loads(line)
-                    filename_to_sub_manifest_durs[f"{spk_id}_{book_id}.json"] += line["duration"]
+            for line in iter_manifest(manifest):
+                filename_to_sub_manifest_durs[f"{spk_id}_{book_id}.json"] += line["duration"]
 
         # duration in restored_submanifests
         for book_id, spk_id in book_id_spk_ids_in_datasplit:
             manifest = os.path.join(self.restored_submanifests_dir, f"{spk_id}_{book_id}.json")
             if os.path.exists(manifest):
-                with open(manifest, "r") as f:
-                    for line in f:
-                        line = json.loads(line)
-                        if line[self.restored_text_field] != NA:
-                            filename_to_restored_sub_manifest_durs[f"{spk_id}_{book_id}.json"] += line["duration"]
+                for line in iter_manifest(manifest):
+                    if line[self.restored_text_field] != NA:
+                        filename_to_restored_sub_manifest_durs[f"{spk_id}_{book_id}.json"] += line["duration"]
             else:
                 filename_to_restored_sub_manifest_durs[f"{spk_id}_{book_id}.json"] = 0
 
@@ -559,7 +562,7 @@ class RestorePCForMLS(BaseProcessor):
         )
 
         # duration in restored_submanifests
-        with open(self.output_manifest_file, 'w') as fout:
+        with open_output_file(self.output_manifest_file) as fout:
             for book_id, spk_id in book_id_spk_ids_in_datasplit:
                 manifest = os.path.join(self.restored_submanifests_dir, f"{spk_id}_{book_id}.json")
                 if os.path.exists(manifest):
@@ -12,7 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
 import os
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
@@ -28,6 +27,7 @@ from sdp.processors.base_processor import (
     DataEntry,
 )
 from sdp.utils.common import download_file, extract_archive
+from sdp.utils.manifest_io import ManifestWriter, load_manifest, open_output_file
 
 DATASET_URL = "https://www.openslr.org/resources/83/{dialect}.zip"
 
@@ -154,14 +154,15 @@ class CustomDataSplitSLR83(BaseProcessor):
         number of files, your splits will likely be different.
     """
 
+    is_barrier = True
+
     def __init__(self, dialect, data_split, **kwargs):
         super().__init__(**kwargs)
         self.dialect = dialect
         self.data_split = data_split
 
     def process(self):
-        with open(self.input_manifest_file, "rt", encoding="utf8") as fin:
-            manifest_data = [json.loads(line) for line in fin.readlines()]
+        manifest_data = load_manifest(self.input_manifest_file)
 
         # sorting and fixing random seed for reproducibility
         manifest_data = sorted(manifest_data, key=lambda x: x['audio_filepath'])
@@ -195,13 +196,11 @@ class CustomDataSplitSLR83(BaseProcessor):
 
         number_of_entries = 0
         total_duration = 0
-        os.makedirs(os.path.dirname(self.output_manifest_file), exist_ok=True)
-        with open(self.output_manifest_file, "wt", encoding="utf8") as fout:
+        with open_output_file(self.output_manifest_file) as fout, ManifestWriter(fout) as writer:
             for data_entry in tqdm(split_data[self.data_split][0]):
-                json.dump(data_entry, fout)
+                writer.write(data_entry)
                 number_of_entries += 1
                 total_duration += data_entry["duration"]
-                fout.write("\n")
 
         logger.info("Total number of entries after processing: %d", number_of_entries)
         logger.info("Total audio duration (hours) after processing: %.2f", total_duration / 3600)
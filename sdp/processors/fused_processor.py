@@ -0,0 +1,235 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import os
+from typing import List
+
+from sdp.logging import logger
+from sdp.processors.base_processor import (
+    BaseParallelProcessor,
+    BaseProcessor,
+    _CountedEntry,
+    _SerializedEntry,
+    _UnmodifiedEntry,
+)
+from sdp.utils import columnar
+from sdp.utils.manifest_io import dumps
+
+
+def can_be_fused(processor: BaseProcessor) -> bool:
+    """Checks if processor only defines per-entry logic, reading from a standard manifest.
+
+    That's the case for all :class:`sdp.processors.base_processor.BaseParallelProcessor`
+    subclasses that do not override :meth:`process`, :meth:`prepare` or :meth:`read_manifest`.
+    Processors that read or write columnar manifests (see :mod:`sdp.utils.columnar`)
+    are not fused, since fused processors only support json lines. Processors
+    with ``worker_io=True`` are not fused either, since they do all I/O in the workers.
+    """
+    if not isinstance(processor, BaseParallelProcessor) or processor.input_manifest_file is None:
+        return False
+    if processor.worker_io:
+        return False
+    if columnar.is_columnar(processor.input_manifest_file) or columnar.is_columnar(processor.output_manifest_file):
+        return False
+    for method in ["process", "prepare", "read_manifest"]:
+        if getattr(type(processor), method) is not getattr(BaseParallelProcessor, method):
+            return False
+    return True
+
+
+def _min_specified(values):
+    """Returns the minimum of the values that are not None, or None if there are no such values."""
+    return min((value for value in values if value is not None), default=None)
+
+
+def _get_execution_mode(modes):
+    """Runs inline only if all processors do, and in the workers if any processor has to."""
+    modes = set(modes)
+    if modes == {"inline"}:
+        return "inline"
+    return "pool" if "pool" in modes else "auto"
+
+
+class FusedParallelProcessor(BaseParallelProcessor):
+    """Runs a chain of per-entry processors in a single pass over the data.
+
+    The input manifest of the first processor is read once and each worker
+    calls :meth:`process_dataset_entry` of all processors in sequence.
+    Metrics are still collected separately for each processor and passed
+    to its :meth:`finalize` method. Intermediate outputs are only written
+    for the processors listed in ``materialize``, the output of the last
+    processor is always written. Entries that none of the processors so far
+    modified are written as the original input lines, and if all processors
+    specify ``required_fields``, only the union of them is parsed, same as
+    for a single processor.
+
+    This class is not supposed to be used in configs directly, it is created
+    automatically inside :func:`sdp.run_processors.run_processors`.
+
+    Args:
+        processors (list): processors to run. Each next processor has to read
+            the output manifest of the previous one.
+        materialize (list[bool]): whether to write the output manifest of each
+            processor. Ignored for the last processor.
+    """
+
+    def __init__(self, processors: List[BaseParallelProcessor], materialize: List[bool]):
+        super().__init__(
+            input_manifest_file=processors[0].input_manifest_file,
+            output_manifest_file=processors[-1].output_manifest_file,
+            max_workers=min(processor.max_workers for processor in processors),
+            chunksize=min(processor.chunksize for processor in processors),
+            streaming=any(processor.streaming for processor in processors),
+            max_chunks_in_flight=min(processor.max_chunks_in_flight for processor in processors),
+            ordered=all(processor.ordered for processor in processors),
+            reorder_buffer_size=_min_specified(processor.reorder_buffer_size for processor in processors),
+            checkpoint_every=_min_specified(processor.checkpoint_every for processor in processors),
+            execution_mode=_get_execution_mode(processor.execution_mode for processor in processors),
+            target_chunk_time=_min_specified(processor.target_chunk_time for processor in processors),
+        )
+        self.processors = processors
+        # entries are only read partially if all processors specify the fields they use
+        if all(processor.required_fields is not None for processor in processors):
+            required_fields = [field for processor in processors for field in processor.required_fields]
+            self.required_fields = list(dict.fromkeys(required_fields))
+        # only the first processor can read a shard of the data, the rest read its output
+        self.shard_id = processors[0].shard_id
+        self.num_shards = processors[0].num_shards
+        # if multiple processors write to the same file (e.g. in-place stages),
+        # only the last write has to happen
+        self.materialize = [False] * len(processors)
+        written_files = set()
+        for idx in reversed(range(len(processors))):
+            output_file = os.path.realpath(processors[idx].output_manifest_file)
+            if (idx == len(processors) - 1 or materialize[idx]) and output_file not in written_files:
+                self.materialize[idx] = True
+                written_files.add(output_file)
+
+    def __str__(self):
+        return f"{type(self).__name__}({', '.join(type(processor).__name__ for processor in self.processors)})"
+
+    def process_dataset_entry(self, data_entry):
+        """Applies all processors in sequence, returning ``DataEntry`` objects of the last one."""
+        data_entries = [data_entry]
+        for processor in self.processors:
+            kept_entries = [data_entry.data for data_entry in data_entries if data_entry.data is not None]
+            data_entries = []
+            for entry in kept_entries:
+                data_entries.extend(processor.process_dataset_entry(entry))
+        return data_entries
+
+    def _get_stages(self):
+        return [
+            (processor, processor.output_manifest_file if materialize else None)
+            for processor, materialize in zip(self.processors, self.materialize)
+        ]
+
+    def _process_chunk_by_stage(self, dataset_entries):
+        """Applies all processors in sequence to a chunk of entries, keeping the outputs of each of them.
+
+        Outputs of the processors that don't write them are replaced with
+        ``_CountedEntry``. Entries that are still the same as in the input
+        manifest (all processors so far marked them as ``unmodified``) are
+        replaced with ``_UnmodifiedEntry`` if the input lines can be written
+        as is, so they are neither sent back nor serialized again. The rest
+        are serialized right away as ``_SerializedEntry``, unless only some
+        of their fields were read and they have to be merged with the input
+        lines in the main process.
+        """
+        fields_to_read = self._get_fields_to_read()
+        reducers = [processor.metrics_reducer for processor in self.processors]
+        chunk_metrics = [reducer.initial() for reducer in reducers]
+        chunk_data = [[] for _ in self.processors]
+        last_idx = len(self.processors) - 1
+        for dataset_entry in dataset_entries:
+            # kept entries and whether they are the same as the input entry
+            kept_entries = [(dataset_entry, True)]
+            for idx, (processor, materialize) in enumerate(zip(self.processors, self.materialize)):
+                outputs = []
+                next_kept_entries = []
+                for entry, is_original in kept_entries:
+                    for data_entry in processor.process_dataset_entry(entry):
+                        chunk_metrics[idx] = reducers[idx].combine(chunk_metrics[idx], data_entry.metrics)
+                        data = data_entry.data
+                        if data is None:
+                            continue
+                        is_unmodified = is_original and data_entry.unmodified
+                        next_kept_entries.append((data, is_unmodified))
+                        if not materialize:
+                            outputs.append(_CountedEntry(data.get("duration", 0)))
+                        elif self._pass_through and is_unmodified:
+                            outputs.append(_UnmodifiedEntry(data.get("duration", 0)))
+                        elif fields_to_read is None:
+                            outputs.append(_SerializedEntry(dumps(data), data.get("duration", 0)))
+                        else:
+                            # the next processors can modify the entry in-place
+                            outputs.append(data if idx == last_idx else copy.deepcopy(data))
+                chunk_data[idx].append(outputs)
+                kept_entries = next_kept_entries
+        return chunk_data, chunk_metrics
+
+    def process(self):
+        metrics = self._process_stages()
+        self.number_of_entries = self.processors[-1].number_of_entries
+        self.total_duration = self.processors[-1].total_duration
+        self._finalize_or_defer(metrics)
+
+    def finalize(self, metrics: List):
+        """Calls :meth:`finalize` of each processor with its own metrics."""
+        for processor, processor_metrics in zip(self.processors, metrics):
+            logger.info('=> Finalizing processor "%s"', processor)
+            processor._finalize_or_defer(processor_metrics)
+
+
+def fuse_processors(processors: List[BaseProcessor], materialize: List[bool]) -> List[BaseProcessor]:
+    """Replaces each run of consecutive per-entry processors with a single fused processor.
+
+    Processors are fused if they can be fused (see :func:`can_be_fused`) and
+    each next processor reads the output of the previous one.
+
+    Args:
+        processors (list): all processors in the order they will be run.
+        materialize (list[bool]): whether the output manifest of each processor
+            has to be written (e.g., since it was explicitly specified in the
+            config). Outputs of the non-fused processors are always written.
+
+    Returns:
+        list: new list of processors.
+    """
+    fused = []
+    group = []
+
+    def flush_group():
+        if len(group) == 1:
+            fused.append(processors[group[0]])
+        elif len(group) > 1:
+            fused.append(
+                FusedParallelProcessor([processors[idx] for idx in group], [materialize[idx] for idx in group])
+            )
+        group.clear()
+
+    for idx, processor in enumerate(processors):
+        if group and not (
+            can_be_fused(processor)
+            and os.path.realpath(processor.input_manifest_file)
+            == os.path.realpath(processors[group[-1]].output_manifest_file)
+        ):
+            flush_group()
+        if can_be_fused(processor):
+            group.append(idx)
+        else:
+            fused.append(processor)
+    flush_group()
+    return fused
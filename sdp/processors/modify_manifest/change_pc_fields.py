@@ -24,6 +24,8 @@ class ChangePCFields(BaseParallelProcessor):
     with either "original" or "synthetic".
     """
 
+    execution_mode = "auto"
+
     def __init__(
         self,
         **kwargs,
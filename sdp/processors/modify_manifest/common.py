@@ -1,4 +1,3 @@
-import json
 import os
 from typing import Dict, List
 
@@ -9,6 +8,10 @@ from sdp.processors.base_processor import (
     BaseProcessor,
     DataEntry,
 )
+from sdp.utils.columnar import is_columnar
+from sdp.utils.compression import is_compressed
+from sdp.utils.manifest_index import IndexedManifest
+from sdp.utils.manifest_io import iter_manifest, load_manifest, write_manifest
 
 
 class AddConstantFields(BaseParallelProcessor):
@@ -26,6 +29,8 @@ class AddConstantFields(BaseParallelProcessor):
             }
     """
 
+    execution_mode = "auto"
+
     def __init__(
         self,
         fields: Dict,
@@ -51,6 +56,8 @@ class DuplicateFields(BaseParallelProcessor):
             are the new names of the duplicate fields.
     """
 
+    execution_mode = "auto"
+
     def __init__(
         self,
         duplicate_fields: Dict,
@@ -78,6 +85,8 @@ class RenameFields(BaseParallelProcessor):
             are the new names of the fields.
     """
 
+    execution_mode = "auto"
+
     def __init__(
         self,
         rename_fields: Dict,
@@ -156,6 +165,8 @@ class ChangeToRelativePath(BaseParallelProcessor):
             stored. All passes will be relative to that folder.
     """
 
+    execution_mode = "auto"
+
     def __init__(
         self,
         base_dir: str,
@@ -182,8 +193,13 @@ class SortManifest(BaseProcessor):
         descending: if set to False (default), attribute will be in ascending order.
             If True, attribute will be in descending order.
 
+    Unless the manifest is columnar or compressed, only the values of
+    the sort attribute are kept in memory and the entries are read again in
+    the sorted order with :class:`sdp.utils.manifest_index.IndexedManifest`.
     """
 
+    is_barrier = True
+
     def __init__(
         self, output_manifest_file: str, input_manifest_file: str, attribute_sort_by: str, descending: bool = True
     ):
@@ -193,14 +209,18 @@ class SortManifest(BaseProcessor):
         self.descending = descending
 
     def process(self):
-        with open(self.input_manifest_file, "rt", encoding="utf8") as fin:
-            dataset_entries = [json.loads(line) for line in fin.readlines()]
-
-        dataset_entries = sorted(dataset_entries, key=lambda x: x[self.attribute_sort_by], reverse=self.descending)
+        # output is written to a temporary file, so it's safe to read the input while sorting in-place
+        if is_columnar(self.input_manifest_file) or is_compressed(self.input_manifest_file):
+            dataset_entries = load_manifest(self.input_manifest_file)
+            dataset_entries = sorted(dataset_entries, key=lambda x: x[self.attribute_sort_by], reverse=self.descending)
+            write_manifest(self.output_manifest_file, dataset_entries)
+            return
 
-        with open(self.output_manifest_file, "wt", encoding="utf8") as fout:
-            for line in dataset_entries:
-                fout.write(json.dumps(line) + "\n")
+        # only keeping the sort keys in memory and reading the entries again in the sorted order
+        with IndexedManifest(self.input_manifest_file) as manifest:
+            sort_keys = [entry[self.attribute_sort_by] for entry in manifest]
+            order = sorted(range(len(sort_keys)), key=sort_keys.__getitem__, reverse=self.descending)
+            write_manifest(self.output_manifest_file, (manifest[idx] for idx in order))
 
 
 class WriteManifest(BaseProcessor):
@@ -217,10 +237,10 @@ class WriteManifest(BaseProcessor):
         self.fields_to_save = fields_to_save
 
     def process(self):
-        with open(self.input_manifest_file, "rt", encoding="utf8") as fin, open(
-            self.output_manifest_file, "wt", encoding="utf8"
-        ) as fout:
-            for line in tqdm(fin):
-                line = json.loads(line)
-                new_line = {field: line[field] for field in self.fields_to_save}
-                fout.write(json.dumps(new_line) + "\n")
+        write_manifest(
+            self.output_manifest_file,
+            (
+                {field: line[field] for field in self.fields_to_save}
+                for line in tqdm(iter_manifest(self.input_manifest_file))
+            ),
+        )
@@ -13,14 +13,14 @@
 # limitations under the License.
 
 import collections
-import re
 from typing import Dict, List
 
 from sdp.logging import logger
 from sdp.processors.base_processor import DataEntry
 from sdp.processors.modify_manifest.modify_manifest import ModifyManifestTextProcessor
 from sdp.utils.edit_spaces import add_start_end_spaces
-from sdp.utils.get_diff import get_diff_with_subs_grouped
+from sdp.utils.reducers import CounterReducer
+from sdp.utils.regex_utils import RegexSubstitutions
 
 
 class InsIfASRInsertion(ModifyManifestTextProcessor):
@@ -38,6 +38,8 @@ class InsIfASRInsertion(ModifyManifestTextProcessor):
             e.g. [' nemo', 'nemo ', ' nemo '].
     """
 
+    metrics_reducer = CounterReducer()
+
     def __init__(
         self,
         insert_words: List[str],
@@ -51,8 +53,8 @@ class InsIfASRInsertion(ModifyManifestTextProcessor):
         for insert_word in self.insert_words:
             if not insert_word in data_entry[self.pred_text_key]:
                 break
-            orig_words, pred_words = data_entry[self.text_key], data_entry[self.pred_text_key]
-            diff = get_diff_with_subs_grouped(orig_words, pred_words)
+            # recomputed only if the text was changed for the previous word
+            diff = self._get_diff(data_entry, subs_grouped=True)
 
             if len(diff) > 0:  # ie if there are differences between text and pred_text
                 new_sent = ""
@@ -80,12 +82,8 @@ class InsIfASRInsertion(ModifyManifestTextProcessor):
         return [DataEntry(data=data_entry, metrics=insert_word_counter)]
 
     def finalize(self, metrics):
-        total_counter = collections.defaultdict(int)
-        for counter in metrics:
-            for word, count in counter.items():
-                total_counter[word] += count
         logger.info("Num of words that were inserted")
-        for word, count in total_counter.items():
+        for word, count in metrics.items():
             logger.info(f"{word} {count}")
         super().finalize(metrics)
 
@@ -112,6 +110,8 @@ class SubIfASRSubstitution(ModifyManifestTextProcessor):
                 sub_words = {"nmo" : "nemo"}
     """
 
+    metrics_reducer = CounterReducer()
+
     def __init__(
         self,
         sub_words: Dict,
@@ -125,8 +125,8 @@ class SubIfASRSubstitution(ModifyManifestTextProcessor):
         for original_word, new_word in self.sub_words.items():
             if not original_word in data_entry[self.text_key]:
                 break
-            orig_words, pred_words = data_entry[self.text_key], data_entry[self.pred_text_key]
-            diff = get_diff_with_subs_grouped(orig_words, pred_words)
+            # recomputed only if the text was changed for the previous word
+            diff = self._get_diff(data_entry, subs_grouped=True)
 
             if len(diff) > 0:  # ie if there are differences between text and pred_text
                 new_sent = ""
@@ -160,12 +160,8 @@ class SubIfASRSubstitution(ModifyManifestTextProcessor):
         return [DataEntry(data=data_entry, metrics=sub_word_counter)]
 
     def finalize(self, metrics):
-        total_counter = collections.defaultdict(int)
-        for counter in metrics:
-            for word, count in counter.items():
-                total_counter[word] += count
         logger.info("Num of words that were substituted")
-        for word, count in total_counter.items():
+        for word, count in metrics.items():
             logger.info(f"{word} {count}")
         super().finalize(metrics)
 
@@ -200,8 +196,13 @@ class SubRegex(ModifyManifestTextProcessor):
             This processor will go through the list in order, and apply a ``re.sub`` operation on
             the input text in ``data_entry[self.text_key]``, feeding in the specified ``pattern``, ``repl``
             and ``count`` parameters to ``re.sub``.
+            All patterns are compiled once and consecutive substitutions of
+            single characters are applied together (see
+            :class:`sdp.utils.regex_utils.RegexSubstitutions`).
     """
 
+    metrics_reducer = CounterReducer()
+
     def __init__(
         self,
         regex_params_list: List[Dict],
@@ -220,38 +221,22 @@ class SubRegex(ModifyManifestTextProcessor):
                 raise ValueError(
                     f"Need to have key 'repl' in all entries of `regex_params_list`: {self.regex_params_list}"
                 )
+        self.substitutions = RegexSubstitutions(self.regex_params_list)
 
     def _process_dataset_entry(self, data_entry) -> List:
         """Replaces each found regex match with a given string."""
         replace_word_counter = collections.defaultdict(int)
 
-        text_in = data_entry[self.text_key]
-
-        for regex_params in self.regex_params_list:
-            text_out = re.sub(
-                pattern=regex_params["pattern"],
-                repl=regex_params["repl"],
-                string=text_in,
-                # note: this count param is the maximum number of pattern occurrences to be replaced.
-                count=regex_params.get("count", 0),
-            )
-
-            if text_in != text_out:
-                replace_word_counter[regex_params["pattern"]] += 1
-            text_in = text_out
-
-        data_entry[self.text_key] = text_out
+        data_entry[self.text_key], changed_patterns = self.substitutions(data_entry[self.text_key])
+        for pattern in changed_patterns:
+            replace_word_counter[pattern] += 1
 
         return [DataEntry(data=data_entry, metrics=replace_word_counter)]
 
     def finalize(self, metrics):
         """Reports how many substitutions were made for each pattern."""
-        total_counter = collections.defaultdict(int)
-        for counter in metrics:
-            for word, count in counter.items():
-                total_counter[word] += count
         logger.info("Number of utterances which applied substitutions for the following patterns:")
-        total_counter_sorted = dict(sorted(total_counter.items(), key=lambda x: x[1], reverse=True))
+        total_counter_sorted = dict(sorted(metrics.items(), key=lambda x: x[1], reverse=True))
         for word, count in total_counter_sorted.items():
             logger.info(f"{word} {count}")
         super().finalize(metrics)
@@ -13,21 +13,21 @@
 # limitations under the License.
 
 import collections
-import re
 from typing import List
 
 from sdp.logging import logger
 from sdp.processors.base_processor import DataEntry
 from sdp.processors.modify_manifest.modify_manifest import ModifyManifestTextProcessor
 from sdp.utils.edit_spaces import remove_extra_spaces
-from sdp.utils.get_diff import get_diff, get_diff_with_subs_grouped
 from sdp.utils.metrics_computation import (
-    get_cer,
     get_charrate,
-    get_wer,
     get_wmr,
     get_wordrate,
+    is_cer_above,
+    is_wer_above,
 )
+from sdp.utils.reducers import CounterReducer, CountValuesReducer, SumReducer
+from sdp.utils.regex_utils import RegexMatcher
 
 
 class DropHighLowCharrate(ModifyManifestTextProcessor):
@@ -46,6 +46,8 @@ class DropHighLowCharrate(ModifyManifestTextProcessor):
             the utterance will be dropped.
     """
 
+    metrics_reducer = SumReducer((0, 0))
+
     def __init__(
         self,
         high_charrate_threshold: float,
@@ -56,6 +58,7 @@ class DropHighLowCharrate(ModifyManifestTextProcessor):
 
         self.high_charrate_threshold = high_charrate_threshold
         self.low_charrate_threshold = low_charrate_threshold
+        self.required_fields = self._get_required_fields("duration")
 
     def _process_dataset_entry(self, data_entry) -> List:
         """Drops utterances based on the provided thresholds."""
@@ -65,15 +68,11 @@ class DropHighLowCharrate(ModifyManifestTextProcessor):
         elif charrate < self.low_charrate_threshold:
             return [DataEntry(data=None, metrics=(1, 0))]
 
-        return [DataEntry(data=data_entry, metrics=(0, 0))]
+        return [DataEntry(data=data_entry, metrics=(0, 0), unmodified=True)]
 
     def finalize(self, metrics):
         """Will report how many utterances were dropped for each threshold."""
-        high_drop_counter = 0
-        low_drop_counter = 0
-        for dropped_low, dropped_high in metrics:
-            low_drop_counter += dropped_low
-            high_drop_counter += dropped_high
+        low_drop_counter, high_drop_counter = metrics
         logger.info(
             "Num of utterances that were dropped due to char rate > %f: %d",
             self.high_charrate_threshold,
@@ -105,6 +104,8 @@ class DropHighLowWordrate(ModifyManifestTextProcessor):
             the utterance will be dropped.
     """
 
+    metrics_reducer = SumReducer((0, 0))
+
     def __init__(
         self,
         high_wordrate_threshold: float,
@@ -115,6 +116,7 @@ class DropHighLowWordrate(ModifyManifestTextProcessor):
 
         self.high_wordrate_threshold = high_wordrate_threshold
         self.low_wordrate_threshold = low_wordrate_threshold
+        self.required_fields = self._get_required_fields("duration")
 
     def _process_dataset_entry(self, data_entry) -> List:
         wordrate = get_wordrate(data_entry[self.text_key], data_entry["duration"])
@@ -123,14 +125,10 @@ class DropHighLowWordrate(ModifyManifestTextProcessor):
         elif wordrate < self.low_wordrate_threshold:
             return [DataEntry(data=None, metrics=(1, 0))]
 
-        return [DataEntry(data=data_entry, metrics=(0, 0))]
+        return [DataEntry(data=data_entry, metrics=(0, 0), unmodified=True)]
 
     def finalize(self, metrics):
-        high_drop_counter = 0
-        low_drop_counter = 0
-        for dropped_low, dropped_high in metrics:
-            low_drop_counter += dropped_low
-            high_drop_counter += dropped_high
+        low_drop_counter, high_drop_counter = metrics
         logger.info(
             "Num of utterances that were dropped due to word rate > %f: %d",
             self.high_wordrate_threshold,
@@ -158,6 +156,8 @@ class DropHighLowDuration(ModifyManifestTextProcessor):
             the utterance will be dropped.
     """
 
+    metrics_reducer = SumReducer((0, 0))
+
     def __init__(
         self,
         high_duration_threshold: float,
@@ -167,6 +167,7 @@ class DropHighLowDuration(ModifyManifestTextProcessor):
         super().__init__(**kwargs)
         self.high_duration_threshold = high_duration_threshold
         self.low_duration_threshold = low_duration_threshold
+        self.required_fields = self._get_required_fields("duration")
         self.high_drop_counter = 0
         self.low_drop_counter = 0
 
@@ -177,14 +178,10 @@ class DropHighLowDuration(ModifyManifestTextProcessor):
         elif duration < self.low_duration_threshold:
             return [DataEntry(data=None, metrics=(1, 0))]
 
-        return [DataEntry(data=data_entry, metrics=(0, 0))]
+        return [DataEntry(data=data_entry, metrics=(0, 0), unmodified=True)]
 
     def finalize(self, metrics):
-        high_drop_counter = 0
-        low_drop_counter = 0
-        for dropped_low, dropped_high in metrics:
-            low_drop_counter += dropped_low
-            high_drop_counter += dropped_high
+        low_drop_counter, high_drop_counter = metrics
         logger.info(
             "Num of utterances that were dropped due to duration > %f: %d",
             self.high_duration_threshold,
@@ -205,8 +202,11 @@ class DropIfNoneOfRegexMatch(ModifyManifestTextProcessor):
     Args:
         regex_patterns: a list of strings. If data_entry[self.attribute] does not match any
             of the regex patterns in the list, that utterance will be dropped.
+            Patterns are checked in the same way as in :class:`DropIfRegexMatch`.
     """
 
+    metrics_reducer = SumReducer()
+
     def __init__(
         self,
         regex_patterns: List[str],
@@ -214,24 +214,18 @@ class DropIfNoneOfRegexMatch(ModifyManifestTextProcessor):
     ):
         super().__init__(**kwargs)
         self.regex_patterns = regex_patterns
+        self.matcher = RegexMatcher(self.regex_patterns)
 
     def _process_dataset_entry(self, data_entry) -> List:
-        for regex_pattern in self.regex_patterns:
-            if re.search(regex_pattern, data_entry[self.text_key]):
-                break
-        else:  # will only reach this if none of the regex match
+        if not self.matcher.matches_any(data_entry[self.text_key]):
             return [DataEntry(data=None, metrics=1)]
 
         # will reach this part of code if at least one of the regexes matches
-        return [DataEntry(data=data_entry, metrics=0)]
+        return [DataEntry(data=data_entry, metrics=0, unmodified=True)]
 
     def finalize(self, metrics):
-        total_counter = 0
-        for value in metrics:
-            if value:
-                total_counter += value
         logger.info("Num of utterances that were dropped due to not containing any of the specified regex patterns")
-        logger.info(f"{total_counter}")
+        logger.info(f"{metrics}")
         super().finalize(metrics)
 
 
@@ -248,6 +242,8 @@ class DropNonAlphabet(ModifyManifestTextProcessor):
             want to make sure none of the utterances contain spaces.
     """
 
+    metrics_reducer = CounterReducer()
+
     def __init__(
         self,
         alphabet: str,
@@ -265,15 +261,11 @@ class DropNonAlphabet(ModifyManifestTextProcessor):
                 non_alphabet_counter[char] += 1
         if drop_this_utt:
             return [DataEntry(data=None, metrics=non_alphabet_counter)]
-        return [DataEntry(data=data_entry, metrics=non_alphabet_counter)]
+        return [DataEntry(data=data_entry, metrics=non_alphabet_counter, unmodified=True)]
 
     def finalize(self, metrics):
-        total_counter = collections.defaultdict(int)
-        for counter in metrics:
-            for char, value in counter.items():
-                total_counter[char] += value
         logger.info("Num of non-alphabet characters")
-        for char, count in total_counter.items():
+        for char, count in metrics.items():
             logger.info(f"{char}: {count}")
         super().finalize(metrics)
 
@@ -298,6 +290,8 @@ class DropASRErrorBeginningEnd(ModifyManifestTextProcessor):
             end_error_char_threshold.
     """
 
+    metrics_reducer = SumReducer((0, 0))
+
     def __init__(
         self,
         beginning_error_char_threshold: int,
@@ -309,15 +303,10 @@ class DropASRErrorBeginningEnd(ModifyManifestTextProcessor):
         self.end_error_char_threshold = end_error_char_threshold
 
     def _process_dataset_entry(self, data_entry) -> List:
-        orig_words, pred_words = data_entry[self.text_key], data_entry[self.pred_text_key]
-
-        # remove spaces at start and end. Otherwise all utterances
-        # will have no errors at the begining (because both self.text_key
-        # and self.pred_text_key will begin with " ")
-        orig_words = remove_extra_spaces(orig_words)
-        pred_words = remove_extra_spaces(pred_words)
-
-        diff = get_diff_with_subs_grouped(orig_words, pred_words)
+        # extra spaces are removed inside, otherwise all utterances would have
+        # no errors at the begining (because both self.text_key and
+        # self.pred_text_key begin with " ")
+        diff = self._get_diff(data_entry, subs_grouped=True)
 
         if len(diff) > 0:  # i.e. if there are differences between text and pred_text
             first_diff_entry = diff[0]
@@ -340,14 +329,10 @@ class DropASRErrorBeginningEnd(ModifyManifestTextProcessor):
                 if abs(len_deletion - len_insertion) > self.end_error_char_threshold:
                     return [DataEntry(data=None, metrics=(0, 1))]
 
-        return [DataEntry(data=data_entry, metrics=(0, 0))]
+        return [DataEntry(data=data_entry, metrics=(0, 0), unmodified=True)]
 
     def finalize(self, metrics):
-        beginning_drop_counter = 0
-        end_drop_counter = 0
-        for dropped_beginning, dropped_end in metrics:
-            beginning_drop_counter += dropped_beginning
-            end_drop_counter += dropped_end
+        beginning_drop_counter, end_drop_counter = metrics
         logger.info(
             "Num of utterances that were dropped due to asr " "insertions/deletions at the beginning: %d",
             beginning_drop_counter,
@@ -379,8 +364,7 @@ class DropASRError(ModifyManifestTextProcessor):
         self.consecutive_words_threshold = consecutive_words_threshold
 
     def _process_dataset_entry(self, data_entry) -> List:
-        orig_words, pred_words = data_entry[self.text_key], data_entry[self.pred_text_key]
-        diffs = get_diff(orig_words, pred_words)
+        diffs = self._get_diff(data_entry)
 
         for diff_entry in diffs:
             if diff_entry[0] == 0:
@@ -388,7 +372,7 @@ class DropASRError(ModifyManifestTextProcessor):
             if len(diff_entry[1].split()) >= self.consecutive_words_threshold:
                 return []
 
-        return [DataEntry(data=data_entry)]
+        return [DataEntry(data=data_entry, unmodified=True)]
 
 
 class DropHighCER(ModifyManifestTextProcessor):
@@ -403,6 +387,8 @@ class DropHighCER(ModifyManifestTextProcessor):
         cer_thershold: CER threshold above which the utterance will be dropped.
     """
 
+    metrics_reducer = SumReducer()
+
     def __init__(
         self,
         cer_threshold: float,
@@ -412,23 +398,21 @@ class DropHighCER(ModifyManifestTextProcessor):
         self.cer_threshold = cer_threshold
 
     def _process_dataset_entry(self, data_entry) -> List:
-        cer = get_cer(
+        # only the decision is needed, so the exact CER is not computed
+        if is_cer_above(
             remove_extra_spaces(data_entry[self.text_key]),
             remove_extra_spaces(data_entry[self.pred_text_key]),
-        )
-        if cer > self.cer_threshold:
+            self.cer_threshold,
+        ):
             return [DataEntry(data=None, metrics=1)]
         else:
-            return [DataEntry(data=data_entry, metrics=0)]
+            return [DataEntry(data=data_entry, metrics=0, unmodified=True)]
 
     def finalize(self, metrics):
-        drop_counter = 0
-        for dropped in metrics:
-            drop_counter += dropped
         logger.info(
             "Num of utterances that were dropped due to CER > %d: %d",
             self.cer_threshold,
-            drop_counter,
+            metrics,
         )
         super().finalize(metrics)
 
@@ -445,6 +429,8 @@ class DropHighWER(ModifyManifestTextProcessor):
         wer_thershold: WER threshold above which the utterance will be dropped.
     """
 
+    metrics_reducer = SumReducer()
+
     def __init__(
         self,
         wer_threshold: float,
@@ -454,20 +440,16 @@ class DropHighWER(ModifyManifestTextProcessor):
         self.wer_threshold = wer_threshold
 
     def _process_dataset_entry(self, data_entry) -> List:
-        wer = get_wer(data_entry[self.text_key], data_entry[self.pred_text_key])
-        if wer > self.wer_threshold:
+        if is_wer_above(data_entry[self.text_key], data_entry[self.pred_text_key], self.wer_threshold):
             return [DataEntry(data=None, metrics=1)]
         else:
-            return [DataEntry(data=data_entry, metrics=0)]
+            return [DataEntry(data=data_entry, metrics=0, unmodified=True)]
 
     def finalize(self, metrics):
-        drop_counter = 0
-        for dropped in metrics:
-            drop_counter += dropped
         logger.info(
             "Num of utterances that were dropped due to WER > %d: %d",
             self.wer_threshold,
-            drop_counter,
+            metrics,
         )
         super().finalize(metrics)
 
@@ -484,6 +466,8 @@ class DropLowWordMatchRate(ModifyManifestTextProcessor):
         wmr_thershold: WMR threshold below which the utterance will be dropped.
     """
 
+    metrics_reducer = SumReducer()
+
     def __init__(
         self,
         wmr_threshold: float,
@@ -500,16 +484,13 @@ class DropLowWordMatchRate(ModifyManifestTextProcessor):
         if wmr < self.wmr_threshold:
             return [DataEntry(data=None, metrics=1)]
         else:
-            return [DataEntry(data=data_entry, metrics=0)]
+            return [DataEntry(data=data_entry, metrics=0, unmodified=True)]
 
     def finalize(self, metrics):
-        drop_counter = 0
-        for dropped in metrics:
-            drop_counter += dropped
         logger.info(
             "Num of utterances that were dropped due to WMR < %d: %d",
             self.wmr_threshold,
-            drop_counter,
+            metrics,
         )
         super().finalize(metrics)
 
@@ -522,8 +503,14 @@ class DropIfRegexMatch(ModifyManifestTextProcessor):
     Args:
         regex_patterns: a list of strings. The list will be traversed in order.
             If data_entry.data[self.text_key] matches the regex, the entry will be dropped.
+            The number of matches of the first matching pattern is reported
+            in :meth:`finalize`. Patterns are precompiled and most of them are
+            rejected with a substring search for the literals they require
+            (see :class:`sdp.utils.regex_utils.RegexMatcher`).
     """
 
+    metrics_reducer = CounterReducer()
+
     def __init__(
         self,
         regex_patterns: List[str],
@@ -531,23 +518,20 @@ class DropIfRegexMatch(ModifyManifestTextProcessor):
     ):
         super().__init__(**kwargs)
         self.regex_patterns = regex_patterns
+        self.matcher = RegexMatcher(self.regex_patterns)
 
     def _process_dataset_entry(self, data_entry) -> List:
         drop_counter = collections.defaultdict(int)
-        for regex_pattern in self.regex_patterns:
-            if re.search(regex_pattern, data_entry[self.text_key]):
-                for match in re.finditer(regex_pattern, data_entry[self.text_key]):
-                    drop_counter[regex_pattern] += 1
-                return [DataEntry(data=None, metrics=drop_counter)]
-        return [DataEntry(data=data_entry, metrics=drop_counter)]
+        text = data_entry[self.text_key]
+        idx = self.matcher.first_match(text)
+        if idx is not None:
+            drop_counter[self.regex_patterns[idx]] += self.matcher.count_matches(idx, text)
+            return [DataEntry(data=None, metrics=drop_counter)]
+        return [DataEntry(data=data_entry, metrics=drop_counter, unmodified=True)]
 
     def finalize(self, metrics):
-        total_counter = collections.defaultdict(int)
-        for counter in metrics:
-            for attribute, value in counter.items():
-                total_counter[attribute] += value
         logger.info("Regex matches that were dropped in attribute")
-        for attribute, matches in total_counter.items():
+        for attribute, matches in metrics.items():
             logger.info(f"{attribute}, {matches}")
         super().finalize(metrics)
 
@@ -565,6 +549,9 @@ class DropOnAttribute(ModifyManifestTextProcessor):
     # TODO: maybe need not to subclass from the base here, because text_key/pred_text_key are not used.
     #    But still want to leverage test-cases functionality. Probably need some redesign of API here.
 
+    metrics_reducer = SumReducer()
+    execution_mode = "auto"
+
     def __init__(
         self,
         key: str,
@@ -574,17 +561,15 @@ class DropOnAttribute(ModifyManifestTextProcessor):
         super().__init__(**kwargs)
         self.key = key
         self.drop_if_false = drop_if_false
+        self.required_fields = self._get_required_fields(key)
 
     def _process_dataset_entry(self, data_entry) -> List:
         if data_entry[self.key] is not self.drop_if_false:
             return [DataEntry(data=None, metrics=1)]
-        return [DataEntry(data=data_entry, metrics=0)]
+        return [DataEntry(data=data_entry, metrics=0, unmodified=True)]
 
     def finalize(self, metrics):
-        total_counter = 0
-        for counter in metrics:
-            total_counter += counter
-        logger.info("Dropped %d utterances", total_counter)
+        logger.info("Dropped %d utterances", metrics)
         super().finalize(metrics)
 
 
@@ -602,6 +587,8 @@ class DropIfSubstringInInsertion(ModifyManifestTextProcessor):
             be dropped.
     """
 
+    metrics_reducer = CountValuesReducer()
+
     def __init__(
         self,
         substrings_in_insertion: List[str],
@@ -611,24 +598,21 @@ class DropIfSubstringInInsertion(ModifyManifestTextProcessor):
         self.substrings_in_insertion = substrings_in_insertion
 
     def _process_dataset_entry(self, data_entry) -> List:
+        diff = None
         for substring_in_insertion in self.substrings_in_insertion:
             if substring_in_insertion in data_entry[self.pred_text_key]:
-                orig_words, pred_words = data_entry[self.text_key], data_entry[self.pred_text_key]
-                diff = get_diff_with_subs_grouped(orig_words, pred_words)
+                if diff is None:  # only computing the diff if any of the substrings can be in an insertion
+                    diff = self._get_diff(data_entry, subs_grouped=True)
 
                 for diff_entry in diff:
                     if diff_entry[0] == 1:  # insertion in original string
                         if substring_in_insertion in diff_entry[1]:
                             return [DataEntry(data=None, metrics=diff_entry[1])]
-        return [DataEntry(data=data_entry, metrics="")]
+        return [DataEntry(data=data_entry, metrics="", unmodified=True)]
 
     def finalize(self, metrics):
-        total_counter = collections.defaultdict(int)
-        for diff_entry in metrics:
-            if diff_entry:
-                total_counter[diff_entry] += 1
         logger.info("Some of the insertions that cause the utterance to be dropped:")
-        total_counter_sorted = dict(sorted(total_counter.items(), key=lambda x: x[1], reverse=True))
+        total_counter_sorted = dict(sorted(metrics.items(), key=lambda x: x[1], reverse=True))
 
         for insertion, count in total_counter_sorted.items():
             logger.info(f"{insertion}, {count}")
@@ -18,6 +18,7 @@ from typing import List
 from sdp.logging import logger
 from sdp.processors.base_processor import DataEntry
 from sdp.processors.modify_manifest.modify_manifest import ModifyManifestTextProcessor
+from sdp.utils.reducers import CounterReducer
 
 
 class MakeLettersUppercaseAfterPeriod(ModifyManifestTextProcessor):
@@ -28,6 +29,8 @@ class MakeLettersUppercaseAfterPeriod(ModifyManifestTextProcessor):
             Defaults to ".!?".
     """
 
+    metrics_reducer = CounterReducer()
+
     def __init__(
         self,
         punctuation=".!?",
@@ -63,12 +66,8 @@ class MakeLettersUppercaseAfterPeriod(ModifyManifestTextProcessor):
         return [DataEntry(data=data_entry, metrics=replace_word_counter)]
 
     def finalize(self, metrics):
-        total_counter = collections.defaultdict(int)
-        for counter in metrics:
-            for word, count in counter.items():
-                total_counter[word] += count
         logger.info("Some of the substrings that were uppercased")
-        total_counter_sorted = dict(sorted(total_counter.items(), key=lambda x: x[1], reverse=True))
+        total_counter_sorted = dict(sorted(metrics.items(), key=lambda x: x[1], reverse=True))
         for word, count in total_counter_sorted.items():
             if count > 1:
                 logger.info(f"{word} {count}")
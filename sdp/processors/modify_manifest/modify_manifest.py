@@ -18,6 +18,12 @@ from typing import Dict, List, Optional
 
 from sdp.processors.base_processor import BaseParallelProcessor
 from sdp.utils.edit_spaces import add_start_end_spaces, remove_extra_spaces
+from sdp.utils.get_diff import (
+    deserialize_diff,
+    get_diff,
+    group_substitutions,
+    serialize_diff,
+)
 
 # TODO: maybe remove additional spaces for simpler logic? Why is it necessary
 #       for regular expressions?
@@ -46,6 +52,13 @@ class ModifyManifestTextProcessor(BaseParallelProcessor):
             containing data which is our test's input manifest line, and a key
             ``output``, the value of which is a dictionary containing data which is
             the expected output manifest line.
+        alignment_key (str): an optional key where the word-level alignment
+            of ``text_key`` and ``pred_text_key`` is saved by the processors
+            that compare them (e.g. :class:`sdp.processors.DropASRError`).
+            The next such processors reuse the saved alignment while the
+            words of both texts stay the same, instead of recomputing it.
+            Within a process, alignments of the recently compared texts are
+            reused even if they are not saved. Defaults to None.
 
     .. note::
         This class only supports one-to-one or one-to-none mappings.
@@ -57,12 +70,14 @@ class ModifyManifestTextProcessor(BaseParallelProcessor):
         text_key: str = "text",
         pred_text_key: str = "pred_text",
         test_cases: Optional[List[Dict]] = None,
+        alignment_key: Optional[str] = None,
         **kwargs,
     ):
         super().__init__(**kwargs)
         self.text_key = text_key
         self.pred_text_key = pred_text_key
         self.test_cases = test_cases
+        self.alignment_key = alignment_key
         # need to convert to list to avoid errors in iteration over None
         if self.test_cases is None:
             self.test_cases = []
@@ -76,6 +91,9 @@ class ModifyManifestTextProcessor(BaseParallelProcessor):
                 generated_output = generated_outputs[0].data
             else:
                 generated_output = None
+            # saved alignment is an implementation detail, unless the test checks it explicitly
+            if self.alignment_key is not None and self.alignment_key not in (test_case["output"] or {}):
+                (generated_output or {}).pop(self.alignment_key, None)
             if generated_output != test_case["output"]:
                 raise RuntimeError(
                     "Runtime test failed.\n"
@@ -84,6 +102,34 @@ class ModifyManifestTextProcessor(BaseParallelProcessor):
                     f"Expected output: {test_case['output']}"
                 )
 
+    def _get_required_fields(self, *fields: str) -> List[str]:
+        """Returns ``required_fields`` for a processor that uses ``fields``.
+
+        Text keys are always included, since extra spaces are removed from
+        them in :meth:`process_dataset_entry`, as well as ``alignment_key``,
+        which can be read and updated by :meth:`_get_diff`.
+        """
+        if self.alignment_key is not None:
+            fields = (*fields, self.alignment_key)
+        return [*fields, self.text_key, self.pred_text_key]
+
+    def _get_diff(self, data_entry: Dict, subs_grouped: bool = False) -> List[tuple]:
+        """Returns word-level diffs of ``text_key`` and ``pred_text_key``.
+
+        Uses the alignment saved in ``alignment_key`` if it's still valid, and
+        saves the new alignment otherwise. See :func:`sdp.utils.get_diff.get_diff`
+        and :func:`sdp.utils.get_diff.get_diff_with_subs_grouped` for the format.
+        """
+        orig_words, pred_words = data_entry[self.text_key], data_entry[self.pred_text_key]
+        diffs = None
+        if self.alignment_key is not None and self.alignment_key in data_entry:
+            diffs = deserialize_diff(data_entry[self.alignment_key], orig_words, pred_words)
+        if diffs is None:
+            diffs = get_diff(orig_words, pred_words)
+            if self.alignment_key is not None:
+                data_entry[self.alignment_key] = serialize_diff(orig_words, pred_words, diffs)
+        return group_substitutions(diffs) if subs_grouped else diffs
+
     @abstractmethod
     def _process_dataset_entry(self, data_entry):
         """Main data processing should be implemented here.
@@ -104,6 +150,9 @@ class ModifyManifestTextProcessor(BaseParallelProcessor):
         the extra spaces are removed. This includes the spaces in the beginning
         and end of the text, as well as any double spaces ``"  "``.
         """
+        original_texts = [data_entry.get(self.text_key), data_entry.get(self.pred_text_key)]
+        if self.alignment_key is not None:
+            original_texts.append(data_entry.get(self.alignment_key))
         # handle spaces
         if self.text_key in data_entry:
             data_entry[self.text_key] = add_start_end_spaces(data_entry[self.text_key])
@@ -122,5 +171,12 @@ class ModifyManifestTextProcessor(BaseParallelProcessor):
                 data_entries[0].data[self.pred_text_key] = remove_extra_spaces(
                     data_entries[0].data[self.pred_text_key]
                 )
+            if data_entries[0].unmodified:
+                # removing extra spaces could have changed the text
+                data = data_entries[0].data
+                texts = [data.get(self.text_key), data.get(self.pred_text_key)]
+                if self.alignment_key is not None:
+                    texts.append(data.get(self.alignment_key))
+                data_entries[0].unmodified = texts == original_texts
 
         return data_entries
@@ -12,20 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
-from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Optional
 
 from sdp.processors.base_processor import BaseProcessor
-
-
-def load_manifest(manifest: Path) -> List[Dict[str, Union[str, float]]]:
-    result = []
-    with manifest.open() as f:
-        for i, line in enumerate(f):
-            data = json.loads(line)
-            result.append(data)
-    return result
+from sdp.utils.manifest_io import load_manifest, write_manifest
 
 
 class PCInference(BaseProcessor):
@@ -84,7 +74,7 @@ class PCInference(BaseProcessor):
         else:
             model = model.to(self.device)
 
-        manifest = load_manifest(Path(self.input_manifest_file))
+        manifest = load_manifest(self.input_manifest_file)
 
         texts = []
         for item in manifest:
@@ -94,8 +84,6 @@ class PCInference(BaseProcessor):
             texts,
             batch_size=self.batch_size,
         )
-        Path(self.output_manifest_file).parent.mkdir(exist_ok=True, parents=True)
-        with Path(self.output_manifest_file).open('w') as f:
-            for item, t in zip(manifest, processed_texts):
-                item[self.output_text_field] = t
-                f.write(json.dumps(item) + '\n')
+        for item, t in zip(manifest, processed_texts):
+            item[self.output_text_field] = t
+        write_manifest(self.output_manifest_file, manifest)
@@ -14,8 +14,13 @@
 
 import contextlib
 import glob
+import gzip
+import io
 import json
+import lzma
 import os
+import shutil
+import tempfile
 from dataclasses import dataclass, is_dataclass
 from pathlib import Path
 from typing import Optional
@@ -111,6 +116,44 @@ class TranscriptionConfig:
     rnnt_decoding: RNNTDecodingConfig = RNNTDecodingConfig(fused_batch_size=-1)
 
 
+def open_manifest(path: str, mode: str):
+    """Opens a manifest in text mode, same as sdp.utils.compression.open_file.
+
+    Duplicated here, since this script is run standalone.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    if path.endswith(".xz"):
+        return lzma.open(path, mode, encoding="utf-8")
+    if path.endswith(".zst"):
+        import zstandard
+
+        if mode[0] == "r":
+            # reading across frames, so that concatenated files are read to the end
+            stream = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True)
+            stream = io.BufferedReader(stream)
+        else:
+            stream = zstandard.ZstdCompressor(threads=-1).stream_writer(open(path, "wb"), closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+@contextlib.contextmanager
+def uncompressed_manifest(path: str):
+    """Yields the path to the uncompressed copy of the manifest, since NeMo reads the manifests directly."""
+    if not path.endswith((".gz", ".xz", ".zst")):
+        yield path
+        return
+    # same folder, so that the relative audio paths are resolved in the same way
+    fd, tmp_path = tempfile.mkstemp(suffix=".json", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with open_manifest(path, "rt") as fin, os.fdopen(fd, "wt", encoding="utf-8") as fout:
+            shutil.copyfileobj(fin, fout)
+        yield tmp_path
+    finally:
+        os.remove(tmp_path)
+
+
 @hydra_runner(config_name="TranscriptionConfig", schema=TranscriptionConfig)
 def main(cfg: TranscriptionConfig) -> TranscriptionConfig:
     logging.info(f'Hydra config: {OmegaConf.to_yaml(cfg)}')
@@ -186,7 +229,7 @@ def main(cfg: TranscriptionConfig) -> TranscriptionConfig:
             return None
 
         manifest_dir = Path(cfg.dataset_manifest).parent
-        with open(cfg.dataset_manifest, 'r') as f:
+        with open_manifest(cfg.dataset_manifest, 'rt') as f:
             has_two_fields = []
             for line in f:
                 item = json.loads(line)
@@ -237,13 +280,14 @@ def main(cfg: TranscriptionConfig) -> TranscriptionConfig:
         with torch.no_grad():
             if partial_audio:
                 if isinstance(asr_model, EncDecCTCModel):
-                    transcriptions = transcribe_partial_audio(
-                        asr_model=asr_model,
-                        path2manifest=cfg.dataset_manifest,
-                        batch_size=cfg.batch_size,
-                        num_workers=cfg.num_workers,
-                        return_hypotheses=return_hypotheses,
-                    )
+                    with uncompressed_manifest(cfg.dataset_manifest) as manifest_path:
+                        transcriptions = transcribe_partial_audio(
+                            asr_model=asr_model,
+                            path2manifest=manifest_path,
+                            batch_size=cfg.batch_size,
+                            num_workers=cfg.num_workers,
+                            return_hypotheses=return_hypotheses,
+                        )
                 else:
                     logging.warning(
                         "RNNT models do not support transcribe partial audio for now. Transcribing full audio."
@@ -281,7 +325,7 @@ def main(cfg: TranscriptionConfig) -> TranscriptionConfig:
         pred_text_attr_name = 'pred_text_' + pred_by_model_name
     else:
         pred_text_attr_name = 'pred_text'
-    with open(cfg.output_filename, 'w', encoding='utf-8') as f:
+    with open_manifest(cfg.output_filename, 'wt') as f:
         if cfg.audio_dir is not None:
             for idx, transcription in enumerate(transcriptions):
                 item = {'audio_filepath': filepaths[idx], pred_text_attr_name: transcription.text}
@@ -290,7 +334,7 @@ def main(cfg: TranscriptionConfig) -> TranscriptionConfig:
                     item['pred_lang_chars'] = transcription.langs_chars
                 f.write(json.dumps(item) + "\n")
         else:
-            with open(cfg.dataset_manifest, 'r') as fr:
+            with open_manifest(cfg.dataset_manifest, 'rt') as fr:
                 for idx, line in enumerate(fr):
                     item = json.loads(line)
                     item[pred_text_attr_name] = transcriptions[idx].text
@@ -13,8 +13,11 @@
 # limitations under the License.
 
 import logging
+import multiprocessing
 import os
+import pickle
 import tempfile
+import time
 import uuid
 from typing import List
 
@@ -22,6 +25,23 @@ import hydra
 from omegaconf import OmegaConf, open_dict
 
 from sdp.logging import logger
+from sdp.processors.base_processor import BaseParallelProcessor, BaseProcessor
+from sdp.processors.fused_processor import FusedParallelProcessor, fuse_processors
+from sdp.utils.columnar import COLUMNAR_SUFFIX
+from sdp.utils.manifest_io import set_codec
+from sdp.utils.parallel import WorkerPool
+from sdp.utils.sharding import get_shard_file, merge_shard_files
+from sdp.utils.stage_cache import StageCache
+from sdp.utils.telemetry import get_processor_report, save_telemetry_report
+
+# suffixes of the temporary manifests for each intermediate_format
+INTERMEDIATE_FORMATS = {
+    "jsonl": "",
+    "jsonl.gz": ".gz",
+    "jsonl.zst": ".zst",
+    "jsonl.xz": ".xz",
+    "columnar": COLUMNAR_SUFFIX,
+}
 
 # registering a new resolver to allow specifying different config values based on the data_split
 OmegaConf.register_new_resolver("subfield", lambda node, field: node[field])
@@ -82,8 +102,90 @@ def select_subset(input_list: List, select_str: str) -> List:
     return selected_objects
 
 
+def get_num_shardable_processors(processors: List[BaseProcessor]) -> int:
+    """Returns how many of the first processors can be run on a shard of the data.
+
+    Processor can be run on a shard if it's not a barrier and it either reads
+    the output of the previous (sharded) processors or can select a shard of
+    its input itself (i.e. it's a :class:`sdp.processors.base_processor.BaseParallelProcessor`).
+    """
+    outputs = []
+    for idx, processor in enumerate(processors):
+        reads_shard = (
+            processor.input_manifest_file is not None and os.path.realpath(processor.input_manifest_file) in outputs
+        )
+        if processor.is_barrier or not (reads_shard or isinstance(processor, BaseParallelProcessor)):
+            return idx
+        outputs.append(os.path.realpath(processor.output_manifest_file))
+    return len(processors)
+
+
+def shard_processors(processors: List[BaseProcessor], shard_id: int, num_shards: int):
+    """Modifies processors in-place to only process and write the given shard of the data."""
+    outputs = [os.path.realpath(processor.output_manifest_file) for processor in processors]
+    for idx, processor in enumerate(processors):
+        input_file = processor.input_manifest_file
+        if input_file is not None and os.path.realpath(input_file) in outputs[:idx]:
+            processor.input_manifest_file = get_shard_file(processor.input_manifest_file, shard_id, num_shards)
+        else:
+            processor.shard_id = shard_id
+            processor.num_shards = num_shards
+        processor.output_manifest_file = get_shard_file(processor.output_manifest_file, shard_id, num_shards)
+        if isinstance(processor, BaseParallelProcessor):
+            processor.defer_finalize = True
+
+
+def merge_shards(processors: List[BaseProcessor], explicit_outputs: List[bool], num_shards: int):
+    """Merges outputs and metrics of the processors that were run on all shards."""
+    metrics_files = [
+        get_shard_file(processors[-1].output_manifest_file, shard_id, num_shards) + ".metrics"
+        for shard_id in range(num_shards)
+    ]
+    shards_metrics = []
+    for metrics_file in metrics_files:
+        with open(metrics_file, "rb") as fin:
+            shards_metrics.append(pickle.load(fin))
+
+    merged_outputs = set()
+    for processor, explicit in zip(processors, explicit_outputs):
+        # the same file might be written by multiple processors, then it only has the last output
+        output_file = os.path.realpath(processor.output_manifest_file)
+        if explicit and output_file not in merged_outputs:
+            logger.info("Merging shards of %s", processor.output_manifest_file)
+            merge_shard_files(processor.output_manifest_file, num_shards)
+            merged_outputs.add(output_file)
+
+    for idx, processor in enumerate(processors):
+        if not isinstance(processor, BaseParallelProcessor):
+            continue
+        metrics = processor.metrics_reducer.initial()
+        for shard_metrics in shards_metrics:
+            processor_metrics, number_of_entries, total_duration = shard_metrics[idx]
+            metrics = processor.metrics_reducer.merge(metrics, processor_metrics)
+            processor.number_of_entries += number_of_entries
+            processor.total_duration += total_duration
+        logger.info('=> Finalizing processor "%s"', processor)
+        processor.finalize(metrics)
+
+    for metrics_file in metrics_files:
+        os.remove(metrics_file)
+
+
+def get_output_manifest_files(processor: BaseProcessor) -> List[str]:
+    """Returns all manifests written by the processor, including intermediate outputs of fused processors."""
+    if isinstance(processor, FusedParallelProcessor):
+        return [
+            stage.output_manifest_file
+            for stage, materialize in zip(processor.processors, processor.materialize)
+            if materialize
+        ]
+    return [processor.output_manifest_file]
+
+
 def run_processors(cfg):
     logger.info(f"Hydra config: {OmegaConf.to_yaml(cfg)}")
+    if cfg.get("json_codec") is not None:
+        set_codec(cfg.json_codec)
     processors_to_run = cfg.get("processors_to_run", "all")
 
     if processors_to_run == "all":
@@ -101,7 +203,15 @@ def run_processors(cfg):
         "Specified to run the following processors: %s ",
         [cfg["_target_"] for cfg in processors_cfgs],
     )
+    # format of the manifests that are not explicitly specified and are deleted after the run
+    intermediate_format = cfg.get("intermediate_format", "jsonl")
+    if intermediate_format not in INTERMEDIATE_FORMATS:
+        raise ValueError(
+            f"intermediate_format has to be one of {list(INTERMEDIATE_FORMATS)}, got {intermediate_format}"
+        )
     processors = []
+    # whether output of each processor was explicitly requested by the user
+    explicit_outputs = []
     # let's build all processors first to automatically check
     # for errors in parameters
     with tempfile.TemporaryDirectory() as tmp_dir:
@@ -124,8 +234,9 @@ def run_processors(cfg):
             # we assume that each processor defines "output_manifest_file"
             # and "input_manifest_file" keys, which can be optional. In case they
             # are missing, we create tmp files here for them
+            explicit_outputs.append("output_manifest_file" in processor_cfg)
             if "output_manifest_file" not in processor_cfg:
-                tmp_file_path = os.path.join(tmp_dir, str(uuid.uuid4()))
+                tmp_file_path = os.path.join(tmp_dir, str(uuid.uuid4())) + INTERMEDIATE_FORMATS[intermediate_format]
                 with open_dict(processor_cfg):
                     processor_cfg["output_manifest_file"] = tmp_file_path
 
@@ -134,12 +245,92 @@ def run_processors(cfg):
                     processors_cfgs[idx + 1]["input_manifest_file"] = processor_cfg["output_manifest_file"]
 
             processor = hydra.utils.instantiate(processor_cfg)
+            if cfg.get("write_manifest_index", False) and isinstance(processor, BaseParallelProcessor):
+                processor.write_index = True
             # running runtime tests to fail right-away if something is not
             # matching users expectations
             processor.test()
             processors.append(processor)
 
-        for processor in processors:
-            # TODO: add proper str method to all classes for good display
-            logger.info('=> Running processor "%s"', processor)
-            processor.process()
+        # running the first processors that don't need the full dataset on a shard of the data.
+        # The rest of the processors are run after all shards are merged
+        num_shards = int(cfg.get("num_shards", os.environ.get("SDP_NUM_SHARDS", 1)))
+        shard_id = cfg.get("shard_id", os.environ.get("SDP_SHARD_ID"))
+        if num_shards > 1:
+            num_sharded = get_num_shardable_processors(processors)
+            if num_sharded == 0:
+                raise ValueError(f"Processor {processors[0]} can't be run on a shard of the data")
+            if not explicit_outputs[num_sharded - 1]:
+                raise ValueError(
+                    f"output_manifest_file has to be specified for processor {processors[num_sharded - 1]}, "
+                    "since it's the last processor that can be run on a shard of the data"
+                )
+            if cfg.get("merge_shards", False):
+                merge_shards(processors[:num_sharded], explicit_outputs[:num_sharded], num_shards)
+                processors = processors[num_sharded:]
+                explicit_outputs = explicit_outputs[num_sharded:]
+            else:
+                if shard_id is None:
+                    raise ValueError("shard_id has to be specified if num_shards > 1")
+                shard_id = int(shard_id)
+                processors = processors[:num_sharded]
+                explicit_outputs = explicit_outputs[:num_sharded]
+                shard_processors(processors, shard_id, num_shards)
+                logger.info(
+                    "Running %d processors on shard %d/%d. Run with merge_shards=True after all shards are done",
+                    num_sharded,
+                    shard_id,
+                    num_shards,
+                )
+        sharded_processors = processors if num_shards > 1 and not cfg.get("merge_shards", False) else None
+
+        # skipping processors which outputs are up-to-date from the previous runs
+        stage_cache = None
+        if cfg.get("use_stage_cache", False) and num_shards == 1:
+            stage_cache = StageCache(processors_cfgs, processors, explicit_outputs)
+            should_run = stage_cache.get_processors_to_run()
+            explicit_outputs = [explicit for explicit, run in zip(explicit_outputs, should_run) if run]
+            processors = [processor for processor, run in zip(processors, should_run) if run]
+
+        # running consecutive per-entry processors in a single pass, only
+        # writing the intermediate manifests that were explicitly specified
+        if cfg.get("fuse_processors", True):
+            processors = fuse_processors(processors, explicit_outputs)
+
+        # re-using the same worker processes for all processors
+        max_workers = cfg.get("max_workers", -1)
+        if max_workers == -1:
+            max_workers = multiprocessing.cpu_count()
+        run_start = time.perf_counter()
+        processors_reports = []
+        with WorkerPool(max_workers=max_workers) as worker_pool:
+            for processor in processors:
+                # TODO: add proper str method to all classes for good display
+                logger.info('=> Running processor "%s"', processor)
+                if isinstance(processor, BaseParallelProcessor):
+                    processor.worker_pool = worker_pool
+                processor_start = time.perf_counter()
+                processor.process()
+                processor_time = time.perf_counter() - processor_start
+                logger.info('=> Processor "%s" finished in %.2f seconds', processor, processor_time)
+                processors_reports.append(
+                    get_processor_report(processor, processor_time, get_output_manifest_files(processor))
+                )
+                if stage_cache is not None:
+                    stages = processor.processors if isinstance(processor, FusedParallelProcessor) else [processor]
+                    for stage in stages:
+                        stage_cache.save(stage)
+
+        if sharded_processors is not None:
+            # saving metrics of each processor to aggregate them in the merge step
+            shard_metrics = [
+                (processor.deferred_metrics, processor.number_of_entries, processor.total_duration)
+                if isinstance(processor, BaseParallelProcessor)
+                else None
+                for processor in sharded_processors
+            ]
+            with open(sharded_processors[-1].output_manifest_file + ".metrics", "wb") as fout:
+                pickle.dump(shard_metrics, fout)
+
+        if cfg.get("telemetry_file") is not None:
+            save_telemetry_report(cfg.telemetry_file, processors_reports, time.perf_counter() - run_start)
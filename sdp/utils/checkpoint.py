@@ -0,0 +1,176 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Journal of committed progress that allows to resume a processor after a crash."""
+
+import os
+import pickle
+from typing import Any, List, Optional
+
+from sdp.logging import logger
+from sdp.utils.compression import get_compression_suffix, is_compressed, open_file
+
+PARTIAL_SUFFIX = ".partial"
+JOURNAL_SUFFIX = ".journal"
+
+
+class OutputJournal:
+    """Context manager for the output files of a processor, which supports resuming after a crash.
+
+    All data is written to ``<output_file>.partial`` files in the same folder,
+    which are renamed to the final output files on successful exit. So
+    partially written manifests are never visible to the next processors,
+    and the input manifest can be safely read while the output with the same
+    path is being written. If ``checkpoint_every`` is None, partial files are
+    removed if an exception is raised.
+
+    Otherwise every ``checkpoint_every`` processed input entries, partial
+    files are flushed to disk and a new record is appended to the
+    ``<last_output_file>.journal`` file.
+    Each record contains the number of processed input entries, the sizes
+    of the partial files and any additional state (e.g. collected metrics).
+
+    When the processor is re-run after a crash, partial files are truncated
+    to the last committed sizes, so that the processing can continue from the
+    first uncommitted input entry.
+
+    Args:
+        output_files (list[str]): paths to all output files. Can be empty if
+            checkpointing is disabled.
+        checkpoint_every (int): number of input entries between commits.
+            Checkpointing is disabled if None.
+        signature: any picklable object that identifies the run. Journal
+            is only used for resuming if signature matches.
+
+    Attributes:
+        files (list): opened output files, in the same order as ``output_files``.
+        num_committed_inputs (int): number of input entries that were
+            already processed in the previous runs and have to be skipped.
+        committed_states (list): states of all records from the previous runs.
+    """
+
+    def __init__(self, output_files: List[str], checkpoint_every: Optional[int] = None, signature: Any = None):
+        if checkpoint_every is not None and checkpoint_every < 1:
+            raise ValueError(f"checkpoint_every has to be positive, got {checkpoint_every}")
+        if checkpoint_every is not None and not output_files:
+            raise ValueError("Checkpointing requires at least one output file")
+        if checkpoint_every is not None and any(is_compressed(output_file) for output_file in output_files):
+            raise ValueError("Checkpointing is not supported for the compressed output manifests")
+        self.output_files = output_files
+        self.checkpoint_every = checkpoint_every
+        self.signature = signature
+        self.partial_files = [output_file + PARTIAL_SUFFIX for output_file in output_files]
+        self.journal_file = output_files[-1] + JOURNAL_SUFFIX if output_files else None
+        self.files = []
+        self.num_committed_inputs = 0
+        self.committed_states = []
+        self._num_processed_inputs = 0
+        self._journal = None
+
+    def __enter__(self):
+        for output_file in self.output_files:
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        if self.checkpoint_every is None:
+            self.files = [
+                open_file(partial_file, "wt", suffix=get_compression_suffix(output_file))
+                for partial_file, output_file in zip(self.partial_files, self.output_files)
+            ]
+            return self
+
+        if not self._resume():
+            for partial_file in self.partial_files:
+                open(partial_file, "wb").close()
+            self._journal = open(self.journal_file, "wb")
+            self._append_record({"signature": self.signature})
+        self.files = [open(partial_file, "at", encoding="utf8") for partial_file in self.partial_files]
+        self._num_processed_inputs = self.num_committed_inputs
+        return self
+
+    def _resume(self) -> bool:
+        """Restores the state from the journal, returning False if there is nothing to resume from."""
+        if not os.path.exists(self.journal_file):
+            return False
+        records = []
+        with open(self.journal_file, "rb") as fin:
+            committed_size = 0
+            while True:
+                try:
+                    records.append(pickle.load(fin))
+                except (EOFError, pickle.UnpicklingError):  # last record might be not fully written
+                    break
+                committed_size = fin.tell()
+        if not records or records[0] != {"signature": self.signature}:
+            logger.warning("Found journal %s from a different run, starting from scratch", self.journal_file)
+            return False
+
+        sizes = records[-1]["sizes"] if len(records) > 1 else [0] * len(self.partial_files)
+        for partial_file, size in zip(self.partial_files, sizes):
+            if not os.path.exists(partial_file) or os.path.getsize(partial_file) < size:
+                logger.warning("Partial output %s is missing or corrupted, starting from scratch", partial_file)
+                return False
+        for partial_file, size in zip(self.partial_files, sizes):
+            os.truncate(partial_file, size)
+
+        self._journal = open(self.journal_file, "ab")
+        self._journal.truncate(committed_size)
+        self.committed_states = [record["state"] for record in records[1:]]
+        if len(records) > 1:
+            self.num_committed_inputs = records[-1]["num_inputs"]
+        logger.info(
+            "Resuming from %s: skipping %d committed input entries", self.journal_file, self.num_committed_inputs
+        )
+        return True
+
+    def _append_record(self, record):
+        pickle.dump(record, self._journal)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def step(self, num_inputs: int = 1) -> bool:
+        """Should be called after ``num_inputs`` input entries are processed. Returns True if :meth:`commit` is due."""
+        num_processed_before = self._num_processed_inputs
+        self._num_processed_inputs += num_inputs
+        if self.checkpoint_every is None:
+            return False
+        # commit is due if a multiple of checkpoint_every was reached within the last step
+        return num_processed_before // self.checkpoint_every != self._num_processed_inputs // self.checkpoint_every
+
+    def commit(self, state: Any = None):
+        """Saves all written data and state to disk. Does nothing if checkpointing is disabled."""
+        if self.checkpoint_every is None:
+            return
+        sizes = []
+        for fout in self.files:
+            fout.flush()
+            os.fsync(fout.fileno())
+            sizes.append(os.fstat(fout.fileno()).st_size)
+        self._append_record({"num_inputs": self._num_processed_inputs, "sizes": sizes, "state": state})
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for fout in self.files:
+            fout.close()
+        if self._journal is not None:
+            self._journal.close()
+            if exc_type is not None:
+                # keeping partial files and journal to resume from
+                return
+            # removing journal first, so that we never resume from already renamed files
+            os.remove(self.journal_file)
+        elif exc_type is not None:
+            for partial_file in self.partial_files:
+                if os.path.exists(partial_file):
+                    os.remove(partial_file)
+            return
+        for partial_file, output_file in zip(self.partial_files, self.output_files):
+            os.replace(partial_file, output_file)
@@ -0,0 +1,272 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Columnar manifest format that allows to read only a subset of the fields.
+
+A columnar manifest is a folder with a name ending in ``.columns`` that
+contains a ``schema.json`` file and one file per field in the ``columns``
+sub-folder. Each line of a column file is a json-serialized value of that
+field for the corresponding manifest entry, or an empty line if the entry
+does not have that field. The schema stores the number of entries and the
+names of the columns, in the order in which they first appeared.
+
+Reading and writing is transparent for the processors: all functions of
+:mod:`sdp.utils.manifest_io` support both formats. Entries of the columnar
+manifest are read with the keys in the order of the columns.
+
+To convert a manifest between the formats, run::
+
+    python -m sdp.utils.columnar <input manifest> <output manifest>
+"""
+
+import argparse
+import json
+import os
+import shutil
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sdp.utils import manifest_io
+
+COLUMNAR_SUFFIX = ".columns"
+SCHEMA_FILE = "schema.json"
+COLUMNS_DIR = "columns"
+FORMAT_VERSION = 1
+
+
+def is_columnar(manifest_file: str) -> bool:
+    """Checks if the manifest is (or should be written) in the columnar format.
+
+    Folders without the suffix are only columnar if they have a schema, so
+    that other folders are never written to or removed as manifests.
+    """
+    return manifest_file.endswith(COLUMNAR_SUFFIX) or os.path.isfile(os.path.join(manifest_file, SCHEMA_FILE))
+
+
+def read_schema(manifest_file: str) -> Dict:
+    with open(os.path.join(manifest_file, SCHEMA_FILE), "rt", encoding="utf8") as fin:
+        schema = json.load(fin)
+    if schema.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported version of the columnar manifest {manifest_file}: {schema.get('version')}")
+    return schema
+
+
+def _get_column_file(manifest_file: str, column_idx: int) -> str:
+    return os.path.join(manifest_file, COLUMNS_DIR, f"{column_idx}.jsonl")
+
+
+def iter_raw_fields(manifest_file: str, fields: Optional[Iterable[str]] = None) -> Iterator[List[Tuple[str, str]]]:
+    """Lazily reads json-serialized values of the fields without parsing them.
+
+    Args:
+        manifest_file (str): path to the columnar manifest.
+        fields (list[str]): fields to read. All fields are read if None.
+            Fields that are not in the manifest are ignored.
+
+    Returns:
+        iterator over the lists of ``(field, serialized value)`` tuples for
+        each entry. Missing fields of the entry are skipped.
+    """
+    schema = read_schema(manifest_file)
+    if fields is None:
+        columns = list(enumerate(schema["columns"]))
+    else:
+        fields = set(fields)
+        columns = [(idx, column) for idx, column in enumerate(schema["columns"]) if column in fields]
+
+    column_files = [open(_get_column_file(manifest_file, idx), "rt", encoding="utf8") for idx, _ in columns]
+    try:
+        for values in zip(*column_files) if column_files else ([] for _ in range(schema["num_rows"])):
+            yield [(column, value[:-1]) for (_, column), value in zip(columns, values) if value != "\n"]
+    finally:
+        for column_file in column_files:
+            column_file.close()
+
+
+def join_raw_fields(raw_fields: Iterable[Tuple[str, str]]) -> str:
+    """Builds a json line from the serialized values, same as ``json.dumps`` of the entry."""
+    return "{" + ", ".join(f"{manifest_io.dumps(field)}: {value}" for field, value in raw_fields) + "}"
+
+
+def iter_columnar_manifest(manifest_file: str, fields: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+    """Lazily reads entries of the columnar manifest, optionally only with the specified fields."""
+    for raw_fields in iter_raw_fields(manifest_file, fields):
+        # parsing the whole entry at once is faster than parsing each value separately
+        yield manifest_io.loads(join_raw_fields(raw_fields))
+
+
+def merge_raw_fields(data: Dict, raw_fields: List[Tuple[str, str]], columns: List[str]) -> List[Tuple[str, str]]:
+    """Combines an entry that was read partially with the rest of its fields.
+
+    Args:
+        data (dict): entry with a subset of the fields. Its values take
+            precedence over ``raw_fields``.
+        raw_fields (list): serialized values of the fields that were not read.
+        columns (list[str]): order of the fields in the input manifest.
+            New fields of ``data`` are put in the end.
+
+    Returns:
+        list of ``(field, serialized value)`` tuples in the order of the columns.
+    """
+    raw_fields = dict(raw_fields)
+    merged = []
+    for column in columns:
+        if column in data:
+            merged.append((column, manifest_io.dumps(data[column])))
+        elif column in raw_fields:
+            merged.append((column, raw_fields[column]))
+    known_columns = set(columns)
+    for field, value in data.items():
+        if field not in known_columns:
+            merged.append((field, manifest_io.dumps(value)))
+    return merged
+
+
+class ColumnarWriter:
+    """Writes entries to a columnar manifest.
+
+    The data is written to ``<manifest_file>.partial`` and renamed to
+    ``manifest_file`` on successful exit from the context manager, replacing
+    the previous manifest if it exists.
+
+    Args:
+        manifest_file (str): path to the output manifest.
+        batch_size (int): number of entries to keep in memory before writing.
+    """
+
+    def __init__(self, manifest_file: str, batch_size: int = 1000):
+        self.manifest_file = manifest_file
+        self.batch_size = batch_size
+        self.partial_file = manifest_file + ".partial"
+        self.columns = []
+        self.num_rows = 0
+        self._column_ids = {}
+        self._column_files = []
+        self._buffers = []
+        self._num_buffered_rows = 0
+
+    def __enter__(self):
+        if os.path.exists(self.partial_file):
+            shutil.rmtree(self.partial_file)
+        os.makedirs(os.path.join(self.partial_file, COLUMNS_DIR))
+        return self
+
+    def _add_column(self, column: str) -> int:
+        self._flush_buffers()
+        column_idx = len(self.columns)
+        self.columns.append(column)
+        self._column_ids[column] = column_idx
+        column_file = open(_get_column_file(self.partial_file, column_idx), "wt", encoding="utf8")
+        # previous entries don't have this field
+        column_file.write("\n" * self.num_rows)
+        self._column_files.append(column_file)
+        self._buffers.append([])
+        return column_idx
+
+    def write_raw_fields(self, raw_fields: Iterable[Tuple[str, str]]):
+        """Writes an entry given as ``(field, serialized value)`` tuples."""
+        row = [""] * len(self.columns)
+        for field, value in raw_fields:
+            column_idx = self._column_ids.get(field)
+            if column_idx is None:
+                column_idx = self._add_column(field)
+                row.append("")
+            row[column_idx] = value
+        for buffer, value in zip(self._buffers, row):
+            buffer.append(value)
+        self.num_rows += 1
+        self._num_buffered_rows += 1
+        if self._num_buffered_rows >= self.batch_size:
+            self._flush_buffers()
+
+    def write(self, entry: Dict):
+        self.write_raw_fields((field, manifest_io.dumps(value)) for field, value in entry.items())
+
+    def write_all(self, entries: Iterable[Dict]):
+        for entry in entries:
+            self.write(entry)
+
+    def write_columnar_manifest(self, manifest_file: str):
+        """Writes all entries of another columnar manifest by copying its column files."""
+        schema = read_schema(manifest_file)
+        for column in schema["columns"]:
+            if column not in self._column_ids:
+                self._add_column(column)
+        self._flush_buffers()
+        for column_idx, column in enumerate(self.columns):
+            if column not in schema["columns"]:
+                self._column_files[column_idx].write("\n" * schema["num_rows"])
+                continue
+            column_file = _get_column_file(manifest_file, schema["columns"].index(column))
+            with open(column_file, "rt", encoding="utf8") as fin:
+                shutil.copyfileobj(fin, self._column_files[column_idx])
+        self.num_rows += schema["num_rows"]
+
+    def _flush_buffers(self):
+        if not self._num_buffered_rows:
+            return
+        for column_file, buffer in zip(self._column_files, self._buffers):
+            buffer.append("")
+            column_file.write("\n".join(buffer))
+            buffer.clear()
+        self._num_buffered_rows = 0
+
+    def flush(self):
+        """Writes all buffered entries to the column files."""
+        self._flush_buffers()
+        for column_file in self._column_files:
+            column_file.flush()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._flush_buffers()
+        for column_file in self._column_files:
+            column_file.close()
+        if exc_type is not None:
+            shutil.rmtree(self.partial_file, ignore_errors=True)
+            return
+        schema = {"version": FORMAT_VERSION, "num_rows": self.num_rows, "columns": self.columns}
+        with open(os.path.join(self.partial_file, SCHEMA_FILE), "wt", encoding="utf8") as fout:
+            json.dump(schema, fout)
+        # folders can't be replaced in one step, so the previous version is moved aside first
+        # and only removed after the new one is in place, since removing a large folder is slow
+        old_file = self.manifest_file + ".old"
+        if os.path.exists(self.manifest_file):
+            if os.path.exists(old_file):
+                shutil.rmtree(old_file)
+            os.replace(self.manifest_file, old_file)
+        os.replace(self.partial_file, self.manifest_file)
+        shutil.rmtree(old_file, ignore_errors=True)
+
+
+def merge_columnar_manifests(manifest_files: List[str], output_file: str):
+    """Concatenates columnar manifests without parsing the values."""
+    with ColumnarWriter(output_file) as writer:
+        for manifest_file in manifest_files:
+            writer.write_columnar_manifest(manifest_file)
+
+
+def convert_manifest(input_file: str, output_file: str):
+    """Converts the manifest from json lines to the columnar format or vice versa, depending on the file names."""
+    manifest_io.write_manifest(output_file, manifest_io.iter_manifest(input_file))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=f"Converts a json lines manifest to the columnar format or vice versa. "
+        f"Manifests with names ending in {COLUMNAR_SUFFIX} are columnar."
+    )
+    parser.add_argument("input_file", help="Path to the input manifest")
+    parser.add_argument("output_file", help="Path to the output manifest")
+    args = parser.parse_args()
+    convert_manifest(args.input_file, args.output_file)
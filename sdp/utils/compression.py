@@ -0,0 +1,103 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Transparent compression of the json lines manifests.
+
+Manifests with names ending in ``.gz``, ``.zst`` or ``.xz`` (e.g.
+``manifest.json.gz``) are compressed with gzip, zstandard or xz respectively.
+They are read and written as streams, so they never have to be decompressed
+on disk. zstandard is usually the best choice: it's much faster than the
+other two and compresses with all available cores, but requires the
+``zstandard`` package to be installed.
+
+Compressed streams can be concatenated, so sharded outputs are merged
+without decompressing them. Since there is no random access into the
+compressed files, compressed manifests can't have a line index (see
+:mod:`sdp.utils.manifest_index`), be written with checkpointing or be
+processed with ``worker_io``.
+"""
+
+import gzip
+import io
+import lzma
+from typing import IO, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_SUFFIXES = (".gz", ".zst", ".xz")
+# same as the default of the gzip command-line tool, the default of the gzip module (9) is much slower
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def is_compressed(path: str) -> bool:
+    return path.endswith(COMPRESSION_SUFFIXES)
+
+
+def get_compression_suffix(path: str) -> str:
+    """Returns the compression suffix of the path or an empty string if it's not compressed.
+
+    Examples::
+
+        >>> get_compression_suffix("manifest.json.gz")
+        '.gz'
+        >>> get_compression_suffix("manifest.json")
+        ''
+    """
+    for suffix in COMPRESSION_SUFFIXES:
+        if path.endswith(suffix):
+            return suffix
+    return ""
+
+
+def _open_zstd(path: str, mode: str) -> IO:
+    if zstandard is None:
+        raise ImportError(f"zstandard is not installed, run `pip install zstandard` to use {path}")
+    fh = open(path, mode[0] + "b")
+    if mode[0] == "r":
+        # reading across frames, so that concatenated files are read to the end
+        stream = zstandard.ZstdDecompressor().stream_reader(fh, read_across_frames=True, closefd=True)
+        stream = io.BufferedReader(stream)
+    else:
+        stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1).stream_writer(fh, closefd=True)
+    if "t" in mode:
+        return io.TextIOWrapper(stream, encoding="utf8")
+    return stream
+
+
+def open_file(path: str, mode: str = "rb", suffix: Optional[str] = None) -> IO:
+    """Opens the file for reading or writing, compressing it depending on the suffix.
+
+    Args:
+        path (str): path to the file.
+        mode (str): one of "rb", "rt", "wb", "wt". Text mode always uses
+            the utf8 encoding.
+        suffix (str): compression suffix to use instead of the suffix of the
+            path, e.g. for temporary files that are renamed later.
+    """
+    if mode not in ("rb", "rt", "wb", "wt"):
+        raise ValueError(f"Unsupported mode {mode}")
+    encoding = "utf8" if "t" in mode else None
+    if suffix is None:
+        suffix = get_compression_suffix(path)
+    if suffix == ".gz":
+        return gzip.open(path, mode, compresslevel=GZIP_LEVEL, encoding=encoding)
+    if suffix == ".xz":
+        return lzma.open(path, mode, encoding=encoding)
+    if suffix == ".zst":
+        return _open_zstd(path, mode)
+    return open(path, mode, encoding=encoding)
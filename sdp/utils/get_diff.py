@@ -12,21 +12,50 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import List
+import functools
+import hashlib
+import re
+from typing import List, Optional, Tuple
 
 import diff_match_patch
 
 from sdp.utils.edit_spaces import remove_extra_spaces
+from sdp.utils.word_alignment import get_word_diff
 
 diff = diff_match_patch.diff_match_patch()
 diff.Diff_Timeout = 0
 
+# consecutive processors compare the same texts, so a small cache is enough to reuse the diffs
+DIFF_CACHE_SIZE = 1024
+_SERIALIZED_OPS = {0: "=", -1: "-", 1: "+"}
+_SERIALIZED_OP_RE = re.compile(r"([=+-])(\d+)")
+
 
 def get_diff(orig_words: str, pred_words: str) -> List[tuple]:
-    orig_words = remove_extra_spaces(orig_words)
-    orig_words = orig_words.replace(" ", "\n") + "\n"
+    """Returns word-level diffs between the texts, as produced by ``diff_match_patch``.
+
+    The diffs only depend on the words of the texts, so they are cached
+    for the last :data:`DIFF_CACHE_SIZE` pairs of texts in each process.
+    """
+    return list(_get_diff(remove_extra_spaces(orig_words), remove_extra_spaces(pred_words)))
+
+
+@functools.lru_cache(maxsize=DIFF_CACHE_SIZE)
+def _get_diff(orig_words: str, pred_words: str) -> Tuple[tuple, ...]:
+    diffs = get_word_diff(orig_words, pred_words)
+    if diffs is None:  # too many unique words
+        return get_diff_with_diff_match_patch(orig_words, pred_words)
+    return tuple(diffs)
+
 
-    pred_words = remove_extra_spaces(pred_words)
+def get_diff_with_diff_match_patch(orig_words: str, pred_words: str) -> Tuple[tuple, ...]:
+    """Computes :func:`get_diff` of the texts with single spaces by diffing each word as a line.
+
+    This is slower than :func:`sdp.utils.word_alignment.get_word_diff`,
+    which gives the same result, and is only used for the texts with too
+    many unique words for it.
+    """
+    orig_words = orig_words.replace(" ", "\n") + "\n"
     pred_words = pred_words.replace(" ", "\n") + "\n"
 
     orig_enc, pred_enc, enc = diff.diff_linesToChars(orig_words, pred_words)
@@ -36,7 +65,83 @@ def get_diff(orig_words: str, pred_words: str) -> List[tuple]:
 
     for d in diffs:
         diffs_post.append((d[0], d[1].replace("\n", " ")))
-    return diffs_post
+    return tuple(diffs_post)
+
+
+def _get_words_hash(orig_words: str, pred_words: str) -> str:
+    return hashlib.blake2b(f"{orig_words}\n{pred_words}".encode("utf-8"), digest_size=8).hexdigest()
+
+
+def serialize_diff(orig_words: str, pred_words: str, diffs: List[tuple]) -> str:
+    """Returns a compact representation of the output of :func:`get_diff` that can be saved in a manifest.
+
+    Only the operation and the number of words of each diff are saved,
+    together with a hash of the texts, which is used to check that the
+    diffs still correspond to the texts in :func:`deserialize_diff`.
+
+    Examples::
+
+        >>> diffs = get_diff("hello there nemo", "hello my name is nemo")
+        >>> serialize_diff("hello there nemo", "hello my name is nemo", diffs)[16:]
+        ':=1-1+3=1'
+    """
+    orig_words, pred_words = remove_extra_spaces(orig_words), remove_extra_spaces(pred_words)
+    ops = "".join(f"{_SERIALIZED_OPS[op]}{text.count(' ')}" for op, text in diffs)
+    return f"{_get_words_hash(orig_words, pred_words)}:{ops}"
+
+
+def deserialize_diff(serialized_diff: str, orig_words: str, pred_words: str) -> Optional[List[tuple]]:
+    """Restores the output of :func:`get_diff` saved with :func:`serialize_diff`.
+
+    Returns None if any of the texts have different words than when the
+    diffs were saved.
+
+    Examples::
+
+        >>> serialized_diff = serialize_diff("a b", "a c", get_diff("a b", "a c"))
+        >>> deserialize_diff(serialized_diff, " a  b ", "a c")
+        [(0, 'a '), (-1, 'b '), (1, 'c ')]
+        >>> deserialize_diff(serialized_diff, "a b", "a d") is None
+        True
+    """
+    orig_words, pred_words = remove_extra_spaces(orig_words), remove_extra_spaces(pred_words)
+    words_hash, _, ops = serialized_diff.partition(":")
+    if words_hash != _get_words_hash(orig_words, pred_words):
+        return None
+    # each word is followed by a space in the diffs, empty text is a single empty word
+    words = {-1: orig_words.split(" "), 1: pred_words.split(" ")}
+    positions = {-1: 0, 1: 0}
+    diffs = []
+    for op_char, num_words in _SERIALIZED_OP_RE.findall(ops):
+        op, num_words = {"=": 0, "-": -1, "+": 1}[op_char], int(num_words)
+        source = -1 if op == 0 else op
+        text = "".join(word + " " for word in words[source][positions[source] : positions[source] + num_words])
+        diffs.append((op, text))
+        for side in (-1, 1) if op == 0 else (op,):
+            positions[side] += num_words
+    return diffs
+
+
+def group_substitutions(diffs: List[tuple]) -> List[tuple]:
+    """Groups deletions followed by insertions in the output of :func:`get_diff` into substitutions.
+
+    See :func:`get_diff_with_subs_grouped` for details.
+    """
+    diffs_group_subs = []
+    i = 0
+    while i < len(diffs):
+        if i < len(diffs) - 1:  # if i == len(diffs), line accessing diffs[i+1] will raise error
+            if diffs[i][0] == -1 and diffs[i + 1][0] == 1:
+                diffs_group_subs.append((diffs[i], diffs[i + 1]))
+                i += 1  # skip extra diff entry so we don't append diffs[i+1] again
+            else:
+                diffs_group_subs.append(diffs[i])
+        else:
+            diffs_group_subs.append(diffs[i])
+
+        i += 1
+
+    return diffs_group_subs
 
 
 def get_diff_with_subs_grouped(orig_words: str, pred_words: str) -> List[tuple]:
@@ -62,20 +167,4 @@ def get_diff_with_subs_grouped(orig_words: str, pred_words: str) -> List[tuple]:
         A list of tuples containing the word-level diffs between the ground truth
         and ASR.
     """
-    diffs = get_diff(orig_words, pred_words)
-
-    diffs_group_subs = []
-    i = 0
-    while i < len(diffs):
-        if i < len(diffs) - 1:  # if i == len(diffs), line accessing diffs[i+1] will raise error
-            if diffs[i][0] == -1 and diffs[i + 1][0] == 1:
-                diffs_group_subs.append((diffs[i], diffs[i + 1]))
-                i += 1  # skip extra diff entry so we don't append diffs[i+1] again
-            else:
-                diffs_group_subs.append(diffs[i])
-        else:
-            diffs_group_subs.append(diffs[i])
-
-        i += 1
-
-    return diffs_group_subs
+    return group_substitutions(get_diff(orig_words, pred_words))
@@ -0,0 +1,189 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Line index of the json lines manifests that allows to access entries without reading the whole file.
+
+The index is saved next to the manifest in ``<manifest>.idx`` and contains
+the byte offsets of the start of each line plus the size of the manifest,
+as little-endian 64-bit integers after a short header. Index is ignored if
+the manifest was modified after the index was written.
+
+Index can be written together with the manifest (see ``write_index``
+argument of :class:`sdp.processors.base_processor.BaseParallelProcessor`)
+or built for any existing manifest with::
+
+    python -m sdp.utils.manifest_index build <manifest>
+
+To save a random sample of the manifest entries (e.g. to quickly debug a
+config on a small subset of the data), run::
+
+    python -m sdp.utils.manifest_index sample <manifest> <output manifest> --num_entries 100
+"""
+
+import argparse
+import mmap
+import os
+import random
+import sys
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sdp.utils import manifest_io
+from sdp.utils.compression import is_compressed
+
+INDEX_SUFFIX = ".idx"
+INDEX_HEADER = b"SDPIDX1\n"
+
+
+def get_index_file(manifest_file: str) -> str:
+    return manifest_file + INDEX_SUFFIX
+
+
+def build_index(manifest_file: str) -> array:
+    """Scans the manifest and returns offsets of all lines plus the size of the file."""
+    offsets = array("Q", [0])
+    with open(manifest_file, "rb") as fin:
+        for line in fin:
+            offsets.append(offsets[-1] + len(line))
+    return offsets
+
+
+def save_index(manifest_file: str, offsets: array):
+    """Saves the index of the manifest. Has to be called after the manifest is fully written."""
+    offsets = array("Q", offsets)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    index_file = get_index_file(manifest_file)
+    with open(index_file + ".tmp", "wb") as fout:
+        fout.write(INDEX_HEADER)
+        offsets.tofile(fout)
+    os.replace(index_file + ".tmp", index_file)
+
+
+def load_index(manifest_file: str) -> Optional[array]:
+    """Returns line offsets of the manifest, or None if there is no up-to-date index."""
+    index_file = get_index_file(manifest_file)
+    if is_compressed(manifest_file) or not os.path.isfile(index_file) or not os.path.isfile(manifest_file):
+        return None
+    manifest_stat = os.stat(manifest_file)
+    if os.stat(index_file).st_mtime_ns < manifest_stat.st_mtime_ns:
+        return None
+    with open(index_file, "rb") as fin:
+        if fin.read(len(INDEX_HEADER)) != INDEX_HEADER:
+            return None
+        offsets = array("Q")
+        offsets.frombytes(fin.read())
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    if not offsets or offsets[-1] != manifest_stat.st_size:
+        return None
+    return offsets
+
+
+class IndexedManifest:
+    """Random access to the entries of a json lines manifest.
+
+    The manifest is memory-mapped, so only the accessed entries are read
+    from disk and parsed. If the manifest does not have an up-to-date index,
+    it's built in memory (but not saved).
+    Supports ``len``, indexing and slicing (returning a list of entries).
+
+    Args:
+        manifest_file (str): path to the manifest.
+
+    Examples::
+
+        with IndexedManifest("manifest.json") as manifest:
+            first_entries = manifest[:10]
+            start_offset, end_offset = manifest.get_byte_range(100, 200)
+    """
+
+    def __init__(self, manifest_file: str):
+        if is_compressed(manifest_file):
+            raise ValueError(f"Compressed manifest {manifest_file} does not support random access")
+        self.manifest_file = manifest_file
+        self.offsets = load_index(manifest_file)
+        if self.offsets is None:
+            self.offsets = build_index(manifest_file)
+        self._file = open(manifest_file, "rb")
+        # empty files can't be memory-mapped
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] > 0 else b""
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get_line(self, idx: int) -> bytes:
+        """Returns the raw line of the entry, including the trailing newline."""
+        return self._mmap[self.offsets[idx] : self.offsets[idx + 1]]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, end, step = idx.indices(len(self))
+            if step == 1:
+                return list(self.iter_entries(start, end))
+            return [self[i] for i in range(start, end, step)]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Entry {idx} is out of range for the manifest with {len(self)} entries")
+        return manifest_io.loads(self.get_line(idx))
+
+    def __iter__(self) -> Iterator[Dict]:
+        return self.iter_entries()
+
+    def get_byte_range(self, start: int = 0, end: Optional[int] = None) -> Tuple[int, int]:
+        """Returns the byte offsets of the start and the end of the entries in ``[start, end)``."""
+        end = len(self) if end is None else min(end, len(self))
+        start = min(start, end)
+        return self.offsets[start], self.offsets[end]
+
+    def iter_entries(self, start: int = 0, end: Optional[int] = None) -> Iterator[Dict]:
+        """Lazily parses entries in ``[start, end)``."""
+        end = len(self) if end is None else min(end, len(self))
+        for idx in range(start, end):
+            yield manifest_io.loads(self.get_line(idx))
+
+    def sample(self, num_entries: int, seed: Optional[int] = None) -> List[Dict]:
+        """Returns ``num_entries`` random entries in the order of the manifest."""
+        indices = random.Random(seed).sample(range(len(self)), min(num_entries, len(self)))
+        return [self[idx] for idx in sorted(indices)]
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the line index of the manifest or samples its entries.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build the index of the manifest")
+    build_parser.add_argument("manifest_file", help="Path to the manifest")
+    sample_parser = subparsers.add_parser("sample", help="Save random entries of the manifest to a new manifest")
+    sample_parser.add_argument("manifest_file", help="Path to the manifest")
+    sample_parser.add_argument("output_file", help="Path to the output manifest")
+    sample_parser.add_argument("--num_entries", type=int, default=100, help="Number of entries to sample")
+    sample_parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    args = parser.parse_args()
+    if args.command == "build":
+        save_index(args.manifest_file, build_index(args.manifest_file))
+    else:
+        with IndexedManifest(args.manifest_file) as manifest:
+            manifest_io.write_manifest(args.output_file, manifest.sample(args.num_entries, args.seed))
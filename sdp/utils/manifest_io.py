@@ -0,0 +1,415 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reading and writing of the manifests (one json per line) with a pluggable json codec.
+
+All processors should use the functions from this module instead of calling
+``json`` directly, so that the fastest available json library is used.
+The codec is selected automatically (see :func:`get_codec`), but can be
+changed with the ``SDP_JSON_CODEC`` environment variable or the top-level
+``json_codec`` config parameter.
+
+Manifests can be stored either as json lines (default) or in the columnar
+format described in :mod:`sdp.utils.columnar`. Json lines manifests are
+compressed if their names end in ``.gz``, ``.zst`` or ``.xz`` (see
+:mod:`sdp.utils.compression`).
+
+Whatever codec is used, the output is exactly the same as the output of
+``json.dumps`` with the default parameters, so switching codecs never changes
+the manifests.
+"""
+
+import itertools
+import json
+import os
+import re
+from array import array
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+
+from sdp.utils import columnar, manifest_index
+from sdp.utils.checkpoint import PARTIAL_SUFFIX
+from sdp.utils.compression import get_compression_suffix, is_compressed, open_file
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_LONG_NUMBER_BYTES = re.compile(rb"\d{19}")
+_LONG_NUMBER_STR = re.compile(r"\d{19}")
+
+
+class JsonCodec:
+    """Default codec that uses the standard ``json`` library.
+
+    Subclasses can override :meth:`loads` and :meth:`dumps`, but have to
+    return the same results as the standard library.
+    """
+
+    name = "json"
+
+    def __init__(self):
+        # re-using encoders, since json.dumps checks all arguments on every call
+        self._encoder = json.JSONEncoder()
+        self._non_ascii_encoder = json.JSONEncoder(ensure_ascii=False)
+
+    def loads(self, line: Union[str, bytes]) -> Any:
+        """Parses a single manifest line."""
+        return json.loads(line)
+
+    def dumps(self, entry: Any, ensure_ascii: bool = True) -> str:
+        """Serializes a single manifest entry without the trailing newline."""
+        if ensure_ascii:
+            return self._encoder.encode(entry)
+        return self._non_ascii_encoder.encode(entry)
+
+
+class OrjsonCodec(JsonCodec):
+    """Codec that parses manifests with `orjson <https://github.com/ijl/orjson>`_.
+
+    Serialization is still done with the standard library, since orjson does
+    not support the same output format. Lines that orjson can't parse, but
+    the standard library can (e.g. ``NaN`` values), are parsed with the
+    standard library. That's also the case for lines with numbers of 19 or
+    more digits, since orjson silently converts integers that don't fit into
+    64 bits to floats.
+    """
+
+    name = "orjson"
+
+    def loads(self, line: Union[str, bytes]) -> Any:
+        long_number = _LONG_NUMBER_BYTES if isinstance(line, bytes) else _LONG_NUMBER_STR
+        if long_number.search(line) is not None:
+            return json.loads(line)
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            return json.loads(line)
+
+
+CODECS = {JsonCodec.name: JsonCodec, OrjsonCodec.name: OrjsonCodec}
+
+
+def get_codec(name: Optional[str] = None) -> JsonCodec:
+    """Creates a codec by name.
+
+    Args:
+        name (str): name of the codec from ``CODECS`` or "auto" to use
+            the fastest installed one. Defaults to the ``SDP_JSON_CODEC``
+            environment variable or "auto" if it's not set.
+    """
+    if name is None:
+        name = os.environ.get("SDP_JSON_CODEC", "auto")
+    if name == "auto":
+        name = OrjsonCodec.name if orjson is not None else JsonCodec.name
+    if name not in CODECS:
+        raise ValueError(f"Unknown json codec {name}. Supported codecs: {list(CODECS)}")
+    if name == OrjsonCodec.name and orjson is None:
+        raise ImportError("orjson is not installed, run `pip install orjson` to use this codec")
+    return CODECS[name]()
+
+
+_codec = get_codec()
+# used to parse single values in the middle of the line
+_value_decoder = json.JSONDecoder()
+
+
+def set_codec(name: Optional[str] = None):
+    """Changes the codec used by all functions of this module."""
+    global _codec
+    _codec = get_codec(name)
+
+
+def loads(line: Union[str, bytes]) -> Any:
+    """Parses a single manifest line with the current codec."""
+    return _codec.loads(line)
+
+
+def dumps(entry: Any, ensure_ascii: bool = True) -> str:
+    """Serializes a manifest entry with the current codec, same as ``json.dumps(entry)``."""
+    return _codec.dumps(entry, ensure_ascii=ensure_ascii)
+
+
+def iter_manifest(
+    manifest_file: str, fields: Optional[Iterable[str]] = None, start: int = 0, end: Optional[int] = None
+) -> Iterator[Dict]:
+    """Lazily reads all entries of the manifest.
+
+    Args:
+        manifest_file (str): path to the manifest in json lines or columnar
+            (see :mod:`sdp.utils.columnar`) format.
+        fields (list[str]): if specified, only these fields are read. Columnar
+            manifests skip reading the rest of the columns, while the lines of
+            json lines manifests are parsed with :func:`extract_fields`.
+        start (int), end (int): if specified, only entries in ``[start, end)``
+            are read. The skipped entries are not parsed and if the manifest
+            has an up-to-date index (see :mod:`sdp.utils.manifest_index`),
+            reading starts right from the ``start`` entry.
+    """
+    if columnar.is_columnar(manifest_file):
+        raw_fields = itertools.islice(columnar.iter_raw_fields(manifest_file, fields), start, end)
+        for entry_raw_fields in raw_fields:
+            yield _codec.loads(columnar.join_raw_fields(entry_raw_fields))
+        return
+    # reading bytes, since json libraries can parse them directly
+    if fields is None:
+        for line in iter_manifest_lines(manifest_file, start, end):
+            yield _codec.loads(line)
+        return
+    fields = list(fields)
+    for line in iter_manifest_lines(manifest_file, start, end):
+        yield extract_fields(line, fields)
+
+
+def iter_manifest_lines(manifest_file: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    """Lazily reads the lines of the json lines manifest in ``[start, end)`` without parsing them.
+
+    See :func:`iter_manifest` for the description of the arguments.
+    """
+    with open_file(manifest_file, "rb") as fin:
+        offsets = manifest_index.load_index(manifest_file) if start > 0 else None
+        if offsets is not None:
+            fin.seek(offsets[min(start, len(offsets) - 1)])
+            lines = itertools.islice(fin, None if end is None else max(end - start, 0))
+        else:
+            lines = itertools.islice(fin, start, end)
+        yield from lines
+
+
+def extract_fields(line: Union[str, bytes], fields: List[str]) -> Dict:
+    """Parses only the specified fields of the manifest line.
+
+    If the line is in the ``json.dumps`` format and does not contain nested
+    objects, the values of the fields are found and parsed without parsing
+    the rest of the line. Otherwise the whole line is parsed.
+    The result has the fields in the order of ``fields``.
+
+    >>> extract_fields('{"audio_filepath": "a.wav", "duration": 1.5, "text": "duration"}', ["duration", "lang"])
+    {'duration': 1.5}
+    """
+    if isinstance(line, bytes):
+        line = line.decode("utf8")
+    # all "{" characters in the strings or nested objects are counted, so that any found key is at the top level
+    if line.count("{") == 1:
+        entry = {}
+        for field in fields:
+            key = _codec.dumps(field)
+            # last value is used if there are duplicate keys, same as in json.loads
+            key_start = line.rfind(key + ": ")
+            if key_start == -1 and key not in line:
+                continue
+            # quotes inside the strings are escaped, so the key has to follow "{" or ", "
+            if key_start == -1 or line[key_start - 1] not in "{ ":
+                break
+            entry[field] = _value_decoder.raw_decode(line, key_start + len(key) + 2)[0]
+        else:
+            return entry
+    entry = _codec.loads(line)
+    return {field: entry[field] for field in fields if field in entry}
+
+
+def merge_fields(data: Dict, line: Union[str, bytes], read_fields: Iterable[str]) -> Dict:
+    """Combines an entry read with :func:`extract_fields` with the rest of the fields of its line.
+
+    Args:
+        data (dict): output entry. Its values take precedence over the line.
+        line (str or bytes): original manifest line of the entry.
+        read_fields (list[str]): fields that were read from the line. They
+            are not copied from the line even if ``data`` does not have them.
+
+    Returns:
+        dict with the fields in the order of the line and new fields of ``data`` in the end.
+    """
+    read_fields = set(read_fields)
+    merged = {}
+    for field, value in _codec.loads(line).items():
+        if field in data:
+            merged[field] = data[field]
+        elif field not in read_fields:
+            merged[field] = value
+    for field, value in data.items():
+        merged.setdefault(field, value)
+    return merged
+
+
+def iter_lines_in_range(fin: BinaryIO, start_offset: int, end_offset: int) -> Iterator[bytes]:
+    """Lazily reads lines of the file opened in binary mode that start in ``[start_offset, end_offset)``.
+
+    Offsets don't have to be at the line boundaries, so the file can be split
+    into the ranges of any size and each line is read from exactly one range.
+    """
+    position = start_offset
+    if start_offset > 0:
+        # skipping the end of the line that started in the previous range
+        fin.seek(start_offset - 1)
+        position += len(fin.readline()) - 1
+    while position < end_offset:
+        line = fin.readline()
+        if not line:
+            return
+        position += len(line)
+        yield line
+
+
+def load_manifest(
+    manifest_file: str, fields: Optional[Iterable[str]] = None, start: int = 0, end: Optional[int] = None
+) -> List[Dict]:
+    """Reads all entries of the manifest into a list. See :func:`iter_manifest` for details."""
+    return list(iter_manifest(manifest_file, fields, start, end))
+
+
+def count_manifest_entries(manifest_file: str, scan: bool = True) -> Optional[int]:
+    """Returns the number of entries in the manifest without parsing them.
+
+    Args:
+        manifest_file (str): path to the manifest.
+        scan (bool): whether to count the lines of the json lines manifest if
+            it does not have an up-to-date index. If False, None is returned
+            in that case.
+    """
+    if columnar.is_columnar(manifest_file):
+        return columnar.read_schema(manifest_file)["num_rows"]
+    offsets = manifest_index.load_index(manifest_file)
+    if offsets is not None:
+        return len(offsets) - 1
+    if not scan:
+        return None
+    with open_file(manifest_file, "rb") as fin:
+        return sum(1 for _ in fin)
+
+
+class ManifestWriter:
+    """Serializes manifest entries and writes them to an opened file in batches.
+
+    The output is the same as writing ``json.dumps(entry) + "\\n"`` for each
+    entry, but the file is written once per ``batch_size`` entries. Call
+    :meth:`flush` (or use as a context manager) to write the remaining
+    entries. The file itself is not closed.
+
+    Args:
+        fout: file opened for writing in text mode.
+        batch_size (int): number of entries to keep in memory before writing.
+        ensure_ascii (bool): same as in ``json.dumps``.
+        track_offsets (bool): whether to record the byte offsets of the
+            written lines (relative to the initial position in the file) in
+            the ``offsets`` attribute, which can be saved as the index of the
+            manifest with :func:`sdp.utils.manifest_index.save_index`.
+    """
+
+    def __init__(self, fout: TextIO, batch_size: int = 1000, ensure_ascii: bool = True, track_offsets: bool = False):
+        self.fout = fout
+        self.batch_size = batch_size
+        self.ensure_ascii = ensure_ascii
+        self.offsets = array("Q", [0]) if track_offsets else None
+        self._lines = []
+
+    def write(self, entry: Any):
+        self._lines.append(_codec.dumps(entry, ensure_ascii=self.ensure_ascii))
+        if len(self._lines) >= self.batch_size:
+            self.flush()
+
+    def write_all(self, entries: Iterable):
+        for entry in entries:
+            self.write(entry)
+
+    def write_line(self, line: Union[str, bytes]):
+        """Writes a line of another manifest without parsing it.
+
+        The line is assumed to be in the same format as ``json.dumps`` output,
+        which is the case for all manifests written by SDP. Lines with
+        non-ascii characters are serialized again if ``ensure_ascii`` is set.
+        """
+        if self.ensure_ascii and not line.isascii():
+            self.write(_codec.loads(line))
+            return
+        if isinstance(line, bytes):
+            line = line.decode("utf8")
+        self._lines.append(line[:-1] if line.endswith("\n") else line)
+        if len(self._lines) >= self.batch_size:
+            self.flush()
+
+    def write_raw_fields(self, raw_fields: Iterable[Tuple[str, str]]):
+        """Writes an entry given as ``(field, serialized value)`` tuples."""
+        self._lines.append(columnar.join_raw_fields(raw_fields))
+        if len(self._lines) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes all buffered entries to the file."""
+        if not self._lines:
+            return
+        if self.offsets is not None:
+            offset = self.offsets[-1]
+            for line in self._lines:
+                # lines are ascii-only if ensure_ascii is set, so the number of bytes is the same as the length
+                offset += (len(line) if self.ensure_ascii else len(line.encode("utf8"))) + 1
+                self.offsets.append(offset)
+        self._lines.append("")
+        self.fout.write("\n".join(self._lines))
+        self._lines = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+@contextmanager
+def open_output_file(output_file: str) -> Iterator[TextIO]:
+    """Opens the json lines manifest for writing in text mode, replacing it only on success.
+
+    The data is written to ``<output_file>.partial`` in the same folder, which
+    is renamed to ``output_file`` if the block finishes without an exception
+    and is removed otherwise. So the manifest is never visible half-written,
+    and its previous version can still be read while the new one is written
+    (e.g. by the processors that have the same input and output manifest).
+    """
+    if os.path.dirname(output_file):
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    partial_file = output_file + PARTIAL_SUFFIX
+    try:
+        with open_file(partial_file, "wt", suffix=get_compression_suffix(output_file)) as fout:
+            yield fout
+    except BaseException:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+        raise
+    os.replace(partial_file, output_file)
+
+
+def write_manifest(manifest_file: str, entries: Iterable, ensure_ascii: bool = True, write_index: bool = False):
+    """Writes all entries to the manifest file, creating the parent folder if needed.
+
+    The manifest is replaced only after all entries are written (see :func:`open_output_file`).
+
+    The manifest is written in the columnar format if its name ends with
+    ``.columns`` (see :mod:`sdp.utils.columnar`) and compressed if it ends with
+    one of the compression suffixes (see :mod:`sdp.utils.compression`). If
+    ``write_index`` is set, uncompressed json lines manifests are saved
+    together with their line index (see :mod:`sdp.utils.manifest_index`).
+    """
+    if columnar.is_columnar(manifest_file):
+        if os.path.dirname(manifest_file):
+            os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+        with columnar.ColumnarWriter(manifest_file) as writer:
+            writer.write_all(entries)
+        return
+    write_index = write_index and not is_compressed(manifest_file)
+    with open_output_file(manifest_file) as fout:
+        with ManifestWriter(fout, ensure_ascii=ensure_ascii, track_offsets=write_index) as writer:
+            writer.write_all(entries)
+    if write_index:
+        manifest_index.save_index(manifest_file, writer.offsets)
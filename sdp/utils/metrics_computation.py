@@ -18,6 +18,10 @@ import editdistance
 
 sm = difflib.SequenceMatcher()
 
+# editdistance switches to a much slower algorithm for long sequences,
+# so the bit-parallel check in python is faster starting from this length
+BIT_PARALLEL_MIN_LENGTH = 1000
+
 
 def get_cer(text, pred_text):
     char_dist = editdistance.eval(text, pred_text)
@@ -38,6 +42,87 @@ def get_wer(text, pred_text):
     return wer
 
 
+def _get_max_distance(threshold, num_units, max_distance):
+    """Returns the largest distance with the rate (as in get_cer/get_wer) not above the threshold or -1."""
+    if round(max_distance / num_units * 100.0, 2) <= threshold:
+        return max_distance
+    if threshold < 0:
+        return -1
+    # the estimate can be off by one because of the rounding
+    distance = min(int(threshold * num_units / 100.0), max_distance)
+    while distance >= 0 and round(distance / num_units * 100.0, 2) > threshold:
+        distance -= 1
+    while round((distance + 1) / num_units * 100.0, 2) <= threshold:
+        distance += 1
+    return distance
+
+
+def _bit_parallel_distance_exceeds(seq1, seq2, max_distance):
+    # Myers' bit-parallel edit distance (in Hyyro's formulation) with seq1 as the pattern,
+    # each bit of the vectors is a row of the dynamic programming matrix
+    peq = {}
+    bit = 1
+    for item in seq1:
+        peq[item] = peq.get(item, 0) | bit
+        bit <<= 1
+    full = bit - 1
+    last = bit >> 1
+    pv, mv, score = full, 0, len(seq1)
+    remaining = len(seq2)
+    for item in seq2:
+        eq = peq.get(item, 0)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & full) ^ pv) | eq
+        ph = mv | (full ^ (xh | pv))
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        remaining -= 1
+        # each of the remaining items can decrease the distance by at most 1
+        if score - remaining > max_distance:
+            return True
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (full ^ (xv | ph))
+        mv = ph & xv
+    return score > max_distance
+
+
+def edit_distance_exceeds(seq1, seq2, max_distance):
+    """Checks if editdistance.eval(seq1, seq2) > max_distance, stopping as soon as it's known.
+
+    The difference of the lengths is a lower bound of the distance and the
+    longest length is an upper bound, so most of the decisions on the
+    sequences of very different lengths don't need the distance at all.
+    Long sequences are compared with a bit-parallel algorithm which stops
+    once the distance can't go back below ``max_distance``.
+    """
+    len1, len2 = len(seq1), len(seq2)
+    if abs(len1 - len2) > max_distance:
+        return True
+    if max(len1, len2) <= max_distance:
+        return False
+    if min(len1, len2) < BIT_PARALLEL_MIN_LENGTH:
+        return editdistance.eval(seq1, seq2) > max_distance
+    return _bit_parallel_distance_exceeds(seq1, seq2, max_distance)
+
+
+def is_cer_above(text, pred_text, threshold):
+    """Same as get_cer(text, pred_text) > threshold, but doesn't compute the exact CER when it's not needed."""
+    max_distance = _get_max_distance(threshold, len(text), max(len(text), len(pred_text)))
+    return edit_distance_exceeds(text, pred_text, max_distance)
+
+
+def is_wer_above(text, pred_text, threshold):
+    """Same as get_wer(text, pred_text) > threshold, but doesn't compute the exact WER when it's not needed."""
+    text_words = text.split()
+    pred_text_words = pred_text.split()
+    max_distance = _get_max_distance(threshold, len(text_words), max(len(text_words), len(pred_text_words)))
+    return edit_distance_exceeds(text_words, pred_text_words, max_distance)
+
+
 def get_charrate(text, duration):
     num_chars = len(text)
     charrate = round(num_chars / duration, 2)
@@ -0,0 +1,329 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers to run a function over chunks of data in a pool of worker processes."""
+
+import collections
+import functools
+import itertools
+import math
+import os
+import pickle
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sdp.utils.telemetry import get_peak_rss
+
+
+def iter_chunks(iterable: Iterable, chunksize: int) -> Iterator[List]:
+    """Lazily splits any iterable into lists of at most ``chunksize`` elements.
+
+    Examples::
+
+        >>> list(iter_chunks(range(5), 2))
+        [[0, 1], [2, 3], [4]]
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class AdaptiveChunker:
+    """Splits entries into chunks that take about ``target_chunk_time`` seconds to process.
+
+    The processing time per entry is estimated from the chunks that were
+    already processed (see :meth:`record`), so the chunk size follows the
+    cost of the entries: cheap entries are sent in large chunks to reduce the
+    overhead of sending each chunk, and expensive ones in small chunks. If the
+    total number of entries is known, chunks also get smaller towards the end,
+    so that all workers finish at about the same time.
+
+    Args:
+        target_chunk_time (float): desired processing time of a chunk in seconds.
+        initial_chunksize (int): chunk size until the first chunk is processed.
+        num_workers (int): number of workers processing the chunks.
+        num_entries (int): total number of entries, if known.
+        max_chunksize (int): upper limit on the chunk size.
+
+    Examples::
+
+        >>> chunker = AdaptiveChunker(target_chunk_time=1.0, initial_chunksize=2, num_workers=1)
+        >>> chunks = chunker.iter_chunks(range(100))
+        >>> next(chunks)
+        [0, 1]
+        >>> chunker.record(2, 0.5)
+        >>> len(next(chunks))
+        4
+    """
+
+    # weight of the last chunk in the running estimate of the cost per entry
+    SMOOTHING = 0.5
+
+    def __init__(
+        self,
+        target_chunk_time: float,
+        initial_chunksize: int,
+        num_workers: int,
+        num_entries: Optional[int] = None,
+        max_chunksize: int = 10000,
+    ):
+        if target_chunk_time <= 0:
+            raise ValueError(f"target_chunk_time has to be positive, got {target_chunk_time}")
+        self.target_chunk_time = target_chunk_time
+        self.initial_chunksize = initial_chunksize
+        self.num_workers = num_workers
+        self.num_entries = num_entries
+        self.max_chunksize = max_chunksize
+        self.time_per_entry = None
+
+    def record(self, num_entries: int, seconds: float):
+        """Updates the estimate of the processing time per entry with a processed chunk."""
+        time_per_entry = seconds / max(num_entries, 1)
+        if self.time_per_entry is None:
+            self.time_per_entry = time_per_entry
+        else:
+            self.time_per_entry = self.SMOOTHING * time_per_entry + (1 - self.SMOOTHING) * self.time_per_entry
+
+    def get_chunksize(self, num_remaining: Optional[int] = None) -> int:
+        if self.time_per_entry is None:
+            chunksize = self.initial_chunksize
+        elif self.time_per_entry > 0:
+            chunksize = int(self.target_chunk_time / self.time_per_entry)
+        else:
+            chunksize = self.max_chunksize
+        if num_remaining is not None:
+            # at least two chunks per worker are left until the end
+            chunksize = min(chunksize, math.ceil(num_remaining / (2 * self.num_workers)))
+        return max(1, min(chunksize, self.max_chunksize))
+
+    def iter_chunks(self, iterable: Iterable) -> Iterator[List]:
+        """Same as :func:`iter_chunks`, but the size of each chunk is chosen when it's requested."""
+        iterator = iter(iterable)
+        num_remaining = self.num_entries
+        while True:
+            chunk = list(itertools.islice(iterator, self.get_chunksize(num_remaining)))
+            if not chunk:
+                return
+            if num_remaining is not None:
+                num_remaining = max(num_remaining - len(chunk), 0)
+            yield chunk
+
+
+def map_chunk(fn: Callable, chunk: List) -> List:
+    """Applies ``fn`` to every element of the chunk. Runs inside the workers."""
+    return [fn(item) for item in chunk]
+
+
+def imap_chunks(
+    executor: Executor,
+    fn: Callable,
+    chunks: Iterable[List],
+    max_chunks_in_flight: int,
+    ordered: bool = True,
+    reorder_buffer_size: Optional[int] = None,
+    per_chunk: bool = False,
+) -> Iterator:
+    """Maps ``fn`` over all chunks using the executor, yielding results in order.
+
+    Unlike ``executor.map``, the input is consumed lazily: at most
+    ``max_chunks_in_flight`` chunks are submitted (or done, but not yet
+    consumed) at any given time. So as long as the caller consumes the
+    results, the memory usage does not depend on the total amount of data.
+
+    Args:
+        executor: any ``concurrent.futures`` executor.
+        fn: function that will be called on each element of each chunk.
+            Has to be picklable if the executor is process-based.
+        chunks: iterable of lists of elements. Can be a generator.
+        max_chunks_in_flight: size of the window of chunks that are
+            submitted to the workers ahead of the consumer.
+        ordered: if False, results of each chunk are yielded as soon as it
+            is done, so one slow chunk does not block the rest.
+        reorder_buffer_size: if specified (and ``ordered=True``), chunks
+            are also processed as they complete, but the finished chunks are
+            kept in a buffer until all previous chunks are done. Only
+            ``max_chunks_in_flight`` chunks are processed at the same time,
+            but up to ``reorder_buffer_size`` more chunks can wait in the buffer.
+        per_chunk: if True, ``fn`` is called once with the whole chunk
+            instead of being called on each element.
+
+    Returns:
+        iterator over the lists of results for each chunk (or over the
+        results of ``fn`` if ``per_chunk=True``).
+    """
+    if max_chunks_in_flight < 1:
+        raise ValueError(f"max_chunks_in_flight has to be positive, got {max_chunks_in_flight}")
+    chunk_fn = fn if per_chunk else functools.partial(map_chunk, fn)
+    if not ordered or reorder_buffer_size is not None:
+        yield from _imap_chunks_as_completed(
+            executor, chunk_fn, chunks, max_chunks_in_flight, reorder_buffer_size if ordered else None
+        )
+        return
+
+    in_flight = collections.deque()
+    chunks = iter(chunks)
+    try:
+        for chunk in chunks:
+            in_flight.append(executor.submit(chunk_fn, chunk))
+            if len(in_flight) >= max_chunks_in_flight:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+    finally:
+        # making sure nothing is left running if consumer stopped early or there was an error
+        for future in in_flight:
+            future.cancel()
+
+
+def _imap_chunks_as_completed(
+    executor: Executor,
+    chunk_fn: Callable,
+    chunks: Iterable[List],
+    max_chunks_in_flight: int,
+    reorder_buffer_size: Optional[int],
+) -> Iterator:
+    """Yields results of the chunks as they complete, re-ordering them if ``reorder_buffer_size`` is set."""
+    if reorder_buffer_size is not None and reorder_buffer_size < 0:
+        raise ValueError(f"reorder_buffer_size has to be non-negative, got {reorder_buffer_size}")
+    running = {}  # future -> index of the chunk
+    finished = {}  # index of the chunk -> results, waiting for the previous chunks
+    next_idx = 0
+    chunks = enumerate(chunks)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(running) < max_chunks_in_flight:
+                num_pending = len(running) + len(finished)
+                if reorder_buffer_size is not None and num_pending >= max_chunks_in_flight + reorder_buffer_size:
+                    break
+                try:
+                    idx, chunk = next(chunks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                running[executor.submit(chunk_fn, chunk)] = idx
+            if not running:
+                # in the ordered mode, the next chunk is always either running or already yielded
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx = running.pop(future)
+                if reorder_buffer_size is None:
+                    yield future.result()
+                else:
+                    finished[idx] = future.result()
+            while next_idx in finished:
+                yield finished.pop(next_idx)
+                next_idx += 1
+    finally:
+        for future in running:
+            future.cancel()
+
+
+# objects shipped to the current worker process, see WorkerPool.imap_chunks
+_shared_objects: Dict[str, Any] = {}
+
+
+def call_shared_method(object_path: str, method_name: str, item: Any) -> Any:
+    """Calls a method of the pickled object, loading it only once per worker. Runs inside the workers."""
+    if object_path not in _shared_objects:
+        # objects are used one after another, so the previous one is not needed anymore
+        _shared_objects.clear()
+        with open(object_path, "rb") as fin:
+            _shared_objects[object_path] = pickle.load(fin)
+    return getattr(_shared_objects[object_path], method_name)(item)
+
+
+def call_with_stats(chunk_fn: Callable, chunk: List) -> Tuple[Any, Optional[int], int, float]:
+    """Returns the result of ``chunk_fn``, the peak memory of the worker, the chunk size and the processing time.
+
+    Runs inside the workers.
+    """
+    start_time = time.perf_counter()
+    result = chunk_fn(chunk)
+    return result, get_peak_rss(), len(chunk), time.perf_counter() - start_time
+
+
+class WorkerPool:
+    """Long-lived pool of worker processes that can be re-used for many functions.
+
+    Unlike ``process_map`` or ``executor.map``, the object that the mapped
+    method belongs to is not pickled together with each chunk. It is instead
+    saved to a temporary file once and each worker loads it on first use.
+    This makes a difference when the object has a large state.
+
+    Can be used as a context manager to shutdown the workers on exit.
+
+    Args:
+        max_workers (int): number of worker processes.
+
+    Attributes:
+        peak_rss (int): maximum peak resident memory of the workers in bytes,
+            as reported with the results of the processed chunks.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.peak_rss = None
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    def imap_chunks(
+        self,
+        method: Callable,
+        chunks: Iterable[List],
+        max_chunks_in_flight: int,
+        per_chunk: bool = False,
+        on_chunk_done: Optional[Callable[[int, float], None]] = None,
+        **kwargs,
+    ) -> Iterator:
+        """Same as :func:`imap_chunks`, but ``method`` has to be a bound method of a picklable object.
+
+        If ``on_chunk_done`` is specified, it is called with the size of each
+        chunk and the time it took to process it inside the worker, before
+        the results of that chunk are yielded.
+        """
+        fd, object_path = tempfile.mkstemp(suffix=".pkl")
+        try:
+            with os.fdopen(fd, "wb") as fout:
+                pickle.dump(method.__self__, fout)
+            chunk_fn = functools.partial(call_shared_method, object_path, method.__name__)
+            if not per_chunk:
+                chunk_fn = functools.partial(map_chunk, chunk_fn)
+            chunk_fn = functools.partial(call_with_stats, chunk_fn)
+            for chunk_result, peak_rss, chunk_size, seconds in imap_chunks(
+                self._executor, chunk_fn, chunks, max_chunks_in_flight, per_chunk=True, **kwargs
+            ):
+                if peak_rss is not None:
+                    self.peak_rss = max(self.peak_rss or 0, peak_rss)
+                if on_chunk_done is not None:
+                    on_chunk_done(chunk_size, seconds)
+                yield chunk_result
+        finally:
+            os.remove(object_path)
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
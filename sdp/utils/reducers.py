@@ -0,0 +1,135 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reducers that define how ``metrics`` of the data entries are aggregated.
+
+Reducers are applied inside the workers to all entries of each chunk, so only
+one aggregated value per chunk is sent to the main process, where the values
+are merged together and passed to the ``finalize`` method of the processor.
+"""
+
+from typing import Any
+
+
+class MetricsReducer:
+    """Base class for all reducers.
+
+    Aggregation has to be associative: the result should not depend on how
+    the entries are split into chunks.
+    """
+
+    def initial(self) -> Any:
+        """Returns the aggregated value of an empty set of entries."""
+        raise NotImplementedError
+
+    def combine(self, aggregate: Any, metrics: Any) -> Any:
+        """Adds ``metrics`` of a single data entry to the aggregated value. Can modify ``aggregate`` in-place."""
+        raise NotImplementedError
+
+    def merge(self, aggregate: Any, other: Any) -> Any:
+        """Merges two aggregated values. Can modify ``aggregate`` in-place."""
+        raise NotImplementedError
+
+
+class ListReducer(MetricsReducer):
+    """Collects all metrics in a list. That's the default behavior of all processors.
+
+    Examples::
+
+        >>> reducer = ListReducer()
+        >>> reducer.merge(reducer.combine(reducer.initial(), 1), [2, 3])
+        [1, 2, 3]
+    """
+
+    def initial(self):
+        return []
+
+    def combine(self, aggregate, metrics):
+        aggregate.append(metrics)
+        return aggregate
+
+    def merge(self, aggregate, other):
+        aggregate.extend(other)
+        return aggregate
+
+
+class SumReducer(MetricsReducer):
+    """Sums all metrics. Tuples are summed element-wise. None values are skipped.
+
+    Args:
+        initial: value to start from, e.g. ``(0, 0)`` for tuples of 2 elements.
+
+    Examples::
+
+        >>> reducer = SumReducer((0, 0))
+        >>> reducer.merge(reducer.combine(reducer.initial(), (1, 0)), (1, 1))
+        (2, 1)
+    """
+
+    def __init__(self, initial: Any = 0):
+        self._initial = initial
+
+    def initial(self):
+        return self._initial
+
+    def combine(self, aggregate, metrics):
+        if metrics is None:
+            return aggregate
+        if isinstance(aggregate, tuple):
+            return tuple(total + value for total, value in zip(aggregate, metrics))
+        return aggregate + metrics
+
+    def merge(self, aggregate, other):
+        return self.combine(aggregate, other)
+
+
+class CounterReducer(MetricsReducer):
+    """Sums dictionaries of counts key-wise.
+
+    Examples::
+
+        >>> reducer = CounterReducer()
+        >>> reducer.merge(reducer.combine(reducer.initial(), {"a": 1, "b": 2}), {"a": 3})
+        {'a': 4, 'b': 2}
+    """
+
+    def initial(self):
+        return {}
+
+    def combine(self, aggregate, metrics):
+        for key, count in metrics.items():
+            aggregate[key] = aggregate.get(key, 0) + count
+        return aggregate
+
+    def merge(self, aggregate, other):
+        return self.combine(aggregate, other)
+
+
+class CountValuesReducer(CounterReducer):
+    """Counts how many times each metrics value occurred. Empty values are skipped.
+
+    Examples::
+
+        >>> reducer = CountValuesReducer()
+        >>> reducer.merge(reducer.combine(reducer.combine(reducer.initial(), "a"), ""), {"a": 1})
+        {'a': 2}
+    """
+
+    def combine(self, aggregate, metrics):
+        if metrics:
+            aggregate[metrics] = aggregate.get(metrics, 0) + 1
+        return aggregate
+
+    def merge(self, aggregate, other):
+        return super().combine(aggregate, other)
@@ -0,0 +1,265 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Precompiled regex operations that are applied to the text of every entry."""
+
+import re
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+try:  # python 3.11+
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, "POSSESSIVE_REPEAT", None))
+# character ranges with more characters are not expanded into translation tables
+_MAX_RANGE_SIZE = 256
+
+
+def get_pattern_chars(pattern: str) -> Optional[FrozenSet[str]]:
+    """Returns the characters matched by the pattern if it's a single literal character or character class.
+
+    Examples::
+
+        >>> sorted(get_pattern_chars("[ab\\\\-]"))
+        ['-', 'a', 'b']
+        >>> get_pattern_chars("a+") is None
+        True
+    """
+    parsed = sre_parse.parse(pattern)
+    if parsed.state.flags & re.IGNORECASE or len(parsed) != 1:
+        return None
+    op, av = parsed[0]
+    if op == sre_parse.LITERAL:
+        return frozenset(chr(av))
+    if op != sre_parse.IN:
+        return None
+    chars = set()
+    for item_op, item_av in av:
+        if item_op == sre_parse.LITERAL:
+            chars.add(chr(item_av))
+        elif item_op == sre_parse.RANGE and item_av[1] - item_av[0] < _MAX_RANGE_SIZE:
+            chars.update(chr(code) for code in range(item_av[0], item_av[1] + 1))
+        else:  # negation, categories like \s, big ranges
+            return None
+    return frozenset(chars)
+
+
+def _collect_literals(parsed, literals: List[str]):
+    run = []
+    for op, av in parsed:
+        if op == sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            literals.append("".join(run))
+            run = []
+        if op == sre_parse.SUBPATTERN and not av[1] & re.IGNORECASE:
+            _collect_literals(av[-1], literals)
+        elif op in _REPEATS and av[0] >= 1:
+            _collect_literals(av[2], literals)
+    if run:
+        literals.append("".join(run))
+
+
+def get_required_literals(pattern: str) -> List[str]:
+    """Returns substrings that are present in every match of the pattern.
+
+    Only the literals that are not inside alternations, optional parts or
+    lookarounds are returned, longest first. Empty list is returned if
+    nothing is known about the matches.
+
+    Examples::
+
+        >>> get_required_literals(" (\\\\w+)¿ ")
+        ['¿ ']
+        >>> get_required_literals("(\\\\.\\\\s+){2,20}")
+        ['.']
+        >>> get_required_literals("a|b")
+        []
+    """
+    parsed = sre_parse.parse(pattern)
+    if parsed.state.flags & re.IGNORECASE:
+        return []
+    literals = []
+    _collect_literals(parsed, literals)
+    # checking only the literals that are not part of the longer ones
+    literals = sorted(set(literals), key=len, reverse=True)
+    return [literal for idx, literal in enumerate(literals) if not any(literal in other for other in literals[:idx])]
+
+
+class _TranslateStep:
+    """Consecutive single character substitutions, applied with one ``str.translate``."""
+
+    def __init__(self):
+        self.table = {}
+        self.patterns = []
+        # for each pattern, characters of the step input that make the pattern change the text
+        self.triggers = []
+        # a single scan of the text is faster than checking the characters one by one
+        self.trigger_regex = None
+
+    def add(self, pattern: str, chars: FrozenSet[str], repl: str):
+        changing = {char for char in chars if char != repl}
+        trigger = {chr(code) for code, value in self.table.items() if not changing.isdisjoint(value)}
+        trigger.update(char for char in changing if ord(char) not in self.table)
+        # composing the table with the new substitution
+        step_table = {ord(char): repl for char in chars}
+        for code, value in self.table.items():
+            self.table[code] = value.translate(step_table)
+        for code in step_table:
+            self.table.setdefault(code, repl)
+        self.patterns.append(pattern)
+        self.triggers.append(frozenset(trigger))
+        all_triggers = sorted(set().union(*self.triggers))
+        if all_triggers:
+            self.trigger_regex = re.compile("[" + "".join(re.escape(char) for char in all_triggers) + "]")
+
+    def apply(self, text: str, changed_patterns: List[str]) -> str:
+        if self.trigger_regex is None or self.trigger_regex.search(text) is None:
+            return text
+        text_chars = set(text)
+        for pattern, trigger in zip(self.patterns, self.triggers):
+            if not trigger.isdisjoint(text_chars):
+                changed_patterns.append(pattern)
+        return text.translate(self.table)
+
+
+class _SubStep:
+    """Single ``re.sub``, skipped if some of the required literals are not in the text."""
+
+    def __init__(self, pattern: str, repl: str, count: int):
+        self.pattern = pattern
+        self.regex = re.compile(pattern)
+        self.repl = repl
+        self.count = count
+        self.literals = get_required_literals(pattern)
+
+    def apply(self, text: str, changed_patterns: List[str]) -> str:
+        for literal in self.literals:
+            if literal not in text:
+                return text
+        text_out = self.regex.sub(self.repl, text, count=self.count)
+        if text_out != text:
+            changed_patterns.append(self.pattern)
+        return text_out
+
+
+class RegexSubstitutions:
+    """Applies a list of ``re.sub`` operations to the text, equivalent to calling them in order.
+
+    All patterns are compiled once. Runs of substitutions of single
+    characters (e.g. ``"[óòô]" -> "o"``) with literal replacements are
+    merged into one ``str.translate`` table and patterns with literals that
+    are not in the text are not run at all.
+
+    Args:
+        regex_params_list (list[dict]): list of dicts with ``pattern``,
+            ``repl`` and optional ``count`` arguments of ``re.sub``.
+
+    Examples::
+
+        >>> regex_params_list = [{"pattern": "[óò]", "repl": "o"}, {"pattern": "o", "repl": "0"}]
+        >>> regex_params_list.append({"pattern": "(\\\\d)", "repl": "<\\\\1>"})
+        >>> substitutions = RegexSubstitutions(regex_params_list)
+        >>> substitutions("bóx óf ")
+        ('b<0>x <0>f ', ['[óò]', 'o', '(\\\\d)'])
+        >>> substitutions("abc")
+        ('abc', [])
+    """
+
+    def __init__(self, regex_params_list: List[Dict]):
+        self.steps = []
+        for regex_params in regex_params_list:
+            pattern, repl, count = regex_params["pattern"], regex_params["repl"], regex_params.get("count", 0)
+            # backslashes in repl are escapes or group references, so it's not a literal string
+            chars = get_pattern_chars(pattern) if count == 0 and "\\" not in repl else None
+            if chars is None:
+                self.steps.append(_SubStep(pattern, repl, count))
+                continue
+            if not self.steps or not isinstance(self.steps[-1], _TranslateStep):
+                self.steps.append(_TranslateStep())
+            self.steps[-1].add(pattern, chars, repl)
+
+    def __call__(self, text: str) -> Tuple[str, List[str]]:
+        """Returns substituted text and the patterns that changed it, in order of application."""
+        changed_patterns = []
+        for step in self.steps:
+            text = step.apply(text, changed_patterns)
+        return text, changed_patterns
+
+
+def get_literal(pattern: str) -> Optional[str]:
+    """Returns the string matched by the pattern if it doesn't have any special characters.
+
+    Examples::
+
+        >>> get_literal("librivox"), get_literal("\\\\.\\\\.\\\\."), get_literal("a+")
+        ('librivox', '...', None)
+    """
+    parsed = sre_parse.parse(pattern)
+    if parsed.state.flags & re.IGNORECASE or any(op != sre_parse.LITERAL for op, _ in parsed):
+        return None
+    return "".join(chr(av) for _, av in parsed)
+
+
+class RegexMatcher:
+    """Finds which of the patterns match the text, checking the cheapest conditions first.
+
+    All patterns are compiled once. Patterns without special characters
+    are matched with a substring search and the rest are only searched if
+    the text contains all literals that are required for a match (see
+    :func:`get_required_literals`), so that most patterns are rejected
+    with a few fast substring checks.
+
+    Args:
+        patterns (list[str]): regex patterns in order of priority.
+
+    Examples::
+
+        >>> matcher = RegexMatcher(["b+", "a", "(?i)C"])
+        >>> matcher.first_match("abbc"), matcher.first_match("ac"), matcher.first_match("xyz")
+        (0, 1, None)
+        >>> matcher.count_matches(0, "abbcb")
+        2
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = list(patterns)
+        self.regexes = [re.compile(pattern) for pattern in self.patterns]
+        self.literals = [get_required_literals(pattern) for pattern in self.patterns]
+        # the required literals are the whole match, so there is no need to run the regex
+        self.is_literal = [get_literal(pattern) is not None for pattern in self.patterns]
+
+    def search(self, idx: int, text: str) -> bool:
+        """Checks if the pattern with index ``idx`` matches the text."""
+        for literal in self.literals[idx]:
+            if literal not in text:
+                return False
+        return self.is_literal[idx] or self.regexes[idx].search(text) is not None
+
+    def first_match(self, text: str) -> Optional[int]:
+        """Returns index of the first pattern that matches the text or None."""
+        for idx in range(len(self.patterns)):
+            if self.search(idx, text):
+                return idx
+        return None
+
+    def matches_any(self, text: str) -> bool:
+        """Checks if any of the patterns matches the text."""
+        return self.first_match(text) is not None
+
+    def count_matches(self, idx: int, text: str) -> int:
+        """Returns the number of non-overlapping matches of the pattern in the text."""
+        return sum(1 for _ in self.regexes[idx].finditer(text))
@@ -0,0 +1,110 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers to run the same pipeline on multiple machines, each processing a part of the data."""
+
+import os
+import shutil
+from array import array
+from typing import BinaryIO, List, Tuple
+
+from sdp.utils import columnar, manifest_index
+from sdp.utils.compression import get_compression_suffix
+
+
+def get_shard_range(num_entries: int, shard_id: int, num_shards: int) -> Tuple[int, int]:
+    """Returns start and end of the contiguous range of entries that belongs to the shard.
+
+    Examples::
+
+        >>> [get_shard_range(10, shard_id, 3) for shard_id in range(3)]
+        [(0, 3), (3, 6), (6, 10)]
+    """
+    if not 0 <= shard_id < num_shards:
+        raise ValueError(f"shard_id has to be in [0, {num_shards}), got {shard_id}")
+    return num_entries * shard_id // num_shards, num_entries * (shard_id + 1) // num_shards
+
+
+def get_shard_file(path: str, shard_id: int, num_shards: int) -> str:
+    """Returns the path where the shard of the file is saved.
+
+    Examples::
+
+        >>> get_shard_file("manifest.json", 1, 4)
+        'manifest.json.shard1-of-4'
+        >>> get_shard_file("manifest.columns", 1, 4)
+        'manifest.shard1-of-4.columns'
+        >>> get_shard_file("manifest.json.gz", 1, 4)
+        'manifest.json.shard1-of-4.gz'
+    """
+    # keeping the suffix, so that the shards are read in the same format
+    suffix = columnar.COLUMNAR_SUFFIX if path.endswith(columnar.COLUMNAR_SUFFIX) else get_compression_suffix(path)
+    if suffix:
+        return f"{path[:-len(suffix)]}.shard{shard_id}-of-{num_shards}{suffix}"
+    return f"{path}.shard{shard_id}-of-{num_shards}"
+
+
+def _copy_file(fin: BinaryIO, fout: BinaryIO):
+    """Appends the content of ``fin`` to ``fout``, copying inside the kernel if possible."""
+    copy_file_range = getattr(os, "copy_file_range", None)  # only available on Linux
+    if copy_file_range is not None:
+        fout.flush()
+        try:
+            while copy_file_range(fin.fileno(), fout.fileno(), 1 << 30) > 0:
+                pass
+            return
+        except OSError:  # e.g. not supported by the file system, continuing from the current positions
+            pass
+    shutil.copyfileobj(fin, fout)
+
+
+def concatenate_files(input_files: List[str], output_file: str):
+    """Concatenates files in order. Output is replaced only after all data is copied."""
+    tmp_file = output_file + ".merging"
+    with open(tmp_file, "wb") as fout:
+        for input_file in input_files:
+            with open(input_file, "rb") as fin:
+                _copy_file(fin, fout)
+    os.replace(tmp_file, output_file)
+
+
+def merge_shard_files(path: str, num_shards: int):
+    """Concatenates all shards of the file in order, removing the shards afterwards.
+
+    If all shards have line indices (see :mod:`sdp.utils.manifest_index`), they are merged as well.
+    Compressed shards are concatenated without decompressing them, since
+    concatenated gzip, zstandard and xz streams are valid files.
+    """
+    shard_files = [get_shard_file(path, shard_id, num_shards) for shard_id in range(num_shards)]
+    missing_files = [shard_file for shard_file in shard_files if not os.path.exists(shard_file)]
+    if missing_files:
+        raise FileNotFoundError(f"Can't merge shards, since some of them are missing: {missing_files}")
+    if columnar.is_columnar(path):
+        columnar.merge_columnar_manifests(shard_files, path)
+        for shard_file in shard_files:
+            shutil.rmtree(shard_file)
+        return
+    shard_indices = [manifest_index.load_index(shard_file) for shard_file in shard_files]
+    concatenate_files(shard_files, path)
+    if all(shard_index is not None for shard_index in shard_indices):
+        # shifting the offsets of each shard by the size of the previous shards
+        offsets = array("Q", [0])
+        for shard_index in shard_indices:
+            shard_start = offsets[-1]
+            offsets.extend(shard_start + offset for offset in shard_index[1:])
+        manifest_index.save_index(path, offsets)
+    for shard_file in shard_files:
+        os.remove(shard_file)
+        if os.path.exists(manifest_index.get_index_file(shard_file)):
+            os.remove(manifest_index.get_index_file(shard_file))
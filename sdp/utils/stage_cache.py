@@ -0,0 +1,207 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Content-addressed cache that allows to skip processors with unchanged outputs on re-runs."""
+
+import hashlib
+import inspect
+import json
+import os
+from typing import List, Optional
+
+from omegaconf import OmegaConf
+
+from sdp.logging import logger
+from sdp.utils import columnar
+
+# processor arguments that do not change the output
+IGNORED_KEYS = {
+    "input_manifest_file",
+    "output_manifest_file",
+    "max_workers",
+    "chunksize",
+    "streaming",
+    "max_chunks_in_flight",
+    "reorder_buffer_size",
+    "checkpoint_every",
+    "write_index",
+    "worker_io",
+    "execution_mode",
+    "target_chunk_time",
+    "test_cases",
+}
+
+FINGERPRINT_SUFFIX = ".sdp_fingerprint.json"
+
+
+def get_file_hash(path: str) -> str:
+    """Returns sha256 of the file content."""
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as fin:
+        for block in iter(lambda: fin.read(1 << 20), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def get_class_source_hash(cls: type) -> str:
+    """Returns a hash of the source files of all modules defining the class and its parents."""
+    source_hash = hashlib.sha256()
+    for parent_cls in cls.__mro__:
+        try:
+            source_file = inspect.getsourcefile(parent_cls)
+        except TypeError:  # builtin classes
+            continue
+        if source_file is None:
+            continue
+        with open(source_file, "rb") as fin:
+            source_hash.update(fin.read())
+    return source_hash.hexdigest()
+
+
+def _get_output_stat(path: str) -> Optional[List[int]]:
+    if columnar.is_columnar(path):
+        # schema is re-written every time the columnar manifest is written
+        path = os.path.join(path, columnar.SCHEMA_FILE)
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class StageCache:
+    """Decides which processors can be skipped, since their outputs are already up-to-date.
+
+    Each processor gets a fingerprint computed from its resolved config
+    (except the keys that don't change the output, see ``IGNORED_KEYS``),
+    the source code of its class and the fingerprint of its input. The input
+    fingerprint is the fingerprint of the processor that produced the input
+    manifest or the hash of the input manifest content if it was not
+    produced by any of the current processors. After a processor is run,
+    its fingerprint is saved next to the output manifest together with the
+    output size and modification time.
+
+    On the next run, a processor is skipped if its fingerprint and output are
+    unchanged and its output is not needed by any processor that has to be run.
+
+    .. note::
+        Only the explicitly specified output manifests are cached. The raw data
+        used by the processors creating the initial manifest is not part of
+        the fingerprint, so remove the output manifest to force re-running them.
+
+    Args:
+        processors_cfgs (list): configs of all processors. Have to have
+            input and output manifests filled in.
+        processors (list): all processors, in the same order.
+        explicit_outputs (list[bool]): whether output manifest was explicitly
+            specified in the config for each processor.
+    """
+
+    def __init__(self, processors_cfgs: List, processors: List, explicit_outputs: List[bool]):
+        self.processors = processors
+        outputs = [os.path.realpath(processor_cfg["output_manifest_file"]) for processor_cfg in processors_cfgs]
+        self.output_files = [processor_cfg["output_manifest_file"] for processor_cfg in processors_cfgs]
+
+        # index of the processor that produced the input manifest for each processor
+        self.producers = []
+        for idx, processor_cfg in enumerate(processors_cfgs):
+            producer = None
+            if processor_cfg.get("input_manifest_file") is not None:
+                input_file = os.path.realpath(processor_cfg["input_manifest_file"])
+                for prev_idx in range(idx):
+                    if outputs[prev_idx] == input_file:
+                        producer = prev_idx
+            self.producers.append(producer)
+
+        self.fingerprints = []
+        for idx, (processor_cfg, processor) in enumerate(zip(processors_cfgs, processors)):
+            self.fingerprints.append(self._get_fingerprint(processor_cfg, processor, self.producers[idx]))
+
+        # outputs that are needed by the user: explicitly specified and not overwritten by the next processors
+        self.final_outputs = [
+            explicit_outputs[idx] and outputs[idx] not in outputs[idx + 1 :] for idx in range(len(processors))
+        ]
+
+    def _get_fingerprint(self, processor_cfg, processor, producer: Optional[int]) -> Optional[str]:
+        if producer is not None:
+            input_fingerprint = self.fingerprints[producer]
+            if input_fingerprint is None:
+                return None
+        elif processor_cfg.get("input_manifest_file") is not None:
+            if not os.path.isfile(processor_cfg["input_manifest_file"]):
+                return None
+            input_fingerprint = get_file_hash(processor_cfg["input_manifest_file"])
+        else:
+            input_fingerprint = None
+
+        params = OmegaConf.to_container(processor_cfg, resolve=True)
+        params = {key: value for key, value in params.items() if key not in IGNORED_KEYS}
+        fingerprint_data = {
+            "params": params,
+            "class_source": get_class_source_hash(type(processor)),
+            "input": input_fingerprint,
+        }
+        return hashlib.sha256(json.dumps(fingerprint_data, sort_keys=True).encode()).hexdigest()
+
+    def _is_cached(self, idx: int) -> bool:
+        if not self.final_outputs[idx] or self.fingerprints[idx] is None:
+            return False
+        try:
+            with open(self.output_files[idx] + FINGERPRINT_SUFFIX, "rt", encoding="utf8") as fin:
+                saved = json.load(fin)
+        except (OSError, ValueError):
+            return False
+        return (
+            saved.get("fingerprint") == self.fingerprints[idx]
+            and saved.get("output_stat") == _get_output_stat(self.output_files[idx])
+        )
+
+    def get_processors_to_run(self) -> List[bool]:
+        """Returns whether each processor has to be run."""
+        consumers = [[] for _ in self.processors]
+        for idx, producer in enumerate(self.producers):
+            if producer is not None:
+                consumers[producer].append(idx)
+
+        should_run = [False] * len(self.processors)
+        # processor has to run if its cached output is outdated or if it's not cached,
+        # but is needed as input for another running processor. Outputs that are
+        # not cached and not read by anyone are always re-created to be safe
+        for idx in reversed(range(len(self.processors))):
+            if self.final_outputs[idx]:
+                should_run[idx] = not self._is_cached(idx)
+            elif consumers[idx]:
+                should_run[idx] = any(should_run[consumer] for consumer in consumers[idx])
+            else:
+                should_run[idx] = True
+
+        # if processor is re-run, it can overwrite inputs of the next processors (e.g. for in-place processing)
+        for idx, producer in enumerate(self.producers):
+            if producer is not None and should_run[producer]:
+                should_run[idx] = True
+
+        for idx, processor in enumerate(self.processors):
+            if not should_run[idx]:
+                logger.info('=> Output of processor "%s" is up-to-date, skipping it', processor)
+        return should_run
+
+    def save(self, processor):
+        """Saves the fingerprint of the processor that was just run."""
+        idx = self.processors.index(processor)
+        if not self.final_outputs[idx] or self.fingerprints[idx] is None:
+            return
+        with open(self.output_files[idx] + FINGERPRINT_SUFFIX, "wt", encoding="utf8") as fout:
+            json.dump(
+                {"fingerprint": self.fingerprints[idx], "output_stat": _get_output_stat(self.output_files[idx])},
+                fout,
+            )
@@ -0,0 +1,198 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Performance statistics of the processors that are saved in the run report."""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sdp.logging import logger
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+TIMING_KEYS = ["prepare", "read_manifest", "parallel_map", "write", "finalize"]
+
+
+def get_peak_rss() -> Optional[int]:
+    """Returns peak resident memory of the current process in bytes."""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in kilobytes everywhere except macOS
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def get_file_size(path: Optional[str]) -> Optional[int]:
+    """Returns size of the file (or total size of the files in the folder) or None if it does not exist."""
+    if path is not None and os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+        )
+    if path is None or not os.path.isfile(path):
+        return None
+    return os.path.getsize(path)
+
+
+class ProcessorTelemetry:
+    """Collects statistics of a single run of a parallel processor.
+
+    Wall time is split into the phases listed in ``TIMING_KEYS``. Phases
+    can be nested (e.g. reading the next input entries happens inside the
+    parallel map in streaming mode), in which case the time is only
+    attributed to the innermost one.
+
+    Attributes:
+        timings (dict): seconds spent in each phase.
+        entries_in (int): number of entries read from the input.
+        duration_in (float): total ``duration`` of the input entries.
+        workers_peak_rss (int): peak resident memory of the worker processes
+            in bytes. Since workers are shared between processors, that's
+            the maximum since the workers were started.
+        chunk_sizes (list[int]): number of entries in each processed chunk.
+    """
+
+    def __init__(self):
+        self.timings = {key: 0.0 for key in TIMING_KEYS}
+        self.entries_in = 0
+        self.duration_in = 0.0
+        self.workers_peak_rss = None
+        self.chunk_sizes = []
+        self._phases = []
+        self._phase_start = None
+
+    def start(self, phase: str):
+        """Starts measuring ``phase``, pausing the current phase until :meth:`stop` is called."""
+        now = time.perf_counter()
+        if self._phases:
+            self.timings[self._phases[-1]] += now - self._phase_start
+        self._phases.append(phase)
+        self._phase_start = now
+
+    def stop(self):
+        """Stops measuring the last started phase."""
+        now = time.perf_counter()
+        self.timings[self._phases.pop()] += now - self._phase_start
+        self._phase_start = now
+
+    @contextmanager
+    def measure(self, phase: str):
+        """Context manager that attributes the time spent inside it to ``phase``."""
+        self.start(phase)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def track_inputs(self, dataset_entries: Iterable) -> Iterator:
+        """Wraps input entries to count them and measure the time spent reading them."""
+        dataset_entries = iter(dataset_entries)
+        while True:
+            self.start("read_manifest")
+            try:
+                dataset_entry = next(dataset_entries)
+            except StopIteration:
+                return
+            finally:
+                self.stop()
+            self.entries_in += 1
+            if isinstance(dataset_entry, dict):
+                self.duration_in += dataset_entry.get("duration", 0)
+            yield dataset_entry
+
+    def track_chunks(self, chunks: Iterable[List]) -> Iterator[List]:
+        """Wraps chunks of the input entries to record their sizes."""
+        for chunk in chunks:
+            self.chunk_sizes.append(len(chunk))
+            yield chunk
+
+    def add_workers_peak_rss(self, peak_rss: Optional[int]):
+        if peak_rss is not None:
+            self.workers_peak_rss = max(self.workers_peak_rss or 0, peak_rss)
+
+
+def get_processor_report(processor, wall_time: float, output_files: Optional[List[str]] = None) -> Dict:
+    """Returns a json-serializable summary of the processor run.
+
+    Args:
+        processor: processor that was just run.
+        wall_time (float): total time of the :meth:`process` call in seconds.
+        output_files (list[str]): manifests written by the processor.
+            Defaults to ``[processor.output_manifest_file]``.
+    """
+    if output_files is None:
+        output_files = [processor.output_manifest_file]
+    output_sizes = [get_file_size(output_file) for output_file in output_files]
+    report = {
+        "processor": type(processor).__name__,
+        "wall_time": wall_time,
+        "bytes_read": get_file_size(processor.input_manifest_file),
+        "bytes_written": sum(size for size in output_sizes if size is not None),
+        "parent_peak_rss": get_peak_rss(),
+    }
+    telemetry = getattr(processor, "telemetry", None)
+    if telemetry is None:
+        return report
+
+    report["timings"] = dict(telemetry.timings)
+    report["entries_in"] = telemetry.entries_in
+    report["entries_out"] = processor.number_of_entries
+    report["entries_per_second"] = telemetry.entries_in / wall_time if wall_time > 0 else None
+    report["hours_in"] = telemetry.duration_in / 3600
+    report["hours_out"] = processor.total_duration / 3600
+    report["workers_peak_rss"] = telemetry.workers_peak_rss
+    chunk_sizes = telemetry.chunk_sizes
+    if chunk_sizes:
+        report["chunks"] = {
+            "num_chunks": len(chunk_sizes),
+            "min_size": min(chunk_sizes),
+            "max_size": max(chunk_sizes),
+            "mean_size": sum(chunk_sizes) / len(chunk_sizes),
+            "last_sizes": chunk_sizes[-10:],
+        }
+    # fused processors run all stages in a single pass, so only the outputs can be reported separately
+    stages = getattr(processor, "processors", None)
+    if stages is not None:
+        report["stages"] = [
+            {
+                "processor": type(stage).__name__,
+                "entries_out": stage.number_of_entries,
+                "hours_out": stage.total_duration / 3600,
+            }
+            for stage in stages
+        ]
+    return report
+
+
+def save_telemetry_report(path: str, processors_reports: List[Dict], wall_time: float):
+    """Saves reports of all processors (see :func:`get_processor_report`) in a json file."""
+    workers_peak_rss = [report.get("workers_peak_rss") for report in processors_reports]
+    workers_peak_rss = [peak_rss for peak_rss in workers_peak_rss if peak_rss is not None]
+    report = {
+        "wall_time": wall_time,
+        "parent_peak_rss": get_peak_rss(),
+        "workers_peak_rss": max(workers_peak_rss, default=None),
+        "processors": processors_reports,
+    }
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wt", encoding="utf8") as fout:
+        json.dump(report, fout, indent=4)
+    logger.info("Telemetry report is saved to %s", path)
@@ -0,0 +1,363 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Word-level diff of two texts, giving exactly the same result as ``diff_match_patch``.
+
+``diff_match_patch`` diffs lines, so :func:`sdp.utils.get_diff.get_diff`
+used to put each word on a separate line, let the library encode each line
+as a character, diff the encoded strings and decode them back. Here the
+words are interned to integer ids directly, the ids are stored as code points
+of a string (so that comparisons and searches of id sequences run in C) and
+the diff is computed with the same algorithm as ``diff_match_patch.diff_main``
+with ``Diff_Timeout = 0`` and ``checklines=False``: common prefix and suffix
+trimming, Myers' O(ND) bisection and the same merge cleanup. The code of
+these functions is adapted from diff-match-patch (Copyright 2018 The
+diff-match-patch Authors, Apache License 2.0) and has to be kept in sync
+with it, the outputs are compared in the tests.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+DIFF_DELETE = -1
+DIFF_INSERT = 1
+DIFF_EQUAL = 0
+
+# diff_match_patch stops encoding lines separately after this many unique lines of the first text and in total
+MAX_UNIQUE_WORDS = (666666, 1114111)
+
+
+def encode_words(orig_words: str, pred_words: str) -> Optional[Tuple[str, str, Dict[str, str]]]:
+    """Encodes each word of the space-separated texts as a character with its id.
+
+    Returns both encoded texts and a mapping from the characters to the
+    words with a trailing space, or None if there are too many unique words.
+
+    Examples::
+
+        >>> encode_words("a b", "b c")
+        ('\\x01\\x02', '\\x02\\x03', {'\\x01': 'a ', '\\x02': 'b ', '\\x03': 'c '})
+    """
+    words1, words2 = orig_words.split(" "), pred_words.split(" ")
+    # ids are assigned in order of the first occurrence, id 0 is not used, same as in diff_match_patch
+    vocabulary = dict.fromkeys(words1)
+    if len(vocabulary) >= MAX_UNIQUE_WORDS[0] - 1:
+        return None
+    vocabulary.update(dict.fromkeys(words2))
+    if len(vocabulary) >= MAX_UNIQUE_WORDS[1] - 1:
+        return None
+    chars = dict(zip(vocabulary, map(chr, range(1, len(vocabulary) + 1))))
+    words = {char: word + " " for word, char in chars.items()}
+    return "".join(map(chars.__getitem__, words1)), "".join(map(chars.__getitem__, words2)), words
+
+
+def get_word_diff(orig_words: str, pred_words: str) -> Optional[List[tuple]]:
+    """Returns word-level diffs of texts with single spaces between the words.
+
+    The output is the same as of :func:`sdp.utils.get_diff.get_diff`: each
+    diff is a tuple of the operation and the words, each followed by a space.
+    None is returned if the texts have too many unique words to be encoded.
+
+    Examples::
+
+        >>> get_word_diff("hello there nemo", "hello my name is nemo")
+        [(0, 'hello '), (-1, 'there '), (1, 'my name is '), (0, 'nemo ')]
+    """
+    encoded = encode_words(orig_words, pred_words)
+    if encoded is None:
+        return None
+    text1, text2, words = encoded
+    return [(op, "".join(map(words.__getitem__, text))) for op, text in diff_main(text1, text2)]
+
+
+def diff_main(text1: str, text2: str) -> List[tuple]:
+    """Finds the differences between two texts, same as ``diff_match_patch.diff_main``."""
+    if text1 == text2:
+        if text1:
+            return [(DIFF_EQUAL, text1)]
+        return []
+
+    # trimming off common prefix and suffix
+    commonlength = common_prefix(text1, text2)
+    commonprefix = text1[:commonlength]
+    text1 = text1[commonlength:]
+    text2 = text2[commonlength:]
+
+    commonlength = common_suffix(text1, text2)
+    if commonlength == 0:
+        commonsuffix = ""
+    else:
+        commonsuffix = text1[-commonlength:]
+        text1 = text1[:-commonlength]
+        text2 = text2[:-commonlength]
+
+    diffs = _diff_compute(text1, text2)
+
+    if commonprefix:
+        diffs[:0] = [(DIFF_EQUAL, commonprefix)]
+    if commonsuffix:
+        diffs.append((DIFF_EQUAL, commonsuffix))
+    cleanup_merge(diffs)
+    return diffs
+
+
+def _diff_compute(text1: str, text2: str) -> List[tuple]:
+    """Finds the differences between two texts that don't have common prefix or suffix."""
+    if not text1:
+        return [(DIFF_INSERT, text2)]
+
+    if not text2:
+        return [(DIFF_DELETE, text1)]
+
+    if len(text1) > len(text2):
+        longtext, shorttext = text1, text2
+    else:
+        shorttext, longtext = text1, text2
+    i = longtext.find(shorttext)
+    if i != -1:
+        # shorter text is inside the longer text
+        op = DIFF_DELETE if len(text1) > len(text2) else DIFF_INSERT
+        return [(op, longtext[:i]), (DIFF_EQUAL, shorttext), (op, longtext[i + len(shorttext) :])]
+
+    if len(shorttext) == 1:
+        # after the previous check, the single character can't be an equality
+        return [(DIFF_DELETE, text1), (DIFF_INSERT, text2)]
+
+    # half-match and line mode speedups of diff_match_patch are disabled without timeout and checklines
+    return _diff_bisect(text1, text2)
+
+
+def _diff_bisect(text1: str, text2: str) -> List[tuple]:
+    """Finds the 'middle snake' of a diff, splits the problem in two and returns the recursive diff.
+
+    See Myers 1986 paper: An O(ND) Difference Algorithm and Its Variations.
+    """
+    text1_length = len(text1)
+    text2_length = len(text2)
+    # indexing a string creates a new object for each character above U+00FF, indexing a list doesn't
+    chars1 = list(text1)
+    chars2 = list(text2)
+    max_d = (text1_length + text2_length + 1) // 2
+    v_offset = max_d
+    v_length = 2 * max_d
+    v1 = [-1] * v_length
+    v1[v_offset + 1] = 0
+    v2 = v1[:]
+    delta = text1_length - text2_length
+    # if the total number of characters is odd, then the front path will collide with the reverse path
+    front = delta % 2 != 0
+    # offsets for start and end of k loop, preventing mapping of space beyond the grid
+    k1start = 0
+    k1end = 0
+    k2start = 0
+    k2end = 0
+    for d in range(max_d):
+        # walking the front path one step
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = v_offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < text1_length and y1 < text2_length and chars1[x1] == chars2[y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > text1_length:
+                # ran off the right of the graph
+                k1end += 2
+            elif y1 > text2_length:
+                # ran off the bottom of the graph
+                k1start += 2
+            elif front:
+                k2_offset = v_offset + delta - k1
+                if k2_offset >= 0 and k2_offset < v_length and v2[k2_offset] != -1:
+                    # mirroring x2 onto top-left coordinate system
+                    x2 = text1_length - v2[k2_offset]
+                    if x1 >= x2:
+                        return _diff_bisect_split(text1, text2, x1, y1)
+
+        # walking the reverse path one step
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = v_offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < text1_length and y2 < text2_length and chars1[-x2 - 1] == chars2[-y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > text1_length:
+                # ran off the left of the graph
+                k2end += 2
+            elif y2 > text2_length:
+                # ran off the top of the graph
+                k2start += 2
+            elif not front:
+                k1_offset = v_offset + delta - k2
+                if k1_offset >= 0 and k1_offset < v_length and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    y1 = v_offset + x1 - k1_offset
+                    # mirroring x2 onto top-left coordinate system
+                    x2 = text1_length - x2
+                    if x1 >= x2:
+                        return _diff_bisect_split(text1, text2, x1, y1)
+
+    # number of diffs equals number of characters, no commonality at all
+    return [(DIFF_DELETE, text1), (DIFF_INSERT, text2)]
+
+
+def _diff_bisect_split(text1: str, text2: str, x: int, y: int) -> List[tuple]:
+    """Splits the diff in two parts at the location of the 'middle snake' and recurses."""
+    return diff_main(text1[:x], text2[:y]) + diff_main(text1[x:], text2[y:])
+
+
+def common_prefix(text1: str, text2: str) -> int:
+    """Returns the number of characters common to the start of both strings."""
+    if not text1 or not text2 or text1[0] != text2[0]:
+        return 0
+    # binary search
+    pointermin = 0
+    pointermax = min(len(text1), len(text2))
+    pointermid = pointermax
+    pointerstart = 0
+    while pointermin < pointermid:
+        if text1[pointerstart:pointermid] == text2[pointerstart:pointermid]:
+            pointermin = pointermid
+            pointerstart = pointermin
+        else:
+            pointermax = pointermid
+        pointermid = (pointermax - pointermin) // 2 + pointermin
+    return pointermid
+
+
+def common_suffix(text1: str, text2: str) -> int:
+    """Returns the number of characters common to the end of both strings."""
+    if not text1 or not text2 or text1[-1] != text2[-1]:
+        return 0
+    # binary search
+    pointermin = 0
+    pointermax = min(len(text1), len(text2))
+    pointermid = pointermax
+    pointerend = 0
+    while pointermin < pointermid:
+        if text1[-pointermid : len(text1) - pointerend] == text2[-pointermid : len(text2) - pointerend]:
+            pointermin = pointermid
+            pointerend = pointermin
+        else:
+            pointermax = pointermid
+        pointermid = (pointermax - pointermin) // 2 + pointermin
+    return pointermid
+
+
+def cleanup_merge(diffs: List[tuple]):
+    """Reorders and merges like edit sections in-place, same as ``diff_match_patch.diff_cleanupMerge``.
+
+    Any edit section can move as long as it doesn't cross an equality.
+    """
+    diffs.append((DIFF_EQUAL, ""))  # dummy entry at the end
+    pointer = 0
+    count_delete = 0
+    count_insert = 0
+    text_delete = ""
+    text_insert = ""
+    while pointer < len(diffs):
+        op, text = diffs[pointer]
+        if op == DIFF_INSERT:
+            count_insert += 1
+            text_insert += text
+            pointer += 1
+        elif op == DIFF_DELETE:
+            count_delete += 1
+            text_delete += text
+            pointer += 1
+        elif op == DIFF_EQUAL:
+            # upon reaching an equality, checking for prior redundancies
+            if count_delete + count_insert > 1:
+                if count_delete != 0 and count_insert != 0:
+                    # factoring out any common prefixes
+                    commonlength = common_prefix(text_insert, text_delete)
+                    if commonlength != 0:
+                        x = pointer - count_delete - count_insert - 1
+                        if x >= 0 and diffs[x][0] == DIFF_EQUAL:
+                            diffs[x] = (diffs[x][0], diffs[x][1] + text_insert[:commonlength])
+                        else:
+                            diffs.insert(0, (DIFF_EQUAL, text_insert[:commonlength]))
+                            pointer += 1
+                        text_insert = text_insert[commonlength:]
+                        text_delete = text_delete[commonlength:]
+                    # factoring out any common suffixes
+                    commonlength = common_suffix(text_insert, text_delete)
+                    if commonlength != 0:
+                        diffs[pointer] = (DIFF_EQUAL, text_insert[-commonlength:] + text)
+                        text_insert = text_insert[:-commonlength]
+                        text_delete = text_delete[:-commonlength]
+                # deleting the offending records and adding the merged ones
+                new_ops = []
+                if len(text_delete) != 0:
+                    new_ops.append((DIFF_DELETE, text_delete))
+                if len(text_insert) != 0:
+                    new_ops.append((DIFF_INSERT, text_insert))
+                pointer -= count_delete + count_insert
+                diffs[pointer : pointer + count_delete + count_insert] = new_ops
+                pointer += len(new_ops) + 1
+            elif pointer != 0 and diffs[pointer - 1][0] == DIFF_EQUAL:
+                # merging this equality with the previous one
+                diffs[pointer - 1] = (DIFF_EQUAL, diffs[pointer - 1][1] + text)
+                del diffs[pointer]
+            else:
+                pointer += 1
+
+            count_insert = 0
+            count_delete = 0
+            text_delete = ""
+            text_insert = ""
+
+    if diffs[-1][1] == "":
+        diffs.pop()  # removing the dummy entry at the end
+
+    # second pass: looking for single edits surrounded on both sides by equalities
+    # which can be shifted sideways to eliminate an equality, e.g. A<ins>BA</ins>C -> <ins>AB</ins>AC
+    changes = False
+    pointer = 1
+    # intentionally ignoring the first and last element (don't need checking)
+    while pointer < len(diffs) - 1:
+        if diffs[pointer - 1][0] == DIFF_EQUAL and diffs[pointer + 1][0] == DIFF_EQUAL:
+            # this is a single edit surrounded by equalities
+            if diffs[pointer][1].endswith(diffs[pointer - 1][1]):
+                # shifting the edit over the previous equality
+                if diffs[pointer - 1][1] != "":
+                    diffs[pointer] = (
+                        diffs[pointer][0],
+                        diffs[pointer - 1][1] + diffs[pointer][1][: -len(diffs[pointer - 1][1])],
+                    )
+                    diffs[pointer + 1] = (diffs[pointer + 1][0], diffs[pointer - 1][1] + diffs[pointer + 1][1])
+                del diffs[pointer - 1]
+                changes = True
+            elif diffs[pointer][1].startswith(diffs[pointer + 1][1]):
+                # shifting the edit over the next equality
+                diffs[pointer - 1] = (diffs[pointer - 1][0], diffs[pointer - 1][1] + diffs[pointer + 1][1])
+                diffs[pointer] = (
+                    diffs[pointer][0],
+                    diffs[pointer][1][len(diffs[pointer + 1][1]) :] + diffs[pointer + 1][1],
+                )
+                del diffs[pointer + 1]
+                changes = True
+        pointer += 1
+
+    # if shifts were made, the diff needs reordering and another shift sweep
+    if changes:
+        cleanup_merge(diffs)
@@ -0,0 +1,669 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import pickle
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from sdp.processors import base_processor
+from sdp.processors.base_processor import BaseParallelProcessor, DataEntry
+from sdp.utils.columnar import convert_manifest
+from sdp.utils.compression import open_file
+from sdp.utils.manifest_index import build_index, load_index
+from sdp.utils.manifest_io import load_manifest, write_manifest
+from sdp.utils.parallel import AdaptiveChunker, WorkerPool, imap_chunks, iter_chunks
+from sdp.utils.reducers import SumReducer
+
+
+class DropOddDuration(BaseParallelProcessor):
+    """Simple processor used for testing: drops odd durations, doubles the rest."""
+
+    def process_dataset_entry(self, data_entry):
+        if data_entry["duration"] % 2 == 1:
+            return [DataEntry(data=None, metrics=1)]
+        data_entry["duration"] *= 2
+        return [DataEntry(data=data_entry, metrics=0)]
+
+    def finalize(self, metrics):
+        self.dropped = sum(metrics)
+        super().finalize(metrics)
+
+
+_num_loads = 0
+
+
+class CountLoads:
+    """Records how many times it was unpickled in the current process."""
+
+    def __init__(self):
+        self.state = list(range(1000))
+
+    def __setstate__(self, state):
+        global _num_loads
+        _num_loads += 1
+        self.__dict__.update(state)
+
+    def get_loads(self, item):
+        return os.getpid(), _num_loads
+
+
+def _write_manifest(path, num_entries):
+    with open(path, "wt", encoding="utf8") as fout:
+        for idx in range(num_entries):
+            fout.write(json.dumps({"audio_filepath": f"{idx}.wav", "duration": idx, "text": f"текст {idx}"}) + "\n")
+
+
+def _read_lines(path):
+    with open(path, "rt", encoding="utf8") as fin:
+        return fin.readlines()
+
+
+@pytest.mark.parametrize("chunksize,max_chunks_in_flight", [(1, 1), (3, 2), (100, 4)])
+def test_streaming_matches_default(tmp_path, chunksize, max_chunks_in_flight):
+    _write_manifest(tmp_path / "input.json", 50)
+    processors = {}
+    for streaming in [False, True]:
+        processors[streaming] = DropOddDuration(
+            input_manifest_file=str(tmp_path / "input.json"),
+            output_manifest_file=str(tmp_path / f"output_{streaming}.json"),
+            max_workers=2,
+            chunksize=chunksize,
+            streaming=streaming,
+            max_chunks_in_flight=max_chunks_in_flight,
+        )
+        processors[streaming].process()
+
+    assert _read_lines(tmp_path / "output_True.json") == _read_lines(tmp_path / "output_False.json")
+    assert processors[True].dropped == processors[False].dropped == 25
+    assert processors[True].number_of_entries == processors[False].number_of_entries == 25
+
+
+def test_streaming_read_manifest_is_lazy(tmp_path):
+    _write_manifest(tmp_path / "input.json", 5)
+    processor = DropOddDuration(
+        input_manifest_file=str(tmp_path / "input.json"),
+        output_manifest_file=str(tmp_path / "output.json"),
+        streaming=True,
+    )
+    assert isinstance(processor.read_manifest(), types.GeneratorType)
+
+
+def test_streaming_inplace(tmp_path):
+    _write_manifest(tmp_path / "manifest.json", 10)
+    processor = DropOddDuration(
+        input_manifest_file=str(tmp_path / "manifest.json"),
+        output_manifest_file=str(tmp_path / "manifest.json"),
+        max_workers=2,
+        streaming=True,
+    )
+    processor.process()
+    # input is still read lazily, since it's only replaced when the output is complete
+    assert processor.streaming
+    assert [json.loads(line)["duration"] for line in _read_lines(tmp_path / "manifest.json")] == [0, 4, 8, 12, 16]
+    assert not (tmp_path / "manifest.json.partial").exists()
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_crash_keeps_output(tmp_path, streaming):
+    _write_manifest(tmp_path / "manifest.json", 50)
+    original_lines = _read_lines(tmp_path / "manifest.json")
+    with pytest.raises(RuntimeError, match="Simulated crash"):
+        CrashingProcessor(
+            run_idx=0,
+            fail_on=37,
+            input_manifest_file=str(tmp_path / "manifest.json"),
+            output_manifest_file=str(tmp_path / "manifest.json"),
+            max_workers=2,
+            chunksize=2,
+            streaming=streaming,
+        ).process()
+    assert _read_lines(tmp_path / "manifest.json") == original_lines
+    assert not (tmp_path / "manifest.json.partial").exists()
+
+
+def test_imap_chunks_bounded_window():
+    num_consumed = 0
+
+    def source():
+        nonlocal num_consumed
+        for idx in range(100):
+            num_consumed += 1
+            yield idx
+
+    results = []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for chunk_result in imap_chunks(executor, lambda x: x * 2, iter_chunks(source(), 5), max_chunks_in_flight=3):
+            # elements in results are written out, everything else is "in flight"
+            assert num_consumed - len(results) <= 3 * 5
+            results.extend(chunk_result)
+
+    assert results == [idx * 2 for idx in range(100)]
+
+
+def test_worker_pool_ships_object_once():
+    with WorkerPool(max_workers=2) as worker_pool:
+        results = list(worker_pool.imap_chunks(CountLoads().get_loads, iter_chunks(range(100), 2), 10))
+        # second object is loaded once more in each worker
+        results += list(worker_pool.imap_chunks(CountLoads().get_loads, iter_chunks(range(100), 2), 10))
+
+    assert len(results) == 50 * 2
+    num_loads = {}
+    for chunk_result in results:
+        for pid, loads in chunk_result:
+            num_loads.setdefault(pid, set()).add(loads)
+    assert len(num_loads) <= 2
+    assert all(loads <= {1, 2} for loads in num_loads.values())
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_shared_worker_pool(tmp_path, streaming):
+    _write_manifest(tmp_path / "input.json", 20)
+    with WorkerPool(max_workers=2) as worker_pool:
+        for idx in range(2):
+            processor = DropOddDuration(
+                input_manifest_file=str(tmp_path / "input.json"),
+                output_manifest_file=str(tmp_path / f"output{idx}.json"),
+                max_workers=2,
+                chunksize=3,
+                streaming=streaming,
+            )
+            processor.worker_pool = worker_pool
+            processor.process()
+            assert processor.dropped == 10
+
+    assert _read_lines(tmp_path / "output0.json") == _read_lines(tmp_path / "output1.json")
+    assert [json.loads(line)["duration"] for line in _read_lines(tmp_path / "output0.json")] == list(range(0, 40, 4))
+
+
+class CrashingProcessor(DropOddDuration):
+    """Fails on the specified entry, recording which run has processed each entry."""
+
+    def __init__(self, run_idx, fail_on=None, **kwargs):
+        super().__init__(**kwargs)
+        self.run_idx = run_idx
+        self.fail_on = fail_on
+
+    def process_dataset_entry(self, data_entry):
+        if data_entry["duration"] == self.fail_on:
+            raise RuntimeError("Simulated crash")
+        data_entry["run_idx"] = self.run_idx
+        return super().process_dataset_entry(data_entry)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_checkpoint_resume(tmp_path, streaming):
+    _write_manifest(tmp_path / "input.json", 50)
+    kwargs = {
+        "input_manifest_file": str(tmp_path / "input.json"),
+        "output_manifest_file": str(tmp_path / "output.json"),
+        "max_workers": 2,
+        "chunksize": 2,
+        "streaming": streaming,
+        "checkpoint_every": 10,
+    }
+    with pytest.raises(RuntimeError, match="Simulated crash"):
+        CrashingProcessor(run_idx=0, fail_on=37, **kwargs).process()
+    assert not (tmp_path / "output.json").exists()
+    assert (tmp_path / "output.json.partial").exists()
+
+    processor = CrashingProcessor(run_idx=1, **kwargs)
+    processor.process()
+    assert not (tmp_path / "output.json.partial").exists()
+    assert not (tmp_path / "output.json.journal").exists()
+    assert processor.dropped == 25
+    assert processor.number_of_entries == 25
+
+    entries = [json.loads(line) for line in _read_lines(tmp_path / "output.json")]
+    assert [entry["duration"] for entry in entries] == list(range(0, 100, 4))
+    # first 30 input entries were committed in the first run
+    assert [entry["run_idx"] for entry in entries] == [0] * 15 + [1] * 10
+
+
+class SumDropped(CrashingProcessor):
+    """Same as :class:`CrashingProcessor`, but metrics are summed in the workers."""
+
+    metrics_reducer = SumReducer()
+
+    def finalize(self, metrics):
+        self.dropped = metrics
+        BaseParallelProcessor.finalize(self, metrics)
+
+
+@pytest.mark.parametrize("checkpoint_every", [None, 7])
+def test_metrics_reducer(tmp_path, checkpoint_every):
+    _write_manifest(tmp_path / "input.json", 50)
+    kwargs = {
+        "input_manifest_file": str(tmp_path / "input.json"),
+        "output_manifest_file": str(tmp_path / "output.json"),
+        "max_workers": 2,
+        "chunksize": 3,
+        "checkpoint_every": checkpoint_every,
+    }
+    if checkpoint_every is not None:
+        with pytest.raises(RuntimeError, match="Simulated crash"):
+            SumDropped(run_idx=0, fail_on=37, **kwargs).process()
+
+    processor = SumDropped(run_idx=1, **kwargs)
+    with WorkerPool(max_workers=2) as worker_pool:
+        processor.worker_pool = worker_pool
+        entries = [{"duration": duration} for duration in range(6)]
+        chunk_results = list(processor._parallel_map(processor._process_chunk, entries))
+    # only one aggregated value per chunk is sent from the workers
+    assert [chunk_metrics for _, chunk_metrics in chunk_results] == [1, 2]
+
+    processor.worker_pool = None
+    processor.process()
+    assert processor.dropped == 25
+    assert processor.number_of_entries == 25
+    assert [json.loads(line)["duration"] for line in _read_lines(tmp_path / "output.json")] == list(range(0, 100, 4))
+
+
+def _blocking_source(event, num_items, consumed):
+    def source():
+        for idx in range(num_items):
+            consumed.append(idx)
+            yield idx
+
+    def fn(item):
+        if item == 0:
+            event.wait(timeout=10)
+        return item
+
+    return source(), fn
+
+
+def test_imap_chunks_unordered():
+    event, consumed = threading.Event(), []
+    source, fn = _blocking_source(event, 40, consumed)
+    results = []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for chunk_result in imap_chunks(executor, fn, iter_chunks(source, 4), max_chunks_in_flight=2, ordered=False):
+            results.extend(chunk_result)
+            # the first chunk is blocked until all others are done
+            if len(results) == 36:
+                event.set()
+    assert results[-4:] == [0, 1, 2, 3]
+    assert sorted(results) == list(range(40))
+
+
+def test_imap_chunks_reorder_buffer():
+    event, consumed = threading.Event(), []
+    source, fn = _blocking_source(event, 40, consumed)
+    num_consumed_at_first_result = None
+    results = []
+    timer = threading.Timer(0.3, event.set)
+    timer.start()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        chunk_results = imap_chunks(
+            executor, fn, iter_chunks(source, 4), max_chunks_in_flight=2, reorder_buffer_size=3
+        )
+        for chunk_result in chunk_results:
+            if num_consumed_at_first_result is None:
+                num_consumed_at_first_result = len(consumed)
+            results.extend(chunk_result)
+    timer.join()
+    assert results == list(range(40))
+    # other chunks were processed while the first one was blocked, but not more than the buffer allows
+    assert 2 * 4 < num_consumed_at_first_result <= (2 + 3) * 4
+
+
+@pytest.mark.parametrize("ordered,reorder_buffer_size", [(False, None), (True, 2)])
+def test_unordered_processing(tmp_path, ordered, reorder_buffer_size):
+    _write_manifest(tmp_path / "input.json", 50)
+    processor = DropOddDuration(
+        input_manifest_file=str(tmp_path / "input.json"),
+        output_manifest_file=str(tmp_path / "output.json"),
+        max_workers=2,
+        chunksize=3,
+        streaming=True,
+        ordered=ordered,
+        reorder_buffer_size=reorder_buffer_size,
+    )
+    processor.process()
+    durations = [json.loads(line)["duration"] for line in _read_lines(tmp_path / "output.json")]
+    if ordered:
+        assert durations == list(range(0, 100, 4))
+    else:
+        assert sorted(durations) == list(range(0, 100, 4))
+    assert processor.dropped == 25
+
+
+class DropOddDurationOnly(DropOddDuration):
+    """Same as :class:`DropOddDuration`, but only reads the duration."""
+
+    required_fields = ["duration"]
+
+    def process_dataset_entry(self, data_entry):
+        if list(data_entry) != ["duration"]:
+            raise RuntimeError(f"Unexpected fields: {list(data_entry)}")
+        return super().process_dataset_entry(data_entry)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_columnar_manifests(tmp_path, streaming):
+    _write_manifest(tmp_path / "input.json", 50)
+    convert_manifest(str(tmp_path / "input.json"), str(tmp_path / "input.columns"))
+    kwargs = {"max_workers": 2, "chunksize": 3, "streaming": streaming}
+    DropOddDuration(
+        input_manifest_file=str(tmp_path / "input.json"), output_manifest_file=str(tmp_path / "output.json"), **kwargs
+    ).process()
+    processor = DropOddDurationOnly(
+        input_manifest_file=str(tmp_path / "input.columns"),
+        output_manifest_file=str(tmp_path / "output.columns"),
+        **kwargs,
+    )
+    processor.process()
+    assert processor.dropped == 25
+    assert processor.total_duration == sum(range(0, 100, 4))
+    # only the fields that were read are parsed, the rest is copied as is
+    DropOddDurationOnly(
+        input_manifest_file=str(tmp_path / "input.columns"),
+        output_manifest_file=str(tmp_path / "partial.json"),
+        **kwargs,
+    ).process()
+    convert_manifest(str(tmp_path / "output.columns"), str(tmp_path / "converted.json"))
+    assert _read_lines(tmp_path / "partial.json") == _read_lines(tmp_path / "output.json")
+    assert _read_lines(tmp_path / "converted.json") == _read_lines(tmp_path / "output.json")
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_write_index(tmp_path, streaming):
+    _write_manifest(tmp_path / "input.json", 50)
+    kwargs = {"max_workers": 2, "chunksize": 3, "streaming": streaming, "write_index": True}
+    DropOddDuration(
+        input_manifest_file=str(tmp_path / "input.json"), output_manifest_file=str(tmp_path / "output.json"), **kwargs
+    ).process()
+    assert load_index(str(tmp_path / "output.json")) == build_index(str(tmp_path / "output.json"))
+
+    # second shard is read starting from the indexed offset
+    processor = DropOddDuration(
+        input_manifest_file=str(tmp_path / "output.json"), output_manifest_file=str(tmp_path / "shard.json"), **kwargs
+    )
+    processor.shard_id, processor.num_shards = 1, 2
+    processor.process()
+    assert [json.loads(line)["duration"] for line in _read_lines(tmp_path / "shard.json")] == list(range(96, 200, 8))
+    assert load_index(str(tmp_path / "shard.json")) == build_index(str(tmp_path / "shard.json"))
+
+
+@pytest.mark.parametrize("max_workers,num_shards", [(1, 1), (3, 1), (2, 3)])
+def test_worker_io(tmp_path, max_workers, num_shards):
+    _write_manifest(tmp_path / "input.json", 50)
+    outputs = {}
+    for worker_io in [False, True]:
+        lines = []
+        dropped = 0
+        for shard_id in range(num_shards):
+            output_file = tmp_path / f"output_{worker_io}_{shard_id}.json"
+            processor = SumDropped(
+                run_idx=0,
+                input_manifest_file=str(tmp_path / "input.json"),
+                output_manifest_file=str(output_file),
+                max_workers=max_workers,
+                chunksize=3,
+                worker_io=worker_io,
+            )
+            processor.shard_id, processor.num_shards = shard_id, num_shards
+            processor.process()
+            lines.extend(_read_lines(output_file))
+            dropped += processor.dropped
+        outputs[worker_io] = lines
+        assert dropped == 25
+    assert outputs[True] == outputs[False]
+    assert not list(tmp_path.glob("*.part*"))
+
+
+def test_worker_io_inplace(tmp_path):
+    _write_manifest(tmp_path / "manifest.json", 10)
+    processor = DropOddDuration(
+        input_manifest_file=str(tmp_path / "manifest.json"),
+        output_manifest_file=str(tmp_path / "manifest.json"),
+        max_workers=2,
+        worker_io=True,
+    )
+    processor.process()
+    assert [json.loads(line)["duration"] for line in _read_lines(tmp_path / "manifest.json")] == [0, 4, 8, 12, 16]
+    assert processor.number_of_entries == 5
+    assert processor.telemetry.entries_in == 10
+
+
+class DropOddDurationUnmodified(DropOddDuration):
+    """Same as :class:`DropOddDurationOnly`, but marks the kept entries as unmodified."""
+
+    mark_unmodified = True
+
+    def process_dataset_entry(self, data_entry):
+        if data_entry["duration"] % 2 == 1:
+            return [DataEntry(data=None, metrics=1)]
+        return [DataEntry(data=data_entry, metrics=0, unmodified=self.mark_unmodified)]
+
+
+@pytest.mark.parametrize("streaming,worker_io", [(False, False), (True, False), (False, True)])
+def test_unmodified_pass_through(tmp_path, streaming, worker_io):
+    _write_manifest(tmp_path / "input.json", 50)
+    with open(tmp_path / "input.json", "at", encoding="utf8") as fout:
+        # ascii lines are written as is, the rest are serialized again
+        fout.write(json.dumps({"duration": 100, "text": "текст"}, ensure_ascii=False) + "\n")
+        fout.write('{"duration":102}\n')
+    outputs = {}
+    for mark_unmodified in [False, True]:
+        processor = DropOddDurationUnmodified(
+            input_manifest_file=str(tmp_path / "input.json"),
+            output_manifest_file=str(tmp_path / f"output_{mark_unmodified}.json"),
+            max_workers=2,
+            chunksize=3,
+            streaming=streaming,
+            worker_io=worker_io,
+        )
+        processor.mark_unmodified = mark_unmodified
+        processor.process()
+        outputs[mark_unmodified] = _read_lines(tmp_path / f"output_{mark_unmodified}.json")
+        assert processor.number_of_entries == 27
+        assert processor.total_duration == sum(range(0, 50, 2)) + 202
+    assert outputs[False][:-1] == outputs[True][:-1]
+    assert outputs[False][-1] == '{"duration": 102}\n'
+    assert outputs[True][-1] == '{"duration":102}\n'
+
+
+class DropOddDurationFromText(DropOddDuration):
+    """Drops odd durations, marks multiples of 4 and keeps the rest unmodified, only reading the duration."""
+
+    def process_dataset_entry(self, data_entry):
+        if self.required_fields is not None and list(data_entry) != ["duration"]:
+            raise RuntimeError(f"Unexpected fields: {list(data_entry)}")
+        if data_entry["duration"] % 2 == 1:
+            return [DataEntry(data=None, metrics=1)]
+        if data_entry["duration"] % 4 == 0:
+            data_entry["multiple_of_4"] = True
+            return [DataEntry(data=data_entry, metrics=0)]
+        return [DataEntry(data=data_entry, metrics=0, unmodified=True)]
+
+
+@pytest.mark.parametrize("streaming,worker_io", [(False, False), (True, False), (False, True)])
+def test_required_fields_json_lines(tmp_path, streaming, worker_io):
+    _write_manifest(tmp_path / "input.json", 50)
+    outputs = {}
+    for required_fields in [None, ["duration"]]:
+        processor = DropOddDurationFromText(
+            input_manifest_file=str(tmp_path / "input.json"),
+            output_manifest_file=str(tmp_path / f"output_{required_fields}.json"),
+            max_workers=2,
+            chunksize=3,
+            streaming=streaming,
+            worker_io=worker_io,
+        )
+        processor.required_fields = required_fields
+        processor.process()
+        outputs[required_fields is None] = _read_lines(tmp_path / f"output_{required_fields}.json")
+        assert processor.dropped == 25
+    assert outputs[True] == outputs[False]
+    expected = {"audio_filepath": "4.wav", "duration": 4, "text": "текст 4", "multiple_of_4": True}
+    assert json.loads(outputs[True][2]) == expected
+
+
+@pytest.mark.parametrize("required_fields", [None, ["duration"]])
+def test_pass_through_inplace(tmp_path, required_fields):
+    _write_manifest(tmp_path / "input.json", 50)
+    outputs = {}
+    for in_place in [False, True]:
+        output_file = tmp_path / ("input.json" if in_place else "output.json")
+        processor = DropOddDurationFromText(
+            input_manifest_file=str(tmp_path / "input.json"),
+            output_manifest_file=str(output_file),
+            max_workers=2,
+            chunksize=3,
+            streaming=True,
+        )
+        processor.required_fields = required_fields
+        processor.process()
+        assert processor._pass_through
+        outputs[in_place] = _read_lines(output_file)
+    assert outputs[True] == outputs[False]
+
+
+class RecordPid(BaseParallelProcessor):
+    """Keeps all entries, returning the id of the process that handled them as metrics."""
+
+    sleep_time = 0
+
+    def process_dataset_entry(self, data_entry):
+        time.sleep(self.sleep_time)
+        return [DataEntry(data=data_entry, metrics=os.getpid())]
+
+    def finalize(self, metrics):
+        self.pids = set(metrics)
+
+
+@pytest.mark.parametrize(
+    "execution_mode,sleep_time,expected_inline",
+    [("pool", 0, False), ("inline", 0, True), ("auto", 0, True), ("auto", 0.05, False)],
+)
+def test_execution_mode(tmp_path, execution_mode, sleep_time, expected_inline):
+    with open(tmp_path / "input.json", "wt", encoding="utf8") as fout:
+        for idx in range(12):
+            # sending large entries to the workers takes much longer than doing nothing with them
+            fout.write(json.dumps({"duration": idx, "text": "text " * 100000}) + "\n")
+    processor = RecordPid(
+        input_manifest_file=str(tmp_path / "input.json"),
+        output_manifest_file=str(tmp_path / "output.json"),
+        max_workers=2,
+        chunksize=3,
+        execution_mode=execution_mode,
+    )
+    processor.sleep_time = sleep_time
+    processor.process()
+    assert _read_lines(tmp_path / "output.json") == _read_lines(tmp_path / "input.json")
+    assert (processor.pids == {os.getpid()}) == expected_inline
+
+
+def test_auto_execution_mode_counts_serialization(tmp_path, monkeypatch):
+    def slow_dumps(obj):
+        time.sleep(0.2)
+        return pickle.dumps(obj)
+
+    def slow_loads(data):
+        time.sleep(0.02)
+        return pickle.loads(data)
+
+    # processing a chunk is slower than deserializing it, but faster than serializing and deserializing
+    monkeypatch.setattr(base_processor, "pickle", types.SimpleNamespace(dumps=slow_dumps, loads=slow_loads))
+    _write_manifest(tmp_path / "input.json", 12)
+    processor = RecordPid(
+        input_manifest_file=str(tmp_path / "input.json"),
+        output_manifest_file=str(tmp_path / "output.json"),
+        max_workers=2,
+        chunksize=3,
+        execution_mode="auto",
+    )
+    processor.sleep_time = 0.02
+    processor.process()
+    assert processor.pids == {os.getpid()}
+
+
+def test_execution_mode_validation():
+    with pytest.raises(ValueError, match="Unknown execution_mode"):
+        RecordPid(output_manifest_file="output.json", execution_mode="threads")
+
+
+def test_adaptive_chunker():
+    chunker = AdaptiveChunker(target_chunk_time=1.0, initial_chunksize=10, num_workers=2, num_entries=1000)
+    chunks = chunker.iter_chunks(range(1000))
+    assert len(next(chunks)) == 10
+    chunker.record(10, 0.1)
+    assert len(next(chunks)) == 100
+    # estimate follows the cost of the last chunks
+    chunker.record(100, 4.0)
+    assert len(next(chunks)) == 40
+    chunker.record(40, 0.04)
+    sizes = [len(chunk) for chunk in chunks]
+    assert sum(sizes) == 1000 - 150
+    # chunks get smaller towards the end, leaving at least two chunks per worker
+    assert sizes[:2] == [76, 76] and sizes[-6:] == [3, 2, 1, 1, 1, 1]
+
+
+@pytest.mark.parametrize("execution_mode", ["pool", "inline"])
+def test_target_chunk_time(tmp_path, execution_mode):
+    _write_manifest(tmp_path / "input.json", 40)
+    processor = RecordPid(
+        input_manifest_file=str(tmp_path / "input.json"),
+        output_manifest_file=str(tmp_path / "output.json"),
+        max_workers=2,
+        chunksize=1,
+        execution_mode=execution_mode,
+        target_chunk_time=0.05,
+    )
+    processor.sleep_time = 0.01
+    processor.process()
+    assert _read_lines(tmp_path / "output.json") == _read_lines(tmp_path / "input.json")
+    chunk_sizes = processor.telemetry.chunk_sizes
+    assert sum(chunk_sizes) == 40
+    assert max(chunk_sizes) > 1 and chunk_sizes[-1] == 1
+
+
+@pytest.mark.parametrize("streaming,worker_io", [(False, False), (True, False), (False, True)])
+def test_compressed_manifests(tmp_path, streaming, worker_io):
+    _write_manifest(tmp_path / "input.json", 50)
+    write_manifest(str(tmp_path / "input.json.gz"), load_manifest(str(tmp_path / "input.json")))
+    for input_file, output_file in [("input.json", "output.json"), ("input.json.gz", "output.json.xz")]:
+        processor = DropOddDurationFromText(
+            input_manifest_file=str(tmp_path / input_file),
+            output_manifest_file=str(tmp_path / output_file),
+            max_workers=2,
+            chunksize=3,
+            streaming=streaming,
+            worker_io=worker_io,
+            write_index=True,
+        )
+        processor.required_fields = ["duration"]
+        processor.process()
+        assert processor.dropped == 25
+    with open_file(str(tmp_path / "output.json.xz"), "rt") as fin:
+        assert fin.readlines() == _read_lines(tmp_path / "output.json")
+    assert not (tmp_path / "output.json.xz.idx").exists()
+
+
+def test_compressed_manifests_checkpointing(tmp_path):
+    _write_manifest(tmp_path / "input.json", 10)
+    processor = DropOddDuration(
+        input_manifest_file=str(tmp_path / "input.json"),
+        output_manifest_file=str(tmp_path / "output.json.gz"),
+        checkpoint_every=5,
+    )
+    with pytest.raises(ValueError, match="compressed"):
+        processor.process()
@@ -0,0 +1,77 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+from benchmarks.compare import compare_results
+from benchmarks.config_benchmarks import get_replay_config
+from benchmarks.processor_benchmarks import PROCESSOR_KWARGS, SKIPPED_PROCESSORS, get_registered_processors
+from benchmarks.run_benchmarks import run_benchmarks
+from benchmarks.synthetic_manifest import generate_entries
+
+
+def test_synthetic_manifest():
+    entries = list(generate_entries(100, seed=1, min_duration=2, max_duration=4, pred_error_rate=0))
+    assert entries == list(generate_entries(100, seed=1, min_duration=2, max_duration=4, pred_error_rate=0))
+    assert entries != list(generate_entries(100, seed=2, min_duration=2, max_duration=4, pred_error_rate=0))
+    assert all(2 <= entry["duration"] <= 4 for entry in entries)
+    assert all(entry["pred_text"] == entry["text"] for entry in entries)
+    noisy_entries = generate_entries(100, seed=1, pred_error_rate=0.5)
+    assert sum(entry["pred_text"] != entry["text"] for entry in noisy_entries) > 90
+
+
+def test_all_processors_have_benchmarks():
+    for name in get_registered_processors():
+        assert (name in PROCESSOR_KWARGS) != (name in SKIPPED_PROCESSORS), name
+
+
+def test_replay_config(tmp_path):
+    # multiple outputs of the same manifest and in-place stages have to be preserved
+    cfg, skipped = get_replay_config("spanish_pc/mcv12/config.yaml", "input.json", str(tmp_path))
+    assert skipped == ["CreateInitialManifestMCV", "ASRInference"]
+    assert cfg.processors[0].input_manifest_file == "input.json"
+    inplace_manifest = cfg.processors[5].output_manifest_file
+    for processor_cfg in cfg.processors[6:8]:
+        assert processor_cfg.input_manifest_file == processor_cfg.output_manifest_file == inplace_manifest
+
+    cfg, skipped = get_replay_config("italian/mls/config.yaml", "input.json", str(tmp_path))
+    assert skipped == ["CreateInitialManifestMLS", "RestorePCForMLS", "PCInference", "ASRInference"]
+    assert cfg.processors[0].input_manifest_file == "input.json"
+    # intermediate manifests are not saved unless they are specified in the config
+    assert "input_manifest_file" not in cfg.processors[2]
+    assert "output_manifest_file" not in cfg.processors[2]
+
+
+def test_run_benchmarks():
+    results = run_benchmarks(
+        num_entries=50,
+        processors=["DropHighWER", "WriteManifest", "ASRInference"],
+        configs=["english/slr83/config.yaml"],
+        max_workers=2,
+    )
+    json.dumps(results)
+    assert results["metadata"]["num_entries"] == 50
+    assert set(results["processors"]["DropHighWER"]) == {"serial", "parallel"}
+    assert set(results["processors"]["WriteManifest"]) == {"serial"}
+    assert results["processors"]["WriteManifest"]["serial"]["entries_out"] == 50
+    assert "skipped" in results["processors"]["ASRInference"]
+    config_results = results["configs"]["english/slr83/config.yaml"]
+    assert config_results["skipped_processors"] == ["CreateInitialManifestSLR83", "CustomDataSplitSLR83"]
+    assert config_results["entries_out"] == 50
+    assert set(results["alignment"]) == {"diff_match_patch", "word_alignment"}
+    assert results["alignment"]["word_alignment"]["entries_in"] == 50
+
+    comparison = compare_results(results, results)
+    assert len(comparison) == 6
+    assert not any(item["regression"] for item in comparison)
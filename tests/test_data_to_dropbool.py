@@ -267,3 +267,14 @@ def test_data_to_data(test_class, class_kwargs, test_input, expected_output):
         assert output is None
     else:
         assert output == test_input
+
+
+def test_drop_if_regex_match_metrics():
+    processor = DropIfRegexMatch(regex_patterns=["(\\D ){5,20}", "b", "a"], output_manifest_file=None)
+    output = processor.process_dataset_entry({"text": "a b a"})
+    assert output[0].data is None
+    # only matches of the first matching pattern are counted
+    assert output[0].metrics == {"b": 1}
+    output = processor.process_dataset_entry({"text": "a c d e f"})
+    assert output[0].data is None
+    assert output[0].metrics == {"(\\D ){5,20}": 1}
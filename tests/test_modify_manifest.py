@@ -12,10 +12,34 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from sdp.processors import DropNonAlphabet
+from unittest import mock
+
+from sdp.processors import DropASRError, DropIfSubstringInInsertion, DropNonAlphabet
+from sdp.utils import get_diff
 
 
 def test_empty_test_cases():
     """Testing that empty test cases don't raise an error."""
     processor = DropNonAlphabet("123", output_manifest_file="tmp")
     processor.test()
+
+
+def test_saved_alignment():
+    first = DropASRError(consecutive_words_threshold=3, alignment_key="alignment", output_manifest_file=None)
+    second = DropIfSubstringInInsertion(
+        substrings_in_insertion=["nemo "], alignment_key="alignment", output_manifest_file=None
+    )
+    data_entry = {"text": "i love the toolkit", "pred_text": "i love the nemo toolkit"}
+    output = first.process_dataset_entry(data_entry)[0]
+    assert not output.unmodified
+    alignment = output.data["alignment"]
+
+    with mock.patch.object(get_diff, "_get_diff", side_effect=AssertionError):
+        dropped = second.process_dataset_entry(output.data.copy())[0]
+    assert dropped.data is None
+    assert dropped.metrics == "nemo "
+
+    # alignment is recomputed if the words change
+    output = first.process_dataset_entry({**output.data, "text": "i love the nemo toolkit"})[0]
+    assert output.data["alignment"] != alignment
+    assert second.process_dataset_entry(output.data)[0].data is not None
@@ -0,0 +1,33 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+from sdp.processors.datasets.mls.restore_pc import create_submanifests
+from sdp.utils.manifest_io import write_manifest
+
+
+def test_create_submanifests_from_compressed_manifest(tmp_path):
+    entries = [
+        {"audio_filepath": "/data/audio/10_100_000002.wav", "duration": 2.0},
+        {"audio_filepath": "/data/audio/11_100_000001.wav", "duration": 1.0},
+        {"audio_filepath": "/data/audio/10_100_000001.wav", "duration": 3.0},
+    ]
+    write_manifest(str(tmp_path / "manifest.json.gz"), entries)
+    names = create_submanifests(str(tmp_path / "manifest.json.gz"), str(tmp_path / "submanifests"))
+    assert sorted(names) == ["100_10", "100_11"]
+    with open(tmp_path / "submanifests" / "100_10.json", "rt", encoding="utf8") as fin:
+        assert [json.loads(line) for line in fin] == [entries[2], entries[0]]
+    with open(tmp_path / "submanifests" / "100_11.json", "rt", encoding="utf8") as fin:
+        assert [json.loads(line) for line in fin] == [entries[1]]
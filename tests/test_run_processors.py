@@ -0,0 +1,310 @@
+# Copyright (c) 2023, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import json
+import multiprocessing
+import os
+
+import pytest
+from omegaconf import OmegaConf
+
+from sdp.processors import DropHighLowCharrate, DropHighLowDuration, DuplicateFields, SubRegex
+from sdp.processors.fused_processor import FusedParallelProcessor, fuse_processors
+from sdp.processors.modify_manifest.common import SortManifest
+from sdp.run_processors import run_processors
+
+
+def _write_manifest(path, num_entries):
+    with open(path, "wt", encoding="utf8") as fout:
+        for idx in range(num_entries):
+            entry = {"audio_filepath": f"{idx}.wav", "duration": idx % 7, "text": f"текст номер {idx}"}
+            fout.write(json.dumps(entry) + "\n")
+
+
+def _read_lines(path):
+    with open(path, "rt", encoding="utf8") as fin:
+        return fin.readlines()
+
+
+def _get_config(tmp_path, output_dir, fuse, **kwargs):
+    processors = [
+        {
+            "_target_": "sdp.processors.SubRegex",
+            "input_manifest_file": str(tmp_path / "input.json"),
+            "regex_params_list": [{"pattern": "номер", "repl": "№"}],
+        },
+        {
+            "_target_": "sdp.processors.DropHighLowDuration",
+            "high_duration_threshold": 5,
+            "low_duration_threshold": 1,
+            "output_manifest_file": str(output_dir / "filtered.json"),
+        },
+        {
+            "_target_": "sdp.processors.DuplicateFields",
+            "duplicate_fields": {"text": "orig_text"},
+            "output_manifest_file": str(output_dir / "duplicated.json"),
+        },
+        {
+            "_target_": "sdp.processors.modify_manifest.common.SortManifest",
+            "attribute_sort_by": "duration",
+            "output_manifest_file": str(output_dir / "sorted.json"),
+        },
+        {
+            "_target_": "sdp.processors.SubRegex",
+            "regex_params_list": [{"pattern": "текст", "repl": kwargs.pop("final_repl", "text")}],
+        },
+        {
+            "_target_": "sdp.processors.DuplicateFields",
+            "duplicate_fields": {"text": "final_text"},
+            "output_manifest_file": str(output_dir / "final.json"),
+        },
+    ]
+    for processor_cfg in processors:
+        if processor_cfg["_target_"] != "sdp.processors.modify_manifest.common.SortManifest":
+            processor_cfg["max_workers"] = 2
+    return OmegaConf.create({"processors": processors, "fuse_processors": fuse, **kwargs})
+
+
+def test_fused_outputs_match(tmp_path):
+    _write_manifest(tmp_path / "input.json", 100)
+    for fuse in [False, True]:
+        (tmp_path / str(fuse)).mkdir()
+        run_processors(_get_config(tmp_path, tmp_path / str(fuse), fuse))
+
+    for output_file in ["filtered.json", "duplicated.json", "sorted.json", "final.json"]:
+        assert _read_lines(tmp_path / "True" / output_file) == _read_lines(tmp_path / "False" / output_file)
+
+
+def test_fuse_processors(tmp_path):
+    processors = [
+        SubRegex(
+            regex_params_list=[{"pattern": "a", "repl": "b"}],
+            input_manifest_file="input.json",
+            output_manifest_file="tmp1.json",
+        ),
+        DropHighLowDuration(
+            high_duration_threshold=5,
+            low_duration_threshold=1,
+            input_manifest_file="tmp1.json",
+            output_manifest_file="tmp2.json",
+        ),
+        SortManifest(input_manifest_file="tmp2.json", output_manifest_file="tmp3.json", attribute_sort_by="duration"),
+        DuplicateFields(
+            duplicate_fields={"text": "text2"},
+            input_manifest_file="tmp3.json",
+            output_manifest_file="tmp4.json",
+        ),
+        # reading not from the previous output, so can't be fused
+        DuplicateFields(
+            duplicate_fields={"text": "text3"},
+            input_manifest_file="tmp3.json",
+            output_manifest_file="tmp5.json",
+        ),
+    ]
+    fused = fuse_processors(processors, [False, True, True, False, True])
+    assert len(fused) == 4
+    assert isinstance(fused[0], FusedParallelProcessor)
+    assert fused[0].processors == processors[:2]
+    assert fused[0].materialize == [False, True]
+    assert fused[1:] == processors[2:]
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_fused_metrics(tmp_path, streaming):
+    _write_manifest(tmp_path / "input.json", 30)
+    processors = [
+        SubRegex(
+            regex_params_list=[{"pattern": "номер", "repl": "№"}],
+            input_manifest_file=str(tmp_path / "input.json"),
+            output_manifest_file=str(tmp_path / "tmp.json"),
+            max_workers=2,
+            streaming=streaming,
+        ),
+        DropHighLowDuration(
+            high_duration_threshold=5,
+            low_duration_threshold=1,
+            input_manifest_file=str(tmp_path / "tmp.json"),
+            output_manifest_file=str(tmp_path / "output.json"),
+            max_workers=2,
+            streaming=streaming,
+        ),
+    ]
+    fused = FusedParallelProcessor(processors, materialize=[False, False])
+    fused.process()
+    assert not (tmp_path / "tmp.json").exists()
+    assert processors[0].number_of_entries == 30
+    expected_durations = [idx % 7 for idx in range(30) if 1 <= idx % 7 <= 5]
+    assert processors[1].number_of_entries == fused.number_of_entries == len(expected_durations)
+    assert processors[1].total_duration == sum(expected_durations)
+    lines = _read_lines(tmp_path / "output.json")
+    assert [json.loads(line)["duration"] for line in lines] == expected_durations
+    assert all("№" in json.loads(line)["text"] for line in lines)
+
+
+@pytest.mark.parametrize("last_processor", [SubRegex, DropHighLowCharrate])
+def test_fused_pass_through(tmp_path, last_processor):
+    # lines are not in the json.dumps format, so any entry that is serialized again will be different
+    input_lines = []
+    for idx in range(30):
+        entry = {"audio_filepath": f"{idx}.wav", "duration": idx % 7 + 1, "text": f"text {idx}", "extra": [idx]}
+        input_lines.append(json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n")
+    with open(tmp_path / "input.json", "wt", encoding="utf8") as fout:
+        fout.writelines(input_lines)
+
+    def get_processors(output_dir):
+        if last_processor is SubRegex:
+            last_kwargs = {"regex_params_list": [{"pattern": "text 1", "repl": "one"}]}
+        else:
+            last_kwargs = {"high_charrate_threshold": 3, "low_charrate_threshold": 0}
+        return [
+            DropHighLowDuration(
+                high_duration_threshold=5,
+                low_duration_threshold=2,
+                input_manifest_file=str(tmp_path / "input.json"),
+                output_manifest_file=str(output_dir / "filtered.json"),
+                max_workers=2,
+            ),
+            last_processor(
+                input_manifest_file=str(output_dir / "filtered.json"),
+                output_manifest_file=str(output_dir / "final.json"),
+                max_workers=2,
+                **last_kwargs,
+            ),
+        ]
+
+    for processor in get_processors(tmp_path):
+        processor.process()
+    fused = FusedParallelProcessor(get_processors(tmp_path / "fused"), materialize=[True, True])
+    if last_processor is DropHighLowCharrate:
+        assert fused.required_fields is not None
+    fused.process()
+
+    expected_lines = [line for line in input_lines if 2 <= json.loads(line)["duration"] <= 5]
+    assert _read_lines(tmp_path / "fused" / "filtered.json") == expected_lines
+    assert _read_lines(tmp_path / "fused" / "final.json") == _read_lines(tmp_path / "final.json")
+    if last_processor is DropHighLowCharrate:
+        # entries that are not modified by any of the processors are never serialized again
+        assert set(_read_lines(tmp_path / "fused" / "final.json")) <= set(expected_lines)
+
+
+def test_stage_cache(tmp_path):
+    _write_manifest(tmp_path / "input.json", 50)
+    output_files = [tmp_path / "filtered.json", tmp_path / "sorted.json", tmp_path / "final.json"]
+
+    def run(**kwargs):
+        run_processors(_get_config(tmp_path, tmp_path, fuse=True, use_stage_cache=True, **kwargs))
+        return [os.stat(output_file).st_mtime_ns for output_file in output_files]
+
+    first_run = run()
+    assert run() == first_run
+
+    # only the last 2 processors are re-run
+    changed_run = run(final_repl="TEXT")
+    assert changed_run[:2] == first_run[:2]
+    assert changed_run[2] != first_run[2]
+    assert "TEXT" in _read_lines(tmp_path / "final.json")[0]
+
+    # removing the output or changing the input re-runs the processors
+    os.remove(tmp_path / "sorted.json")
+    removed_run = run(final_repl="TEXT")
+    assert removed_run[0] == first_run[0]
+    assert removed_run[1:] != changed_run[1:]
+
+    _write_manifest(tmp_path / "input.json", 30)
+    new_input_run = run(final_repl="TEXT")
+    assert all(new != old for new, old in zip(new_input_run, removed_run))
+    assert len(_read_lines(tmp_path / "final.json")) < 50
+
+
+def _run_shard(cfg):
+    run_processors(OmegaConf.create(cfg))
+
+
+def test_sharded_run(tmp_path):
+    _write_manifest(tmp_path / "input.json", 100)
+    (tmp_path / "reference").mkdir()
+    run_processors(_get_config(tmp_path, tmp_path / "reference", fuse=True))
+
+    # separate processes stand in for separate nodes
+    output_dir = tmp_path / "sharded"
+    output_dir.mkdir()
+    shard_processes = []
+    for shard_id in range(3):
+        cfg = OmegaConf.to_container(_get_config(tmp_path, output_dir, fuse=True, shard_id=shard_id, num_shards=3))
+        shard_processes.append(multiprocessing.Process(target=_run_shard, args=(cfg,)))
+        shard_processes[-1].start()
+    for shard_process in shard_processes:
+        shard_process.join()
+        assert shard_process.exitcode == 0
+
+    # processors up to the SortManifest barrier were run on the shards
+    assert len(glob.glob(str(output_dir / "filtered.json.shard*-of-3"))) == 3
+    assert not (output_dir / "sorted.json").exists()
+
+    run_processors(_get_config(tmp_path, output_dir, fuse=True, num_shards=3, merge_shards=True))
+    for output_file in ["filtered.json", "duplicated.json", "sorted.json", "final.json"]:
+        assert _read_lines(output_dir / output_file) == _read_lines(tmp_path / "reference" / output_file)
+    assert sorted(os.listdir(output_dir)) == ["duplicated.json", "filtered.json", "final.json", "sorted.json"]
+
+
+def test_telemetry_report(tmp_path):
+    _write_manifest(tmp_path / "input.json", 100)
+    run_processors(_get_config(tmp_path, tmp_path, fuse=True, telemetry_file=str(tmp_path / "telemetry.json")))
+    with open(tmp_path / "telemetry.json", "rt", encoding="utf8") as fin:
+        report = json.load(fin)
+
+    assert [processor_report["processor"] for processor_report in report["processors"]] == [
+        "FusedParallelProcessor",
+        "SortManifest",
+        "FusedParallelProcessor",
+    ]
+    fused_report = report["processors"][0]
+    num_kept = sum(1 <= idx % 7 <= 5 for idx in range(100))
+    assert fused_report["entries_in"] == 100
+    assert fused_report["entries_out"] == num_kept
+    assert [stage["entries_out"] for stage in fused_report["stages"]] == [100, num_kept, num_kept]
+    assert fused_report["hours_in"] == sum(idx % 7 for idx in range(100)) / 3600
+    assert set(fused_report["timings"]) == {"prepare", "read_manifest", "parallel_map", "write", "finalize"}
+    assert sum(fused_report["timings"].values()) <= fused_report["wall_time"]
+    assert fused_report["bytes_read"] == os.path.getsize(tmp_path / "input.json")
+    assert fused_report["bytes_written"] == os.path.getsize(tmp_path / "filtered.json") + os.path.getsize(
+        tmp_path / "duplicated.json"
+    )
+    assert fused_report["workers_peak_rss"] > 0
+    assert fused_report["chunks"]["num_chunks"] == 1 and fused_report["chunks"]["max_size"] == 100
+    assert report["wall_time"] >= sum(processor_report["wall_time"] for processor_report in report["processors"])
+
+
+@pytest.mark.parametrize("intermediate_format", ["columnar", "jsonl.gz", "jsonl.xz"])
+def test_intermediate_format(tmp_path, intermediate_format):
+    _write_manifest(tmp_path / "input.json", 100)
+    for output_format in ["jsonl", intermediate_format]:
+        (tmp_path / output_format).mkdir()
+        output_dir = tmp_path / output_format
+        run_processors(_get_config(tmp_path, output_dir, fuse=False, intermediate_format=output_format))
+
+    for output_file in ["filtered.json", "duplicated.json", "sorted.json", "final.json"]:
+        expected_lines = _read_lines(tmp_path / "jsonl" / output_file)
+        assert _read_lines(tmp_path / intermediate_format / output_file) == expected_lines
+
+
+def test_sort_manifest_with_index(tmp_path):
+    _write_manifest(tmp_path / "input.json", 100)
+    for descending in [False, True]:
+        output_file = tmp_path / f"sorted_{descending}.json"
+        SortManifest(str(output_file), str(tmp_path / "input.json"), "duration", descending).process()
+        entries = [json.loads(line) for line in _read_lines(tmp_path / "input.json")]
+        expected = sorted(entries, key=lambda entry: entry["duration"], reverse=descending)
+        assert [json.loads(line) for line in _read_lines(output_file)] == expected
@@ -12,9 +12,49 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import math
+import os
+import random
+import re
+
 import pytest
 
 from sdp.utils.edit_spaces import add_start_end_spaces, remove_extra_spaces
+from sdp.utils.get_diff import get_diff_with_diff_match_patch
+from sdp.utils.columnar import convert_manifest, is_columnar, merge_columnar_manifests
+from sdp.utils.compression import open_file
+from sdp.utils.manifest_index import IndexedManifest, build_index, load_index
+from sdp.utils.manifest_io import (
+    CODECS,
+    ManifestWriter,
+    count_manifest_entries,
+    extract_fields,
+    get_codec,
+    iter_lines_in_range,
+    iter_manifest,
+    load_manifest,
+    merge_fields,
+    write_manifest,
+)
+from sdp.utils.metrics_computation import get_cer, get_wer, is_cer_above, is_wer_above
+from sdp.utils.regex_utils import RegexMatcher, RegexSubstitutions
+from sdp.utils.sharding import get_shard_file, merge_shard_files
+from sdp.utils.word_alignment import get_word_diff
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MANIFEST_ENTRIES = [
+    {"audio_filepath": "a.wav", "duration": 1.5, "text": "hello world"},
+    {"text": "привет, 世界 😀", "pred_text": "tab\tquote\"backslash\\", "empty": ""},
+    {"duration": 0.1 + 0.2, "big": 2**70 + 1, "small": -(2**63) - 1, "negative": -0.0, "exp": 1e-300},
+    {"values": [True, False, None, 1, 1.0, -1e10]},
+    {"nested": {"list": [1, [2, {"3": 4}]], "unicode_key_ключ": "\u2028\x00"}},
+]
+AVAILABLE_CODECS = [name for name in CODECS if name != "orjson" or orjson is not None]
 
 
 @pytest.mark.parametrize("input,expected_output", [("abc xyz   abc xyz", "abc xyz abc xyz"), (" abc xyz ", "abc xyz")])
@@ -25,3 +65,283 @@ def test_remove_extra_spaces(input, expected_output):
 @pytest.mark.parametrize("input,expected_output", [("abc", " abc "), ("abc xyz", " abc xyz ")])
 def test_add_start_end_spaces(input, expected_output):
     assert add_start_end_spaces(input) == expected_output
+
+
+@pytest.mark.parametrize("codec_name", AVAILABLE_CODECS)
+@pytest.mark.parametrize("entry", MANIFEST_ENTRIES)
+def test_json_codec_matches_stdlib(codec_name, entry):
+    codec = get_codec(codec_name)
+    assert codec.dumps(entry) == json.dumps(entry)
+    assert codec.dumps(entry, ensure_ascii=False) == json.dumps(entry, ensure_ascii=False)
+    line = json.dumps(entry) + "\n"
+    assert codec.loads(line) == json.loads(line)
+    assert codec.loads(line.encode()) == json.loads(line)
+    non_ascii_line = json.dumps(entry, ensure_ascii=False).encode()
+    assert codec.loads(non_ascii_line) == json.loads(non_ascii_line)
+
+
+@pytest.mark.parametrize("codec_name", AVAILABLE_CODECS)
+def test_json_codec_fallback(codec_name):
+    codec = get_codec(codec_name)
+    assert math.isnan(codec.loads(b'{"duration": NaN}')["duration"])
+    assert codec.loads(b'{"count": 123456789012345678901234567890}')["count"] == 123456789012345678901234567890
+    with pytest.raises(json.JSONDecodeError):
+        codec.loads(b'{"text": ')
+
+
+def test_manifest_writer(tmp_path):
+    entries = MANIFEST_ENTRIES * 3
+    with open(tmp_path / "reference.json", "wt", encoding="utf8") as fout:
+        for entry in entries:
+            json.dump(entry, fout)
+            fout.write("\n")
+
+    with open(tmp_path / "manifest.json", "wt", encoding="utf8") as fout:
+        writer = ManifestWriter(fout, batch_size=5)
+        writer.write_all(entries)
+        assert len(writer._lines) == len(entries) % 5
+        writer.flush()
+
+    assert (tmp_path / "manifest.json").read_bytes() == (tmp_path / "reference.json").read_bytes()
+    assert list(iter_manifest(str(tmp_path / "manifest.json"))) == entries
+
+
+@pytest.mark.parametrize(
+    "line",
+    [json.dumps(entry) for entry in MANIFEST_ENTRIES]
+    + [
+        '{"text": "a \\"duration\\": 2, \\"text\\": \\"b\\"", "duration": 1}',
+        '{"text": "{\\"duration\\": 2}", "duration": 1}',
+        '{"meta": {"duration": 2}, "duration": 1}',
+        '{"duration":1,"text":"compact"}',
+        '{"duration": 1, "duration": 2}',
+        '{"a\\" ": 1, "text": "duration"}',
+    ],
+)
+def test_extract_fields(line):
+    fields = ["duration", "text", "nested", "missing"]
+    entry = json.loads(line)
+    expected = {field: entry[field] for field in fields if field in entry}
+    assert extract_fields(line, fields) == expected
+    assert extract_fields(line.encode("utf8"), fields) == expected
+
+    data = {field: value for field, value in expected.items() if field != "text"}
+    data["new"] = 1
+    merged = merge_fields(data, line, fields)
+    assert merged == {**{key: value for key, value in entry.items() if key != "text"}, "new": 1}
+    assert list(merged)[-1] == "new"
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_manifest_writer_write_line(tmp_path, ensure_ascii):
+    lines = [json.dumps(entry, ensure_ascii=False).encode("utf8") + b"\n" for entry in MANIFEST_ENTRIES]
+    with open(tmp_path / "manifest.json", "wt", encoding="utf8") as fout:
+        with ManifestWriter(fout, batch_size=2, ensure_ascii=ensure_ascii) as writer:
+            for line in lines:
+                writer.write_line(line)
+            # last line of the file might not have a newline
+            writer.write_line(lines[0][:-1])
+
+    entries = MANIFEST_ENTRIES + MANIFEST_ENTRIES[:1]
+    expected = [json.dumps(entry, ensure_ascii=ensure_ascii) + "\n" for entry in entries]
+    assert (tmp_path / "manifest.json").read_text(encoding="utf8") == "".join(expected)
+
+
+def test_columnar_manifest_conversion(tmp_path):
+    entries = [{"audio_filepath": "a.wav", "duration": 1.5}, {"text": "текст", "duration": 2}, {}]
+    write_manifest(str(tmp_path / "manifest.json"), entries)
+    convert_manifest(str(tmp_path / "manifest.json"), str(tmp_path / "manifest.columns"))
+    assert count_manifest_entries(str(tmp_path / "manifest.columns")) == 3
+    # columns are ordered by their first appearance
+    assert load_manifest(str(tmp_path / "manifest.columns")) == [
+        {"audio_filepath": "a.wav", "duration": 1.5},
+        {"duration": 2, "text": "текст"},
+        {},
+    ]
+    assert load_manifest(str(tmp_path / "manifest.columns"), fields=["duration"]) == [
+        {"duration": 1.5},
+        {"duration": 2},
+        {},
+    ]
+
+    convert_manifest(str(tmp_path / "manifest.columns"), str(tmp_path / "converted.json"))
+    assert load_manifest(str(tmp_path / "converted.json")) == load_manifest(str(tmp_path / "manifest.columns"))
+
+
+def test_merge_columnar_manifests(tmp_path):
+    write_manifest(str(tmp_path / "first.columns"), [{"a": 1}, {"a": 2, "b": [3]}])
+    write_manifest(str(tmp_path / "second.columns"), [{"c": None}, {"b": "4"}])
+    shards = [str(tmp_path / "first.columns"), str(tmp_path / "second.columns")]
+    merge_columnar_manifests(shards, str(tmp_path / "merged.columns"))
+    assert load_manifest(str(tmp_path / "merged.columns")) == [{"a": 1}, {"a": 2, "b": [3]}, {"c": None}, {"b": "4"}]
+
+
+def test_columnar_manifest_overwrite(tmp_path):
+    manifest_file = str(tmp_path / "manifest.columns")
+    write_manifest(manifest_file, [{"a": 1}, {"a": 2}])
+    write_manifest(manifest_file, [{"b": 3}])
+    assert load_manifest(manifest_file) == [{"b": 3}]
+    assert sorted(os.listdir(tmp_path)) == ["manifest.columns"]
+
+    # folders without the suffix are columnar only if they have a schema
+    os.rename(manifest_file, tmp_path / "renamed")
+    assert is_columnar(str(tmp_path / "renamed"))
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "audio.wav").write_bytes(b"")
+    assert not is_columnar(str(tmp_path / "data"))
+    with pytest.raises(OSError):
+        write_manifest(str(tmp_path / "data"), [{"a": 1}])
+    assert os.listdir(tmp_path / "data") == ["audio.wav"]
+
+
+@pytest.mark.parametrize("suffix", [".gz", ".xz", ".zst"])
+def test_compressed_manifests(tmp_path, suffix):
+    if suffix == ".zst":
+        pytest.importorskip("zstandard")
+    manifest_file = str(tmp_path / f"manifest.json{suffix}")
+    entries = MANIFEST_ENTRIES * 3
+    write_manifest(manifest_file, entries, write_index=True)
+    with open_file(manifest_file, "rt") as fin:
+        assert fin.read() == "".join(json.dumps(entry) + "\n" for entry in entries)
+    assert not os.path.exists(manifest_file + ".idx")
+    assert load_manifest(manifest_file, start=4, end=7) == entries[4:7]
+    assert count_manifest_entries(manifest_file) == len(entries)
+    with pytest.raises(ValueError, match="random access"):
+        IndexedManifest(manifest_file)
+
+    # compressed shards are merged without decompressing them
+    for shard_id in range(3):
+        write_manifest(get_shard_file(manifest_file, shard_id, 3), MANIFEST_ENTRIES)
+    merge_shard_files(manifest_file, 3)
+    assert load_manifest(manifest_file) == entries
+    assert sorted(os.listdir(tmp_path)) == [f"manifest.json{suffix}"]
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_manifest_index(tmp_path, ensure_ascii):
+    manifest_file = str(tmp_path / "manifest.json")
+    entries = [{"idx": idx, "text": "текст " * idx} for idx in range(20)]
+    write_manifest(manifest_file, entries, ensure_ascii=ensure_ascii, write_index=True)
+    # offsets tracked while writing are the same as the ones found by scanning
+    assert load_index(manifest_file) == build_index(manifest_file)
+    assert count_manifest_entries(manifest_file, scan=False) == 20
+    assert load_manifest(manifest_file, start=5, end=8) == entries[5:8]
+
+    with IndexedManifest(manifest_file) as manifest:
+        assert len(manifest) == 20
+        assert manifest[3] == entries[3]
+        assert manifest[-1] == entries[-1]
+        assert manifest[17:] == entries[17:]
+        assert manifest[::7] == entries[::7]
+        sample = manifest.sample(5, seed=1)
+        assert len(sample) == 5 and sample == sorted(sample, key=lambda entry: entry["idx"])
+
+    # index is ignored after the manifest is changed
+    with open(manifest_file, "at", encoding="utf8") as fout:
+        fout.write(json.dumps({"idx": 20}) + "\n")
+    assert load_index(manifest_file) is None
+    assert count_manifest_entries(manifest_file, scan=False) is None
+    assert count_manifest_entries(manifest_file) == 21
+    assert load_manifest(manifest_file, start=19) == [entries[19], {"idx": 20}]
+
+
+def test_iter_lines_in_range(tmp_path):
+    lines = [f"line {idx} {'x' * idx}\n".encode() for idx in range(30)]
+    with open(tmp_path / "file.txt", "wb") as fout:
+        fout.write(b"".join(lines))
+    size = sum(len(line) for line in lines)
+    for num_ranges in [1, 3, 7, size]:
+        offsets = [size * idx // num_ranges for idx in range(num_ranges + 1)]
+        read_lines = []
+        with open(tmp_path / "file.txt", "rb") as fin:
+            for start_offset, end_offset in zip(offsets[:-1], offsets[1:]):
+                read_lines.extend(iter_lines_in_range(fin, start_offset, end_offset))
+        assert read_lines == lines
+
+
+@pytest.mark.parametrize(
+    "regex_params_list",
+    [
+        [{"pattern": "[öō]", "repl": "o"}, {"pattern": "[\\$\\&\\(\\)]", "repl": " "}, {"pattern": "o", "repl": ""}],
+        [{"pattern": "a", "repl": "b"}, {"pattern": "b", "repl": "a"}, {"pattern": "[ab]", "repl": "ab"}],
+        [
+            {"pattern": "[a-c]", "repl": "a"},
+            {"pattern": "a", "repl": "x", "count": 1},
+            {"pattern": "(?i)X", "repl": "y"},
+        ],
+        [
+            {"pattern": "\\.", "repl": " . "},
+            {"pattern": "(\\.\\s+){2,20}", "repl": "."},
+            {"pattern": " (\\w+)¿ ", "repl": " ¿\\1 "},
+        ],
+    ],
+)
+def test_regex_substitutions(regex_params_list):
+    substitutions = RegexSubstitutions(regex_params_list)
+    for text in [" öbc (ōa) ", " abc. ..  . hola¿ ", " xyz ", " ", " baab ba$ "]:
+        expected_text, expected_patterns = text, []
+        for params in regex_params_list:
+            new_text = re.sub(params["pattern"], params["repl"], expected_text, params.get("count", 0))
+            if new_text != expected_text:
+                expected_patterns.append(params["pattern"])
+            expected_text = new_text
+        assert substitutions(text) == (expected_text, expected_patterns)
+
+
+@pytest.mark.parametrize(
+    "patterns",
+    [
+        ["librivox", " grabado por ", "\\.\\.\\.\\."],
+        ["(\\D ){5,20}", "^\\s\\d", "^\\s*$", ""],
+        ["(?i)AB", "(a)\\1", "ab?c", "(?:xy){1,2}z", "a(?=b)c", "(?i:a)b"],
+    ],
+)
+def test_regex_matcher(patterns):
+    matcher = RegexMatcher(patterns)
+    for text in [" ", "", " 1 a b c d e ", "librivox ....", "aac abc xyxyz", " aB Ab "]:
+        expected = next((idx for idx, pattern in enumerate(patterns) if re.search(pattern, text)), None)
+        assert matcher.first_match(text) == expected
+        assert matcher.matches_any(text) == (expected is not None)
+
+
+@pytest.mark.parametrize(
+    "orig_words,pred_words",
+    [
+        ("", ""),
+        ("", "a b"),
+        ("a b", ""),
+        ("a b c", "a b c"),
+        ("a a a b", "a b a a"),
+        ("the cat sat on the mat", "a cat sat on the the mat"),
+        ("ab abc", "abc ab"),
+        ("ünï 日本 語", "日本 ünï 語 語"),
+    ],
+)
+def test_word_diff_matches_diff_match_patch(orig_words, pred_words):
+    assert get_word_diff(orig_words, pred_words) == list(get_diff_with_diff_match_patch(orig_words, pred_words))
+
+
+def test_word_diff_random_texts():
+    rng = random.Random(0)
+    for _ in range(1000):
+        vocabulary = ["a", "b", "ab", "c", "ünï"][: rng.randint(1, 5)]
+        orig_words = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(0, 20)))
+        pred_words = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(0, 20)))
+        assert get_word_diff(orig_words, pred_words) == list(get_diff_with_diff_match_patch(orig_words, pred_words))
+
+
+def test_is_cer_wer_above():
+    rng = random.Random(0)
+    for length in [1, 10, 100, 1500]:
+        for _ in range(20):
+            text = "".join(rng.choice("ab c") for _ in range(length))
+            pred_text = "".join(char if rng.random() > 0.2 else rng.choice("ab c") for char in text)
+            pred_text = pred_text[: rng.randint(0, len(pred_text))] if rng.random() < 0.2 else pred_text
+            # thresholds right at the possible values of the rates to check the rounding
+            cer = get_cer(text, pred_text)
+            for threshold in [-1, 0, 0.5, 20, 100, 1000, cer, cer - 0.01, cer + 0.01]:
+                assert is_cer_above(text, pred_text, threshold) == (cer > threshold)
+            if text.split():
+                wer = get_wer(text, pred_text)
+                for threshold in [-1, 0, 0.5, 20, 100, 1000, wer, wer - 0.01, wer + 0.01]:
+                    assert is_wer_above(text, pred_text, threshold) == (wer > threshold)